@@ -0,0 +1,55 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """
+    Отдельная тестовая БД (как у manage.py test) на время замера:
+    рабочие данные не трогаем, после замера база удаляется.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Перцентили по ближайшему рангу: {"p50": ..., "p95": ...}."""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    return {f"p{p}": ordered[max(0, round(len(ordered) * p / 100) - 1)] for p in points}
+
+
+def measure(fn, iterations):
+    """Вызывает fn(i) iterations раз; возвращает пропускную способность и перцентили."""
+    durations = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        durations.append(time.perf_counter() - t0)
+    total = time.perf_counter() - started
+    points = percentiles(durations, (95,))
+    return {
+        "iterations": iterations,
+        "seconds": round(total, 3),
+        "per_second": round(iterations / total, 1) if total else 0.0,
+        "p50_ms": round(statistics.median(durations) * 1000, 2) if durations else 0.0,
+        "p95_ms": round(points["p95"] * 1000, 2),
+    }
+
+
+def format_row(label, result):
+    return (
+        f"{label:<12} {result['iterations']:>7} запр. {result['seconds']:>8} с "
+        f"{result['per_second']:>9} запр/с  p50 {result['p50_ms']} мс  p95 {result['p95_ms']} мс"
+    )
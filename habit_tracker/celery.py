@@ -12,3 +12,9 @@ app.autodiscover_tasks()
 # Таймзона — работаем по Москве, хранение можно оставить в UTC
 app.conf.timezone = settings.TIME_ZONE  # "Europe/Moscow" из .env
 app.conf.enable_utc = True
+
+if settings.DEBUG:
+    # в dev пишем warning, если задача сделала больше SQL-запросов, чем её query_budget
+    from habit_tracker.querybudget import install_task_hooks
+
+    install_task_hooks()
@@ -1,7 +1,72 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class HabitPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class HabitCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по id: без COUNT(*) и OFFSET,
+    любая страница стоит одинаково, сколько бы их ни было до неё.
+    """
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = 'id'
+
+
+class SwitchableHabitPagination(HabitPagination):
+    """
+    Номера страниц по умолчанию (формат для старых клиентов) или курсор.
+
+    Курсор включается параметром ?pagination=cursor, самим ?cursor=...
+    (ссылки next/previous) или атрибутом view `pagination_mode = "cursor"`.
+    ?pagination=page возвращает номера страниц и для курсорных view.
+    """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def wants_cursor(self, request, view):
+        mode = request.query_params.get(self.mode_query_param)
+        if mode is None and HabitCursorPagination.cursor_query_param in request.query_params:
+            mode = 'cursor'
+        if mode is None:
+            mode = getattr(view, 'pagination_mode', 'page')
+        return mode == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.wants_cursor(request, view):
+            self.cursor_paginator = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = HabitCursorPagination()
+        page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.cursor_paginator.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters += HabitCursorPagination().get_schema_operation_parameters(view)[:1]
+        parameters.append({
+            'name': self.mode_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'page (по умолчанию) или cursor',
+            'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+        })
+        return parameters
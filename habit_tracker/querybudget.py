@@ -0,0 +1,160 @@
+import logging
+import time
+from contextlib import ContextDecorator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget(ContextDecorator):
+    """
+    Считает SQL-запросы внутри блока (через connection.execute_wrapper)
+    и сообщает, если их больше бюджета.
+
+        with QueryBudget(3, "habits.list"):
+            ...
+
+        @QueryBudget(5, "send_due_habits", strict=True)
+        def task(): ...
+
+    strict=True — бросает QueryBudgetExceeded (для тестов), иначе пишет warning.
+    """
+
+    def __init__(self, limit, label="", strict=False):
+        self.limit = limit
+        self.label = label
+        self.strict = strict
+        self.queries = []
+
+    def __call__(self, func):
+        # каждый вызов декорированной функции — свой счётчик
+        decorated = super().__call__(func)
+        self.label = self.label or func.__qualname__
+        return decorated
+
+    def _recreate_cm(self):
+        return type(self)(self.limit, self.label, self.strict)
+
+    def _record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def exceeded(self):
+        return self.limit is not None and self.count > self.limit
+
+    def __enter__(self):
+        self.queries = []
+        self._wrapper = connection.execute_wrapper(self._record)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrapper.__exit__(exc_type, exc, tb)
+        if exc_type is None and self.exceeded:
+            self.report()
+        return False
+
+    def report(self):
+        message = f"{self.label or 'блок'}: {self.count} SQL-запросов при бюджете {self.limit}"
+        details = "\n".join(f"  {duration * 1000:.1f} мс  {sql}" for sql, duration in self.queries)
+        if self.strict:
+            raise QueryBudgetExceeded(f"{message}\n{details}")
+        logger.warning("%s\n%s", message, details)
+
+
+def view_budget(view_func, request):
+    """
+    Бюджет view: атрибут query_budget (число) или query_budgets ({action: число})
+    у класса view; иначе QUERY_BUDGET_DEFAULT.
+    """
+    cls = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+    budgets = getattr(cls, "query_budgets", None) or {}
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(request.method.lower())
+    if action in budgets:
+        return budgets[action], f"{cls.__name__}.{action}"
+    budget = getattr(cls, "query_budget", None)
+    name = getattr(cls, "__name__", getattr(view_func, "__name__", "view"))
+    return (budget if budget is not None else settings.QUERY_BUDGET_DEFAULT), name
+
+
+class QueryBudgetMiddleware:
+    """
+    В DEBUG считает запросы каждого HTTP-запроса, кладёт их число в
+    X-Query-Count и пишет warning, если путь вышел за свой бюджет.
+    В проде не подключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        budget = request.query_budget = QueryBudget(None, request.path)
+        with budget:
+            response = self.get_response(request)
+        response["X-Query-Count"] = str(budget.count)
+        return response
+
+    async def __acall__(self, request):
+        budget = request.query_budget = QueryBudget(None, request.path)
+        # счётчик — на соединении потока, где async ORM выполняет запросы этого запроса
+        await sync_to_async(budget.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(budget.__exit__)(None, None, None)
+        response["X-Query-Count"] = str(budget.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = request.query_budget
+        budget.limit, name = view_budget(view_func, request)
+        budget.label = f"{request.method} {request.path} ({name})"
+
+
+def install_task_hooks():
+    """
+    То же для Celery-задач: бюджет — атрибут задачи query_budget
+    (по умолчанию QUERY_BUDGET_DEFAULT). Подключать только в DEBUG.
+    """
+    from celery.signals import task_postrun, task_prerun
+
+    active = {}
+
+    @task_prerun.connect(weak=False)
+    def start(task_id=None, task=None, **kwargs):
+        limit = getattr(task, "query_budget", None)
+        budget = QueryBudget(settings.QUERY_BUDGET_DEFAULT if limit is None else limit, task.name)
+        active[task_id] = budget.__enter__()
+
+    @task_postrun.connect(weak=False)
+    def finish(task_id=None, **kwargs):
+        budget = active.pop(task_id, None)
+        if budget is not None:
+            budget.__exit__(None, None, None)
@@ -7,6 +7,20 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))  # секунды на запрос
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "16"))  # параллельных отправок и соединений в пуле
+# Лимиты Bot API: ~30 сообщений/с на бота и ~1/с в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5"))  # попыток после 429
+TELEGRAM_MAX_RETRY_WAIT = float(os.getenv("TELEGRAM_MAX_RETRY_WAIT", "60"))  # дольше ждать retry_after не будем
+# Приём обновлений (runner.py --ingest): long polling getUpdates
+TELEGRAM_POLL_TIMEOUT = int(os.getenv("TELEGRAM_POLL_TIMEOUT", "25"))  # сколько Telegram держит запрос без обновлений
+TELEGRAM_UPDATES_LIMIT = int(os.getenv("TELEGRAM_UPDATES_LIMIT", "100"))  # обновлений за запрос (максимум Bot API — 100)
+# Привязка чата через https://t.me/<бот>?start=<токен>: имя бота и срок жизни токена, секунды
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "")
+TELEGRAM_LINK_MAX_AGE = int(os.getenv("TELEGRAM_LINK_MAX_AGE", "86400"))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы total покрывал весь стек; подключается при SERVER_TIMING_SAMPLE_RATE > 0
+    "habit_tracker.timing.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",   # ← должно быть до CommonMiddleware
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -50,6 +66,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # только в DEBUG: число SQL-запросов в X-Query-Count и warning при превышении бюджета
+    "habit_tracker.querybudget.QueryBudgetMiddleware",
 ]
 
 
@@ -82,10 +100,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # параллельные воркеры рассылки ждут блокировку записи, а не падают с "database is locked"
+        'OPTIONS': {'timeout': 20},
+        # тестовая база — файл, а не общая память: в памяти SQLite блокирует таблицы
+        # без ожидания, и тест параллельных воркеров ловил бы "database table is locked"
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# Redis в проде (общий для всех процессов и воркеров), locmem по умолчанию и в тестах
+CACHE_URL = os.getenv("CACHE_URL")
+CACHES = {
+    "default": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL}
+        if CACHE_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -141,22 +176,72 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication с пользователями из кэша процесса
+        'users.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # как стандартные, но с фазой render в Server-Timing
+        'habit_tracker.timing.TimedJSONRenderer',
+        'habit_tracker.timing.TimedBrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'habit_tracker.pagination.HabitPagination',
     'PAGE_SIZE': 5
 }
 
+# Максимум операций в одном запросе к /api/habits/bulk/
+HABITS_BULK_MAX_OPERATIONS = int(os.getenv("HABITS_BULK_MAX_OPERATIONS", "500"))
+# Доля запросов с замером фаз (заголовок Server-Timing + строка лога habit_tracker.timing):
+# 0 — выключено, 1 — каждый запрос; в проде достаточно 0.01
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv("SERVER_TIMING_SAMPLE_RATE", "0"))
+# Бюджет SQL-запросов на запрос/задачу по умолчанию (если у view/задачи нет своего)
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "10"))
+# Сколько секунд живут страницы публичной ленты в кэше; 0 — без кэша
+PUBLIC_FEED_CACHE_TTL = int(os.getenv("PUBLIC_FEED_CACHE_TTL", "30"))
+# Чтение привычек (list/retrieve/публичная лента) по основным адресам — async-view
+# (под ASGI без потока на запрос); под /api/async/... они доступны всегда
+HABITS_ASYNC_READS = os.getenv("HABITS_ASYNC_READS", "False") == "True"
+# Сколько хранить в кэше статистику /api/habits/stats/, секунды (сбрасывается
+# и раньше — с любой отметкой или правкой привычек пользователя)
+HABIT_STATS_CACHE_TTL = int(os.getenv("HABIT_STATS_CACHE_TTL", "3600"))
+
+# Кэш пользователей JWT-аутентификации в памяти процесса: сколько записей
+# и сколько секунд живёт запись (0 — без кэша, пользователь из БД на каждый запрос)
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 CELERY_TIMEZONE = TIME_ZONE  # если у тебя уже стоит TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # safety
+# Токен для /api/notifications/metrics/ (Authorization: Bearer ...); пусто — без проверки
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# На сколько шардов (по user_id) делить минутную рассылку; 1 — всё в одной задаче
+REMINDER_SHARDS = int(os.getenv("REMINDER_SHARDS", "1"))
+# Напоминания одного чата за окно уходят одним сообщением; больше привычек — частями
+REMINDER_DIGEST_MAX_HABITS = int(os.getenv("REMINDER_DIGEST_MAX_HABITS", "10"))
+# Сколько дней хранить журнал доставки напоминаний (защита от дублей)
+REMINDER_LEDGER_RETENTION_DAYS = int(os.getenv("REMINDER_LEDGER_RETENTION_DAYS", "7"))
+# Повторы неудачных напоминаний: задержка base·2^(n-1) с джиттером, не больше max (секунды)
+REMINDER_RETRY_BASE_DELAY = int(os.getenv("REMINDER_RETRY_BASE_DELAY", "30"))
+REMINDER_RETRY_MAX_DELAY = int(os.getenv("REMINDER_RETRY_MAX_DELAY", "900"))
+# После стольких попыток напоминание уходит в недоставленные
+REMINDER_RETRY_MAX_ATTEMPTS = int(os.getenv("REMINDER_RETRY_MAX_ATTEMPTS", "6"))
+# Напоминание старше слота на столько секунд уже неактуально — не повторяем
+REMINDER_RETRY_MAX_AGE = int(os.getenv("REMINDER_RETRY_MAX_AGE", "3600"))
 CELERY_BEAT_SCHEDULE = {
     "send-due-habits-every-minute": {
         "task": "notifications.tasks.send_due_habits",
         "schedule": crontab(),  # каждую минуту
     },
+    "process-reminder-retries": {
+        "task": "notifications.tasks.process_reminder_retries",
+        "schedule": 30.0,  # каждые 30 секунд
+    },
+    "prune-reminder-deliveries-daily": {
+        "task": "notifications.tasks.prune_reminder_deliveries",
+        "schedule": crontab(hour=4, minute=0),
+    },
 }
 
 SWAGGER_SETTINGS = {
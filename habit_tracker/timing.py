@@ -0,0 +1,208 @@
+import logging
+import random
+import time
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Порядок фаз в заголовке и логе
+PHASES = ("auth", "perm", "query", "serialize", "render")
+
+
+class RequestTimer:
+    """Накопитель длительностей фаз одного запроса (секунды)."""
+
+    def __init__(self):
+        self.durations = {}
+        self.db_time = 0.0
+        self.db_queries = 0
+        self._active = set()
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        # вложенная фаза с тем же именем (BrowsableAPI рендерит JSON внутри) не считается дважды
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active.discard(name)
+            self.add(name, time.perf_counter() - started)
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def metrics(self, total):
+        """[(имя, мс, описание)] в порядке PHASES, затем db и total."""
+        items = [(name, self.durations[name] * 1000, "") for name in PHASES if name in self.durations]
+        items += [(name, seconds * 1000, "") for name, seconds in self.durations.items() if name not in PHASES]
+        items.append(("db", self.db_time * 1000, f"{self.db_queries} queries"))
+        items.append(("total", total * 1000, ""))
+        return items
+
+
+class _NullTimer:
+    """Запрос не попал в выборку — фазы ничего не стоят."""
+
+    def phase(self, name):
+        return nullcontext()
+
+    def add(self, name, seconds):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def get_timer(request):
+    """Таймер запроса (HttpRequest или DRF Request) или пустышка."""
+    return getattr(request, "server_timing", None) or NULL_TIMER
+
+
+def wrap_queries(record):
+    """connection.execute_wrapper, открытый в текущем потоке; закрывать — __exit__ в нём же."""
+    wrapper = connection.execute_wrapper(record)
+    wrapper.__enter__()
+    return wrapper
+
+
+def server_timing_header(metrics):
+    parts = []
+    for name, ms, desc in metrics:
+        part = f"{name};dur={ms:.2f}"
+        if desc:
+            part += f';desc="{desc}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет фазы запроса и отдаёт их в заголовке Server-Timing
+    и строкой лога habit_tracker.timing. Замеряется доля запросов
+    SERVER_TIMING_SAMPLE_RATE (0..1), остальные почти ничего не стоят;
+    при 0 middleware не подключается вовсе.
+    Фазы размечают ServerTimingMixin у view и Timed*Renderer.
+    """
+
+    # и sync, и async: иначе под ASGI Django оборачивает всю цепочку в SyncToAsync
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        timer = request.server_timing = RequestTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer.record_query):
+            response = self.get_response(request)
+        return self._report(request, response, timer, started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        timer = request.server_timing = RequestTimer()
+        started = time.perf_counter()
+        # соединения БД — на поток: обёртку ставим в потоке, где async ORM выполняет запросы запроса
+        wrapper = await sync_to_async(wrap_queries)(timer.record_query)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+        return self._report(request, response, timer, started)
+
+    def _report(self, request, response, timer, started):
+        metrics = timer.metrics(time.perf_counter() - started)
+        response["Server-Timing"] = server_timing_header(metrics)
+        logger.info(
+            "%s %s %s %s",
+            request.method, request.path, response.status_code,
+            " ".join(f"{name}={ms:.2f}" for name, ms, _ in metrics),
+            extra={
+                "timing": {name: round(ms, 3) for name, ms, _ in metrics},
+                "db_queries": timer.db_queries,
+                "path": request.path,
+                "status": response.status_code,
+            },
+        )
+        return response
+
+
+class ServerTimingMixin:
+    """
+    Разметка фаз для DRF-view: auth, perm, query (выборка страницы), serialize.
+    list переопределён целиком, чтобы развести выборку и сериализацию.
+    """
+
+    def perform_authentication(self, request):
+        with get_timer(request).phase("auth"):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with get_timer(request).phase("perm"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with get_timer(request).phase("perm"):
+            super().check_object_permissions(request, obj)
+
+    def list(self, request, *args, **kwargs):
+        timer = get_timer(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        with timer.phase("query"):
+            page = self.paginate_queryset(queryset)
+            rows = list(queryset if page is None else page)
+        with timer.phase("serialize"):
+            data = self.get_serializer(rows, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class TimedRendererMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        request = (renderer_context or {}).get("request")
+        with get_timer(request).phase("render"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Habit
+from .models import Habit, HabitStats
 
 
 @admin.register(Habit)
@@ -7,3 +7,9 @@ class HabitAdmin(admin.ModelAdmin):
     list_display = ("user", "action", "time", "is_pleasant", "is_public")
     list_filter = ("is_pleasant", "is_public", "periodicity")
     search_fields = ("action", "reward", "place")
+
+
+@admin.register(HabitStats)
+class HabitStatsAdmin(admin.ModelAdmin):
+    list_display = ("habit", "current_streak", "longest_streak", "total_completions", "last_completed_on")
+    list_select_related = ("habit",)
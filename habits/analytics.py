@@ -0,0 +1,150 @@
+import hashlib
+import time
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .conditional import collection_version
+from .models import Habit, HabitCompletion
+
+
+def _completions_key(user_id):
+    return f"habits:completions-at:{user_id}"
+
+
+def touch_completions(user_id):
+    """Журнал выполнений пользователя изменился — его статистика из кэша больше не годится."""
+    cache.set(_completions_key(user_id), time.time_ns(), timeout=None)
+
+
+def completions_version(user_id):
+    version = cache.get(_completions_key(user_id))
+    if version is None:
+        # ключ вытеснили — не знаем, что менялось, начинаем новую версию
+        cache.add(_completions_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_completions_key(user_id))
+    return version
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _zeros(n):
+    return array("l", [0]) * n
+
+
+def build_stats(user, days=365, today=None):
+    """
+    Выполнение плана по всем привычкам пользователя за последние `days` дней.
+
+    Единица плана — период привычки (`periodicity` дней от created_at, как у серий):
+    период входит в окно, если начался в нём, и выполнен, если в нём есть отметка.
+    Ежедневные привычки (их большинство) считаются агрегатами в SQL, построчно
+    читаются только отметки привычек с периодом больше дня. Ряды по дням —
+    компактные array, а не списки объектов.
+    """
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    habits = list(
+        Habit.objects.filter(user=user, is_pleasant=False).order_by("id").values_list("id", "created_at", "periodicity")
+    )
+    completions = HabitCompletion.objects.filter(
+        habit__user=user, habit__is_pleasant=False, completed_on__gte=start, completed_on__lte=today,
+    )
+
+    # отметки по дням (тепловая карта) и отдельно — ежедневных привычек: у них отметка = период
+    completed, daily_done = _zeros(days), _zeros(days)
+    for day, total, daily in completions.order_by().values("completed_on").annotate(
+        total=Count("id"), daily=Count("id", filter=Q(habit__periodicity=1)),
+    ).values_list("completed_on", "total", "daily"):
+        i = (day - start).days
+        completed[i], daily_done[i] = total, daily
+    done_counts = dict(
+        completions.filter(habit__periodicity=1).order_by().values("habit_id").annotate(n=Count("id")).values_list("habit_id", "n")
+    )
+    # привычки реже раза в день: номера периодов с отметками
+    done_periods = defaultdict(set)
+    periodic = {habit_id: (created_at, periodicity) for habit_id, created_at, periodicity in habits if periodicity > 1}
+    if periodic:
+        for habit_id, day in completions.filter(habit__periodicity__gt=1).order_by().values_list("habit_id", "completed_on"):
+            created_at, periodicity = periodic[habit_id]
+            done_periods[habit_id].add((day - created_at).days // periodicity)
+
+    due = _zeros(days)
+    # выполненные периоды по дню их начала; у ежедневных это и есть отметки
+    period_done = array("l", daily_done)
+    groups = defaultdict(int)
+    per_habit = []
+    for habit_id, created_at, periodicity in habits:
+        groups[created_at, periodicity] += 1
+        # периоды, начавшиеся в окне: k_min..k_max
+        k_min = _ceil_div(max((start - created_at).days, 0), periodicity)
+        k_max = (today - created_at).days // periodicity
+        habit_due = max(k_max - k_min + 1, 0)
+        if periodicity == 1:
+            habit_done = done_counts.get(habit_id, 0)
+        else:
+            habit_done = 0
+            for k in done_periods.get(habit_id, ()):
+                if k_min <= k <= k_max:
+                    habit_done += 1
+                    period_done[(created_at - start).days + k * periodicity] += 1
+        per_habit.append({
+            "habit": habit_id, "periodicity": periodicity, "due": habit_due, "completed": habit_done,
+            "rate": round(habit_done / habit_due, 4) if habit_due else None,
+        })
+
+    # начала периодов по дням: привычки с одной датой создания и периодичностью — одним проходом
+    for (created_at, periodicity), count in groups.items():
+        first = (created_at - start).days
+        if first < 0:
+            first %= periodicity
+        for i in range(first, days, periodicity):
+            due[i] += count
+
+    weeks = []
+    offset = start.weekday()
+    for w in range(_ceil_div(days + offset, 7)):
+        lo, hi = max(w * 7 - offset, 0), min(w * 7 - offset + 7, days)
+        week_due, week_done = sum(due[lo:hi]), sum(period_done[lo:hi])
+        weeks.append({
+            "week": (start + timedelta(days=w * 7 - offset)).isoformat(),
+            "due": week_due, "completed": week_done,
+            "rate": round(week_done / week_due, 4) if week_due else None,
+        })
+
+    total_due = sum(due)
+    total_done = sum(period_done)
+    return {
+        "from": start.isoformat(),
+        "to": today.isoformat(),
+        "days": days,
+        "habits": len(habits),
+        "due": total_due,
+        "completed": total_done,
+        "rate": round(total_done / total_due, 4) if total_due else None,
+        "daily": {"completed": completed.tolist(), "due": due.tolist()},
+        "weekly": weeks,
+        "per_habit": per_habit,
+    }
+
+
+def user_stats(user, days=365):
+    """
+    build_stats из кэша. Ключ включает версию списка привычек и журнала выполнений,
+    поэтому запись устаревает с первой же отметкой или правкой привычки.
+    """
+    today = timezone.localdate()
+    version = hashlib.md5(str((collection_version(user), completions_version(user.pk))).encode()).hexdigest()
+    key = f"habits:stats:{user.pk}:{days}:{today.isoformat()}:{version}"
+    data = cache.get(key)
+    if data is None:
+        data = build_stats(user, days, today)
+        cache.set(key, data, timeout=settings.HABIT_STATS_CACHE_TTL)
+    return data
@@ -0,0 +1,170 @@
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from habit_tracker.pagination import HabitCursorPagination, HabitPagination, SwitchableHabitPagination
+from habit_tracker.timing import get_timer
+from users.authentication import AsyncJWTAuthentication
+from .conditional import acollection_version, make_etag, not_modified, set_validators
+from .feed import get_page, set_page
+from .models import Habit
+from .serializers import HabitReadSerializer
+from .views import HabitViewSet, PublicHabitListView, read_fields
+
+READ_METHODS = ("GET", "HEAD")
+# как JSONRenderer DRF: ответы побайтно совпадают с синхронными
+JSON_PARAMS = {"ensure_ascii": False, "separators": (",", ":")}
+
+authentication = AsyncJWTAuthentication()
+
+# Запись, курсорные страницы и всё остальное — синхронные view (через поток)
+sync_collection = HabitViewSet.as_view({"get": "list", "post": "create"})
+sync_detail = HabitViewSet.as_view({"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"})
+sync_public = PublicHabitListView.as_view()
+
+
+def error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+    response = JsonResponse(detail, status=exc.status_code, safe=False, json_dumps_params=JSON_PARAMS)
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        response["WWW-Authenticate"] = authentication.authenticate_header(None)
+    return response
+
+
+def wants_cursor(request):
+    mode = request.GET.get(SwitchableHabitPagination.mode_query_param)
+    if mode is None and HabitCursorPagination.cursor_query_param in request.GET:
+        mode = "cursor"
+    return mode == "cursor"
+
+
+async def get_user(request, required=True):
+    with get_timer(request).phase("auth"):
+        result = await authentication.aauthenticate(request)
+    if result is None:
+        if required:
+            raise NotAuthenticated()
+        return None
+    return result[0]
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET[HabitPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return HabitPagination.page_size
+    if size <= 0:
+        return HabitPagination.page_size
+    return min(size, HabitPagination.max_page_size)
+
+
+async def paginate(request, queryset, fields):
+    """Номера страниц как у HabitPagination: COUNT + срез, строки — async-итерацией."""
+    timer = get_timer(request)
+    size = _page_size(request)
+    param = HabitPagination.page_query_param
+    with timer.phase("query"):
+        count = await queryset.acount()
+        pages = max(math.ceil(count / size), 1)
+        raw = request.GET.get(param, 1)
+        try:
+            number = pages if raw in PageNumberPagination.last_page_strings else int(raw)
+        except (TypeError, ValueError):
+            number = 0
+        if not 1 <= number <= pages:
+            raise NotFound(PageNumberPagination.invalid_page_message.format(page_number=raw, message=""))
+        offset = (number - 1) * size
+        rows = [row async for row in queryset[offset:offset + size]]
+    with timer.phase("serialize"):
+        results = HabitReadSerializer(rows, many=True, fields=fields).data
+
+    url = request.build_absolute_uri()
+    previous = None
+    if number > 1:
+        previous = remove_query_param(url, param) if number == 2 else replace_query_param(url, param, number - 1)
+    return {
+        "count": count,
+        "next": replace_query_param(url, param, number + 1) if number < pages else None,
+        "previous": previous,
+        "results": results,
+    }
+
+
+@csrf_exempt
+async def habit_list(request):
+    """GET /habits/ (номера страниц, ?fields=, ETag) без потока на запрос."""
+    if request.method not in READ_METHODS or wants_cursor(request):
+        return await sync_to_async(sync_collection)(request)
+    timer = get_timer(request)
+    try:
+        user = await get_user(request)
+        fields = read_fields(request.GET.get("fields"))
+        with timer.phase("version"):
+            count, changed, deleted_at = await acollection_version(user)
+        last_modified = max(filter(None, (changed, deleted_at)))
+        etag = make_etag(request, user.pk, count, changed, deleted_at)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            queryset = Habit.objects.filter(user=user).order_by("id").values(*fields)
+            response = JsonResponse(await paginate(request, queryset, fields), json_dumps_params=JSON_PARAMS)
+    except APIException as exc:
+        return error_response(exc)
+    return set_validators(response, etag, last_modified)
+
+
+@csrf_exempt
+async def habit_detail(request, pk):
+    """GET /habits/{id}/ — строка своей привычки, ETag по updated_at."""
+    if request.method not in READ_METHODS:
+        return await sync_to_async(sync_detail)(request, pk=pk)
+    timer = get_timer(request)
+    try:
+        user = await get_user(request)
+        fields = read_fields(request.GET.get("fields"))
+        with timer.phase("query"):
+            row = await Habit.objects.filter(user=user, pk=pk).values(*fields, "updated_at").afirst()
+        if row is None:
+            # текст как у get_object_or_404 в синхронном retrieve
+            raise NotFound(f"No {Habit._meta.object_name} matches the given query.")
+    except APIException as exc:
+        return error_response(exc)
+    etag = make_etag(request, row["id"], row["updated_at"])
+    response = not_modified(request, etag, row["updated_at"])
+    if response is None:
+        with timer.phase("serialize"):
+            data = HabitReadSerializer(row, fields=fields).data
+        response = JsonResponse(data, json_dumps_params=JSON_PARAMS)
+    return set_validators(response, etag, row["updated_at"])
+
+
+@csrf_exempt
+async def public_list(request):
+    """GET /public/ — лента публичных привычек с тем же кэшем страниц."""
+    if request.method not in READ_METHODS or wants_cursor(request):
+        return await sync_to_async(sync_public)(request)
+    timer = get_timer(request)
+    try:
+        # токен необязателен, но если прислан — должен быть валидным (как у DRF)
+        await get_user(request, required=False)
+        fields = read_fields(request.GET.get("fields"))
+        # асинхронный API кэша Django в 5.2 — те же вызовы через поток
+        if settings.PUBLIC_FEED_CACHE_TTL:
+            with timer.phase("cache"):
+                data = await sync_to_async(get_page)(request)
+            if data is not None:
+                return JsonResponse(data, headers={"X-Cache": "HIT"}, json_dumps_params=JSON_PARAMS)
+        queryset = Habit.objects.filter(is_public=True).order_by("id").values(*fields)
+        data = await paginate(request, queryset, fields)
+    except APIException as exc:
+        return error_response(exc)
+    response = JsonResponse(data, json_dumps_params=JSON_PARAMS)
+    if settings.PUBLIC_FEED_CACHE_TTL:
+        await sync_to_async(set_page)(request, data)
+        response["X-Cache"] = "MISS"
+    return response
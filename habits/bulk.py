@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .conditional import record_deletion
+from .models import Habit
+from .serializers import HabitSerializer
+from .signals import bulk_deleting, habits_bulk_changed
+
+
+def _linked_ids(items):
+    ids = set()
+    for data in items:
+        value = data.get("linked_habit") if isinstance(data, dict) else None
+        if value not in (None, "") and not isinstance(value, bool):
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return ids
+
+
+def prefetch_linked(items):
+    """
+    Все связанные привычки из пачки одним запросом.
+    Берём queryset самого поля linked_habit, чтобы правила выбора совпадали с API.
+    """
+    ids = _linked_ids(items)
+    if not ids:
+        return {}
+    queryset = HabitSerializer().fields["linked_habit"].get_queryset()
+    return {h.pk: h for h in queryset.filter(pk__in=ids)}
+
+
+def build_habit(request, data, prefetched, instance=None):
+    """
+    Проверяет данные теми же правилами, что и одиночный API
+    (HabitSerializer.validate + Habit.clean), и возвращает несохранённую
+    привычку. При ошибке — (None, errors).
+    """
+    serializer = HabitSerializer(
+        instance, data=data, partial=instance is not None,
+        context={"request": request, "prefetched": prefetched},
+    )
+    if not serializer.is_valid():
+        return None, serializer.errors
+
+    habit = instance if instance is not None else Habit(user=request.user)
+    for name, value in serializer.validated_data.items():
+        setattr(habit, name, value)
+    try:
+        # связи уже проверены выше — не даём full_clean ходить за ними в БД
+        habit.full_clean(exclude=["user", "linked_habit"], validate_unique=False)
+    except DjangoValidationError as exc:
+        return None, serializers.as_serializer_error(exc)
+    habit.next_due_at = habit.compute_next_due()
+    return habit, None
+
+
+# Обновляемые экземпляры — полные строки, поэтому пишем все изменяемые колонки
+UPDATE_FIELDS = [
+    f.name for f in Habit._meta.concrete_fields
+    if not f.primary_key and (f.editable or f.name in ("next_due_at", "updated_at"))
+]
+
+
+def write_habits(creates=(), updates=(), deletes=()):
+    """
+    Пачка изменений одной транзакцией, bulk-операциями.
+    deletes — загруженные привычки: по ним без запросов видно владельцев
+    и приятные, на которые могут ссылаться.
+    """
+    # bulk_update не применяет auto_now
+    now = timezone.now()
+    for habit in updates:
+        habit.updated_at = now
+    delete_ids = [h.pk for h in deletes]
+    pleasant_ids = [h.pk for h in deletes if h.is_pleasant]
+    with transaction.atomic():
+        created = Habit.objects.bulk_create(creates) if creates else []
+        if updates:
+            Habit.objects.bulk_update(updates, UPDATE_FIELDS)
+        if pleasant_ids:
+            # как touch_linking_habits, но одним запросом на всю пачку
+            Habit.objects.filter(linked_habit_id__in=pleasant_ids).update(updated_at=now)
+        if delete_ids:
+            with bulk_deleting():
+                Habit.objects.filter(pk__in=delete_ids).delete()
+
+    for user_id in {h.user_id for h in deletes}:
+        record_deletion(user_id, now)
+    changed = [h.pk for h in created] + [h.pk for h in updates] + delete_ids
+    if changed:
+        habits_bulk_changed.send(sender=Habit, habit_ids=changed)
+    return created
+
+
+def apply_operations(request, operations):
+    """
+    Выполняет пачку create/update/delete. Всё или ничего: если хоть одна
+    операция не прошла проверку, ничего не пишем и возвращаем ошибки по позициям.
+    Возвращает (results, ok).
+    """
+    limit = settings.HABITS_BULK_MAX_OPERATIONS
+    if len(operations) > limit:
+        raise serializers.ValidationError(f"Не больше {limit} операций за запрос.")
+
+    # привычки, которые меняем/удаляем, и связанные — двумя запросами на всю пачку
+    target_ids = {op["id"] for op in operations if op["op"] != "create"}
+    targets = {}
+    if target_ids:
+        queryset = Habit.objects.filter(user=request.user, pk__in=target_ids).select_related("linked_habit")
+        targets = {h.pk: h for h in queryset}
+    prefetched = prefetch_linked(op["data"] for op in operations if op["op"] != "delete")
+
+    results, creates, updates, deletes = [], [], [], []
+    seen = set()
+    ok = True
+    for index, op in enumerate(operations):
+        result = {"index": index, "op": op["op"]}
+        results.append(result)
+
+        habit_id = op.get("id") if op["op"] != "create" else None
+        if habit_id is not None:
+            if habit_id in seen:
+                result["errors"] = {"id": "Привычка уже встречается в этой пачке."}
+                ok = False
+                continue
+            seen.add(habit_id)
+            if habit_id not in targets:
+                result["errors"] = {"id": "Привычка не найдена."}
+                ok = False
+                continue
+
+        if op["op"] == "delete":
+            deletes.append(targets[habit_id])
+            continue
+
+        habit, errors = build_habit(request, op["data"], prefetched, instance=targets.get(habit_id))
+        if errors:
+            result["errors"] = errors
+            ok = False
+        elif op["op"] == "create":
+            creates.append((result, habit))
+        else:
+            updates.append((result, habit))
+
+    # нельзя связаться с привычкой, которую удаляем в этой же пачке
+    delete_ids = {h.pk for h in deletes}
+    for result, habit in creates + updates:
+        if habit.linked_habit_id in delete_ids:
+            result["errors"] = {"linked_habit": "Связанная привычка удаляется в этом же запросе."}
+            ok = False
+
+    if not ok:
+        return results, False
+
+    write_habits(
+        creates=[h for _, h in creates],
+        updates=[h for _, h in updates],
+        deletes=deletes,
+    )
+    for result, habit in creates + updates:
+        result["id"] = habit.pk
+        result["data"] = HabitSerializer(habit).data
+    for result in results:
+        if result["op"] == "delete":
+            result["id"] = operations[result["index"]]["id"]
+    return results, True
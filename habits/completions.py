@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import touch_completions
+from .models import Habit, HabitCompletion, HabitStats
+
+STATS_FIELDS = ("current_streak", "longest_streak", "total_completions", "periods_completed", "last_period", "last_completed_on")
+
+
+def period_of(created_at, periodicity, day):
+    """Номер периода привычки, в который попадает day (0 — период создания)."""
+    return (day - created_at).days // (periodicity or 1)
+
+
+def _advance(stats, period, day):
+    """Один шаг свёртки: отметка в периоде period (не раньше last_period)."""
+    stats.total_completions += 1
+    if period != stats.last_period:
+        # следующий период подряд продолжает серию, пропуск хотя бы одного — обрывает
+        consecutive = stats.last_period is not None and period == stats.last_period + 1
+        stats.current_streak = stats.current_streak + 1 if consecutive else 1
+        stats.longest_streak = max(stats.longest_streak, stats.current_streak)
+        stats.periods_completed += 1
+        stats.last_period = period
+    if stats.last_completed_on is None or day > stats.last_completed_on:
+        stats.last_completed_on = day
+
+
+def _lock_stats(habit):
+    """
+    Блокирует строку привычки (на PostgreSQL это сериализует отметки одной привычки)
+    и тем же запросом читает её свёртку; None — отметок ещё не было.
+    """
+    locked = Habit.objects.select_for_update(of=("self",)).select_related("stats").get(pk=habit.pk)
+    try:
+        return locked.stats
+    except HabitStats.DoesNotExist:
+        return None
+
+
+def is_stale(habit, stats):
+    return stats is not None and stats.periodicity != habit.periodicity
+
+
+def record_completion(habit, day=None):
+    """
+    Отмечает выполнение за day (по умолчанию сегодня) и двигает свёртку за O(1).
+    Повторная отметка за тот же день ничего не меняет; отметка задним числом
+    раньше последней пересчитывает свёртку из журнала.
+    Возвращает (stats, created).
+    """
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        stats = _lock_stats(habit)
+        if HabitCompletion.objects.filter(habit=habit, completed_on=day).exists():
+            return stats, False
+        HabitCompletion.objects.create(habit=habit, completed_on=day)
+        touch_completions(habit.user_id)
+
+        period = period_of(habit.created_at, habit.periodicity, day)
+        if is_stale(habit, stats) or (stats is not None and stats.last_period is not None and period < stats.last_period):
+            return rebuild_stats(habit), True
+        # журнал пишется только здесь: нет свёртки — это первая отметка
+        created = stats is None
+        if created:
+            stats = HabitStats(habit=habit, periodicity=habit.periodicity)
+        _advance(stats, period, day)
+        stats.save(force_insert=created)
+    return stats, True
+
+
+def record_completions(marks):
+    """
+    Пакетный record_completion: marks — пары (habit_id, day) любых пользователей.
+    Привычки со свёртками читаются одним запросом, журнал и свёртки пишутся
+    bulk-операциями; пересчёт из журнала — только для отметок задним числом.
+    Возвращает множество пар (habit_id, day), отмеченных этим вызовом.
+    """
+    marks = set(marks)
+    if not marks:
+        return set()
+    with transaction.atomic():
+        habits = {
+            habit.pk: habit
+            for habit in Habit.objects.select_for_update(of=("self",)).select_related("stats").filter(
+                pk__in={habit_id for habit_id, _ in marks},
+            )
+        }
+        marks = {(habit_id, day) for habit_id, day in marks if habit_id in habits}
+        existing = set(
+            HabitCompletion.objects.filter(
+                habit_id__in={habit_id for habit_id, _ in marks}, completed_on__in={day for _, day in marks},
+            ).values_list("habit_id", "completed_on")
+        )
+        new = sorted(marks - existing)
+        HabitCompletion.objects.bulk_create(
+            [HabitCompletion(habit_id=habit_id, completed_on=day) for habit_id, day in new], ignore_conflicts=True,
+        )
+
+        creates, updates, rebuilt = {}, {}, set()
+        for habit_id, day in new:
+            if habit_id in rebuilt:
+                continue
+            habit = habits[habit_id]
+            stats = creates.get(habit_id) or updates.get(habit_id) or getattr(habit, "stats", None)
+            period = period_of(habit.created_at, habit.periodicity, day)
+            if is_stale(habit, stats) or (stats is not None and stats.last_period is not None and period < stats.last_period):
+                # журнал уже содержит всю пачку — пересчёт учтёт и остальные её отметки
+                rebuilt.add(habit_id)
+                creates.pop(habit_id, None)
+                updates.pop(habit_id, None)
+                rebuild_stats(habit)
+                continue
+            if stats is None:
+                stats = creates[habit_id] = HabitStats(habit=habit, periodicity=habit.periodicity)
+            elif habit_id not in creates:
+                updates[habit_id] = stats
+            _advance(stats, period, day)
+        HabitStats.objects.bulk_create(creates.values())
+        HabitStats.objects.bulk_update(updates.values(), STATS_FIELDS)
+        for user_id in {habits[habit_id].user_id for habit_id, _ in new}:
+            touch_completions(user_id)
+    return set(new)
+
+
+def remove_completion(habit, day):
+    """Снимает отметку за day. Серии после этого пересчитываются из журнала."""
+    with transaction.atomic():
+        deleted, _ = HabitCompletion.objects.filter(habit=habit, completed_on=day).delete()
+        if not deleted:
+            return None
+        touch_completions(habit.user_id)
+        return rebuild_stats(habit)
+
+
+def rebuild_stats(habit):
+    """
+    Полный пересчёт свёртки по журналу — для редких случаев: отметка задним числом,
+    снятие отметки, смена периодичности.
+    """
+    stats = HabitStats(habit=habit, periodicity=habit.periodicity)
+    days = HabitCompletion.objects.filter(habit=habit).order_by("completed_on").values_list("completed_on", flat=True)
+    for day in days:
+        _advance(stats, period_of(habit.created_at, habit.periodicity, day), day)
+    stats.save()
+    return stats
+
+
+def streak_summary(habit, stats=None, today=None):
+    """
+    Серии и выполнение на сегодня без чтения журнала.
+    Серия ещё жива, пока не закончился период, следующий за последним отмеченным.
+    Свёртку, посчитанную со старой периодичностью, один раз пересчитывает.
+    """
+    if is_stale(habit, stats):
+        stats = rebuild_stats(habit)
+    today = today or timezone.localdate()
+    current = period_of(habit.created_at, habit.periodicity, today)
+    stats = stats or HabitStats(habit=habit)
+    alive = stats.last_period is not None and current <= stats.last_period + 1
+    return {
+        "habit": habit.pk,
+        "periodicity": habit.periodicity,
+        "current_streak": stats.current_streak if alive else 0,
+        "longest_streak": stats.longest_streak,
+        "total_completions": stats.total_completions,
+        "periods_completed": stats.periods_completed,
+        "adherence": round(stats.periods_completed / (current + 1), 4),
+        "last_completed_on": stats.last_completed_on,
+        "completed_this_period": stats.last_period == current,
+    }
@@ -0,0 +1,67 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Habit
+
+
+def _deleted_key(user_id):
+    return f"habits:deleted-at:{user_id}"
+
+
+def record_deletion(user_id, when=None):
+    """Удаление не оставляет updated_at — запоминаем его время для Last-Modified списка."""
+    cache.set(_deleted_key(user_id), when or timezone.now(), timeout=None)
+
+
+def collection_version(user):
+    """
+    Версия списка привычек пользователя: (count, max updated_at, время удаления).
+    Один запрос по индексу (user, updated_at) плюс одно чтение кэша.
+    """
+    stats = Habit.objects.filter(user=user).order_by().aggregate(count=Count("id"), changed=Max("updated_at"))
+    deleted_at = cache.get(_deleted_key(user.pk))
+    if deleted_at is None:
+        # не знаем, удаляли ли что-то (кэш сброшен) — считаем, что только что
+        deleted_at = timezone.now()
+        cache.add(_deleted_key(user.pk), deleted_at, timeout=None)
+    return stats["count"], stats["changed"], deleted_at
+
+
+async def acollection_version(user):
+    """collection_version для async-view: агрегат через async ORM."""
+    stats = await Habit.objects.filter(user=user).order_by().aaggregate(count=Count("id"), changed=Max("updated_at"))
+    deleted_at = await cache.aget(_deleted_key(user.pk))
+    if deleted_at is None:
+        deleted_at = timezone.now()
+        await cache.aadd(_deleted_key(user.pk), deleted_at, timeout=None)
+    return stats["count"], stats["changed"], deleted_at
+
+
+def make_etag(request, *parts):
+    # строка запроса и формат ответа входят в тег: у разных страниц разные данные;
+    # async-view получают обычный HttpRequest и отвечают только JSON
+    query = getattr(request, "query_params", request.GET)
+    media_type = getattr(request, "accepted_media_type", "application/json")
+    raw = "|".join(map(str, [*parts, sorted(query.lists()), media_type]))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified):
+    """HttpResponseNotModified, если у клиента актуальная копия, иначе None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # ответы зависят от пользователя: общие кэши не хранят, браузер переспрашивает
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Authorization"])
+    return response
@@ -0,0 +1,75 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Habit
+
+VERSION_KEY = "public-feed:version"
+HITS_KEY = "public-feed:hits"
+MISSES_KEY = "public-feed:misses"
+
+# Служебные поля рассылки (и отметка изменения, которую они двигают): меняются
+# каждую минуту и на ленту почти не влияют, поэтому кэш из-за них не сбрасываем —
+# устаревают максимум на TTL
+REMINDER_FIELDS = ("last_reminded_at", "next_due_at", "updated_at")
+FEED_FIELDS = tuple(
+    f.attname for f in Habit._meta.concrete_fields if f.name not in REMINDER_FIELDS
+)
+
+
+def feed_snapshot(habit):
+    # только из __dict__: отложенные поля (.only/.defer) не тянем из БД
+    return tuple(habit.__dict__.get(name) for name in FEED_FIELDS)
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # начинаем с метки времени: если ключ вытеснили, старые страницы
+        # не совпадут с новой версией
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_public_feed():
+    """Все закэшированные страницы ленты разом становятся недействительными."""
+    get_version()
+    _incr(VERSION_KEY)
+
+
+def page_key(request):
+    # хост входит в ключ: next/previous в ответе — абсолютные ссылки
+    query = sorted(getattr(request, "query_params", request.GET).lists())
+    raw = f"{request.get_host()}|{request.path}|{query}"
+    return f"public-feed:{get_version()}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def get_page(request):
+    """Данные страницы из кэша или None. Заодно считает попадания/промахи."""
+    data = cache.get(page_key(request))
+    _incr(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_page(request, data):
+    cache.set(page_key(request), data, timeout=settings.PUBLIC_FEED_CACHE_TTL)
+
+
+def feed_cache_stats():
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": values.get(HITS_KEY, 0), "misses": values.get(MISSES_KEY, 0)}
+
+
+def reset_feed_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
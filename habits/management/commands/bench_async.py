@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as clock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habit_tracker.benchmarking import isolated_database, percentiles
+from habits.feed import invalidate_public_feed
+from habits.models import Habit
+
+
+def _result(durations, total):
+    points = percentiles(durations, (99,))
+    return {
+        "iterations": len(durations),
+        "per_second": round(len(durations) / total, 1) if total else 0.0,
+        "p50_ms": round(statistics.median(durations) * 1000, 2) if durations else 0.0,
+        "p99_ms": round(points["p99"] * 1000, 2),
+    }
+
+
+def run_threads(client, paths, headers, concurrency):
+    """WSGI-путь: синхронный клиент, concurrency потоков."""
+    def get(path):
+        t0 = time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, (path, response.status_code)
+        return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        durations = list(pool.map(get, paths))
+    return _result(durations, time.perf_counter() - started)
+
+
+async def run_tasks(client, paths, headers, concurrency):
+    """ASGI-путь: одна петля событий, не больше concurrency запросов одновременно."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(path):
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code)
+            return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    durations = await asyncio.gather(*(get(path) for path in paths))
+    return _result(durations, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        "Чтение привычек под нагрузкой: WSGI + синхронные view, ASGI + синхронные view "
+        "и ASGI + async-view (/api/async/...). Обработчики в процессе, на временной БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--habits", type=int, default=200, help="Привычек у пользователя (половина публичные)")
+        parser.add_argument("--requests", type=int, default=400, help="Запросов в каждом прогоне")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--page-size", type=int, default=20)
+
+    def handle(self, *args, **options):
+        requests, concurrency = options["requests"], options["concurrency"]
+        # DEBUG=False: иначе подключается QueryBudgetMiddleware и замер идёт по другой цепочке middleware
+        with isolated_database(), override_settings(PUBLIC_FEED_CACHE_TTL=0, SERVER_TIMING_SAMPLE_RATE=0, DEBUG=False):
+            user, ids = self._seed(options["habits"])
+            headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+            pages = max(len(ids) // options["page_size"], 1)
+            endpoints = {
+                "list": [f"habits/?page={i % pages + 1}&page_size={options['page_size']}" for i in range(requests)],
+                "detail": [f"habits/{ids[i % len(ids)]}/" for i in range(requests)],
+                "public": [f"public/?page={i % pages // 2 + 1}&page_size={options['page_size']}" for i in range(requests)],
+            }
+            for name, paths in endpoints.items():
+                sync_paths = [f"/api/{path}" for path in paths]
+                async_paths = [f"/api/async/{path}" for path in paths]
+                rows = [
+                    ("wsgi+sync", run_threads(Client(), sync_paths, headers, concurrency)),
+                    ("asgi+sync", asyncio.run(run_tasks(AsyncClient(), sync_paths, headers, concurrency))),
+                    ("asgi+async", asyncio.run(run_tasks(AsyncClient(), async_paths, headers, concurrency))),
+                ]
+                self.stdout.write(name)
+                for label, result in rows:
+                    self.stdout.write(
+                        f"  {label:<11} {result['per_second']:>9} запр/с  "
+                        f"p50 {result['p50_ms']:>8} мс  p99 {result['p99_ms']:>8} мс"
+                    )
+
+    def _seed(self, count):
+        user = get_user_model().objects.create(username="bench-async")
+        Habit.objects.bulk_create(
+            [
+                Habit(
+                    user=user, place="дом", time=clock(i // 60 % 24, i % 60), action=f"привычка {i}",
+                    periodicity=1, execution_time=60, reward="чай", is_public=i % 2 == 0,
+                )
+                for i in range(count)
+            ],
+            batch_size=500,
+        )
+        invalidate_public_feed()
+        return user, list(Habit.objects.filter(user=user).values_list("id", flat=True))
@@ -0,0 +1,81 @@
+import random
+from datetime import time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from habit_tracker.benchmarking import isolated_database, measure
+from habits.analytics import build_stats, user_stats
+from habits.models import Habit, HabitCompletion
+
+PERIODICITY_WEIGHTS = {1: 60, 2: 10, 3: 10, 7: 20}
+BATCH = 5000
+
+
+def rowwise_stats(user, days, today):
+    """Точка отсчёта: весь журнал окна в Python и цикл по дням каждой привычки."""
+    start = today - timedelta(days=days - 1)
+    habits = {h: (c, p) for h, c, p in Habit.objects.filter(user=user, is_pleasant=False).values_list("id", "created_at", "periodicity")}
+    done = set()
+    rows = HabitCompletion.objects.filter(habit__user=user, completed_on__gte=start).order_by().values_list("habit_id", "completed_on")
+    for habit_id, day in rows:
+        created_at, periodicity = habits[habit_id]
+        done.add((habit_id, (day - created_at).days // periodicity))
+    due = completed = 0
+    for habit_id, (created_at, periodicity) in habits.items():
+        for i in range(days):
+            offset = (start + timedelta(days=i) - created_at).days
+            if offset >= 0 and offset % periodicity == 0:
+                due += 1
+                completed += (habit_id, offset // periodicity) in done
+    return due, completed
+
+
+class Command(BaseCommand):
+    help = "Время /api/habits/stats/ для пользователя с N привычками и годом отметок: расчёт и чтение из кэша."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--habits", type=int, default=1000)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--adherence", type=float, default=0.7, help="Доля дней с отметкой")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        days, iterations = options["days"], options["iterations"]
+        today = timezone.localdate()
+
+        with isolated_database():
+            user = get_user_model().objects.create(username="bench-stats")
+            periods, weights = zip(*PERIODICITY_WEIGHTS.items())
+            Habit.objects.bulk_create(
+                Habit(
+                    user=user, place="дом", time=time(8, i % 60), action=f"привычка {i}",
+                    periodicity=rng.choices(periods, weights)[0], execution_time=60, reward="чай",
+                )
+                for i in range(options["habits"])
+            )
+            # история на всё окно: создаём привычки «за день до» его начала
+            Habit.objects.filter(user=user).update(created_at=today - timedelta(days=days))
+            completions = [
+                HabitCompletion(habit_id=habit_id, completed_on=today - timedelta(days=d))
+                for habit_id in Habit.objects.filter(user=user).values_list("id", flat=True)
+                for d in range(days)
+                if rng.random() < options["adherence"]
+            ]
+            HabitCompletion.objects.bulk_create(completions, batch_size=BATCH)
+            self.stdout.write(f"привычек: {options['habits']}, отметок: {len(completions)}")
+
+            runs = [
+                ("построчно", lambda i: rowwise_stats(user, days, today)),
+                ("build_stats", lambda i: build_stats(user, days, today)),
+                ("из кэша", lambda i: user_stats(user, days)),
+            ]
+            cache.clear()
+            user_stats(user, days)
+            for label, fn in runs:
+                result = measure(fn, iterations)
+                self.stdout.write(f"{label:<20} p50 {result['p50_ms']:>9} мс  p95 {result['p95_ms']:>9} мс")
@@ -0,0 +1,63 @@
+from datetime import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from habit_tracker.benchmarking import format_row, isolated_database, measure
+from habits.feed import feed_cache_stats, invalidate_public_feed
+from habits.models import Habit
+
+PUBLIC_URL = "/api/public/"
+
+
+class Command(BaseCommand):
+    help = "Сравнивает пропускную способность публичной ленты с кэшем и без (на временной БД)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--habits", type=int, default=2000, help="Сколько публичных привычек создать")
+        parser.add_argument("--requests", type=int, default=500, help="Сколько запросов в каждом прогоне")
+        parser.add_argument("--pages", type=int, default=20, help="По скольким страницам ходить по кругу")
+        parser.add_argument("--page-size", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            self._seed(options["habits"])
+            client = APIClient()
+            pages = max(options["pages"], 1)
+            page_size = options["page_size"]
+
+            def get(i):
+                response = client.get(PUBLIC_URL, {"page": i % pages + 1, "page_size": page_size})
+                assert response.status_code == 200, response.status_code
+
+            with override_settings(PUBLIC_FEED_CACHE_TTL=0):
+                uncached = measure(get, options["requests"])
+
+            before = feed_cache_stats()
+            with override_settings(PUBLIC_FEED_CACHE_TTL=300):
+                cached = measure(get, options["requests"])
+            after = feed_cache_stats()
+
+        self.stdout.write(format_row("без кэша", uncached))
+        self.stdout.write(format_row("с кэшем", cached))
+        self.stdout.write(
+            f"попаданий: {after['hits'] - before['hits']}, промахов: {after['misses'] - before['misses']}, "
+            f"ускорение: x{cached['per_second'] / uncached['per_second']:.1f}"
+        )
+
+    def _seed(self, count):
+        user = get_user_model().objects.create(username="bench-public-feed")
+        Habit.objects.bulk_create(
+            [
+                Habit(
+                    user=user, place="дом", time=time(i // 60 % 24, i % 60), action=f"привычка {i}",
+                    periodicity=1, execution_time=60, reward="чай", is_public=True,
+                )
+                for i in range(count)
+            ],
+            batch_size=500,
+        )
+        # bulk_create сигналов не шлёт
+        invalidate_public_feed()
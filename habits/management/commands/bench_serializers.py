@@ -0,0 +1,48 @@
+from datetime import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from habit_tracker.benchmarking import isolated_database, measure
+from habits.models import Habit
+from habits.serializers import HabitReadSerializer, HabitSerializer
+
+
+class Command(BaseCommand):
+    help = "Время сериализации на строку для страниц списка: HabitSerializer против HabitReadSerializer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--pages", type=int, default=200, help="Сколько раз сериализовать страницу")
+        parser.add_argument("--fields", default="id,action,time,place", help="Набор для ?fields=")
+
+    def handle(self, *args, **options):
+        page_size, pages = options["page_size"], options["pages"]
+        sparse = tuple(options["fields"].split(","))
+
+        with isolated_database():
+            user = get_user_model().objects.create(username="bench-serializers")
+            Habit.objects.bulk_create(
+                Habit(
+                    user=user, place="дом", time=time(8, i % 60), action=f"привычка {i}",
+                    periodicity=1, execution_time=60, reward="чай", is_public=True,
+                )
+                for i in range(page_size)
+            )
+            queryset = Habit.objects.filter(user=user).order_by("id")
+            instances = list(queryset)
+            rows = list(queryset.values(*HabitReadSerializer.field_names()))
+            sparse_rows = list(queryset.values(*sparse))
+
+            runs = [
+                ("HabitSerializer", lambda i: HabitSerializer(instances, many=True).data),
+                ("HabitReadSerializer", lambda i: HabitReadSerializer(rows, many=True).data),
+                (f"fields={','.join(sparse)}", lambda i: HabitReadSerializer(sparse_rows, many=True, fields=sparse).data),
+                # с выборкой из БД: модели против строк .values()
+                ("+SQL модели", lambda i: HabitSerializer(list(queryset), many=True).data),
+                ("+SQL строки", lambda i: HabitReadSerializer(list(queryset.values(*HabitReadSerializer.field_names())), many=True).data),
+            ]
+            for label, fn in runs:
+                result = measure(fn, pages)
+                per_row_us = result["seconds"] / (pages * page_size) * 1_000_000
+                self.stdout.write(f"{label:<28} {per_row_us:>8.1f} мкс/строка  p50 страницы {result['p50_ms']} мс")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+from habits.schedule import compute_next_due
+
+
+def fill_next_due_at(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    batch = []
+    rows = Habit.objects.filter(is_pleasant=False).only(
+        "id", "created_at", "time", "periodicity", "last_reminded_at"
+    )
+    for h in rows.iterator(chunk_size=2000):
+        h.next_due_at = compute_next_due(h.created_at, h.time, h.periodicity, h.last_reminded_at)
+        batch.append(h)
+        if len(batch) >= 2000:
+            Habit.objects.bulk_update(batch, ["next_due_at"])
+            batch = []
+    if batch:
+        Habit.objects.bulk_update(batch, ["next_due_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0003_alter_habit_options_alter_habit_execution_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_due_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Следующее напоминание'),
+        ),
+        migrations.RunPython(fill_next_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_tune_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='habits.habit', verbose_name='Привычка')),
+                ('periodicity', models.PositiveSmallIntegerField(default=1, verbose_name='Периодичность свёртки')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='Текущая серия (периодов)')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='Лучшая серия (периодов)')),
+                ('total_completions', models.PositiveIntegerField(default=0, verbose_name='Всего отметок')),
+                ('periods_completed', models.PositiveIntegerField(default=0, verbose_name='Периодов с отметкой')),
+                ('last_period', models.PositiveIntegerField(blank=True, null=True, verbose_name='Последний период с отметкой')),
+                ('last_completed_on', models.DateField(blank=True, null=True, verbose_name='Последнее выполнение')),
+            ],
+            options={
+                'verbose_name': 'Статистика привычки',
+                'verbose_name_plural': 'Статистика привычек',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_on', models.DateField(verbose_name='Дата выполнения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Отмечено')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Выполнение привычки',
+                'verbose_name_plural': 'Выполнения привычек',
+                'ordering': ['habit', 'completed_on'],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'completed_on'), name='habit_completion_once_a_day')],
+            },
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 from django.db import models
 
+from .schedule import compute_next_due
+
 User = get_user_model()
 
 
@@ -13,6 +15,8 @@ class Habit(models.Model):
         on_delete=models.CASCADE,
         related_name="habits",
         verbose_name="Пользователь",
+        # отдельный индекс не нужен: user_id — первая колонка составных индексов ниже
+        db_index=False,
     )
     place = models.CharField(max_length=255, verbose_name="Место")
     time = models.TimeField(verbose_name="Время")
@@ -52,14 +56,38 @@ class Habit(models.Model):
 
     is_public = models.BooleanField(default=False, verbose_name="Публичная привычка")
 
+    # Предрасчитанный слот следующего напоминания: по нему send_due_habits
+    # выбирает привычки одним индексным range-запросом вместо полного скана
+    next_due_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        verbose_name="Следующее напоминание",
+    )
+
+    # Меняется при любом сохранении; по (user, updated_at) считается версия списка
+    # для условных GET. bulk_update auto_now не применяет — там ставим явно.
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+
     def __str__(self):
         return f"{self.action} в {self.time} ({self.user})"
 
     class Meta:
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
-        # Чёткий порядок для пагинации/тестов
-        ordering = ["-created_at", "id"]
+        # Чёткий порядок для пагинации/тестов; по id — как сортируют все списки
+        ordering = ["id"]
+        # Индексы под реальные запросы (проверяются EXPLAIN в тестах):
+        indexes = [
+            # список своих привычек: filter(user).order_by("id")
+            models.Index(fields=["user", "id"], name="habit_user_id_idx"),
+            # версия списка для ETag: count + max(updated_at) по пользователю
+            models.Index(fields=["user", "updated_at"], name="habit_user_updated_idx"),
+            # публичная лента: filter(is_public=True).order_by("id") — только публичные строки
+            models.Index(fields=["id"], condition=models.Q(is_public=True), name="habit_public_id_idx"),
+            # рассылка: диапазон по next_due_at; у приятных привычек он NULL — их в индекс не берём
+            models.Index(
+                fields=["next_due_at"], condition=models.Q(next_due_at__isnull=False), name="habit_next_due_idx",
+            ),
+        ]
 
     def clean(self):
         errors = {}
@@ -85,6 +113,73 @@ class Habit(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    def compute_next_due(self, now=None):
+        """Слот следующего напоминания; у приятных привычек напоминаний нет."""
+        if self.is_pleasant:
+            return None
+        return compute_next_due(
+            self.created_at, self.time, self.periodicity, self.last_reminded_at, now=now
+        )
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        # Уже загруженные связи не проверяем повторно: ForeignKey.validate сделал бы
+        # по запросу на каждую (приятность linked_habit всё равно проверяет clean)
+        self.full_clean(exclude=[f.name for f in (self._meta.get_field("user"), self._meta.get_field("linked_habit")) if f.is_cached(self)])
+        self.next_due_at = self.compute_next_due()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            extra = [name for name in ("next_due_at", "updated_at") if name not in update_fields]
+            kwargs["update_fields"] = [*update_fields, *extra]
         return super().save(*args, **kwargs)
+
+
+class HabitCompletion(models.Model):
+    """Отметка «выполнено»: не больше одной на привычку в день."""
+
+    habit = models.ForeignKey(
+        Habit, on_delete=models.CASCADE, related_name="completions", verbose_name="Привычка",
+        # habit_id — первая колонка уникального ограничения
+        db_index=False,
+    )
+    completed_on = models.DateField(verbose_name="Дата выполнения")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Отмечено")
+
+    def __str__(self):
+        return f"{self.habit_id} выполнена {self.completed_on}"
+
+    class Meta:
+        verbose_name = "Выполнение привычки"
+        verbose_name_plural = "Выполнения привычек"
+        ordering = ["habit", "completed_on"]
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "completed_on"], name="habit_completion_once_a_day"),
+        ]
+
+
+class HabitStats(models.Model):
+    """
+    Свёртка журнала выполнений, обновляется инкрементально (habits.completions).
+
+    Серия считается в периодах привычки: период — `periodicity` дней от created_at,
+    как и расписание напоминаний. last_period — номер последнего периода с отметкой.
+    periodicity — с какой периодичностью свёртка посчитана: если у привычки она
+    с тех пор поменялась (в т.ч. через bulk без сигналов), свёртку пересчитывают.
+    """
+
+    habit = models.OneToOneField(
+        Habit, on_delete=models.CASCADE, primary_key=True, related_name="stats", verbose_name="Привычка",
+    )
+    periodicity = models.PositiveSmallIntegerField(default=1, verbose_name="Периодичность свёртки")
+    current_streak = models.PositiveIntegerField(default=0, verbose_name="Текущая серия (периодов)")
+    longest_streak = models.PositiveIntegerField(default=0, verbose_name="Лучшая серия (периодов)")
+    total_completions = models.PositiveIntegerField(default=0, verbose_name="Всего отметок")
+    periods_completed = models.PositiveIntegerField(default=0, verbose_name="Периодов с отметкой")
+    last_period = models.PositiveIntegerField(null=True, blank=True, verbose_name="Последний период с отметкой")
+    last_completed_on = models.DateField(null=True, blank=True, verbose_name="Последнее выполнение")
+
+    def __str__(self):
+        return f"{self.habit_id}: серия {self.current_streak}, лучшая {self.longest_streak}"
+
+    class Meta:
+        verbose_name = "Статистика привычки"
+        verbose_name_plural = "Статистика привычек"
@@ -7,4 +7,5 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        # сравниваем id: obj.user подгрузил бы пользователя отдельным запросом
+        return obj.user_id == request.user.id
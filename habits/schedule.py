@@ -0,0 +1,44 @@
+# habits/schedule.py
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+# Допуск окна напоминания: слот считается актуальным ещё минуту после наступления
+REMINDER_TOLERANCE = timedelta(minutes=1)
+
+
+def reminder_window(now=None):
+    """
+    Окно напоминаний для тика: с предыдущей минуты включительно
+    до следующей (не включая). Возвращает (window_start, window_end).
+    """
+    now = timezone.localtime(now)
+    minute_start = now.replace(second=0, microsecond=0)
+    return minute_start - REMINDER_TOLERANCE, minute_start + REMINDER_TOLERANCE
+
+
+def compute_next_due(created_at, time, periodicity, last_reminded_at=None, now=None):
+    """
+    Ближайший слот напоминания (aware datetime) не раньше текущего окна.
+
+    Привычка выполняется раз в `periodicity` дней, считая от `created_at`,
+    и не напоминается повторно в день `last_reminded_at`.
+    Работает на «голых» значениях, чтобы её можно было звать
+    из values()-строк, миграций и bulk-операций без загрузки моделей.
+    """
+    now = timezone.localtime(now)
+    window_start, _ = reminder_window(now)
+    created_at = created_at or timezone.localdate(now)
+    periodicity = periodicity or 1
+    tz = timezone.get_current_timezone()
+
+    today = now.date()
+    offset = (today - created_at).days % periodicity
+    day = today + timedelta(days=(periodicity - offset) % periodicity)
+
+    while True:
+        if last_reminded_at is None or day > last_reminded_at:
+            due = timezone.make_aware(datetime.combine(day, time), tz)
+            if due >= window_start:
+                return due
+        day += timedelta(days=periodicity)
@@ -1,8 +1,34 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Habit
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PK-поле, которое сначала смотрит в заранее загруженные объекты
+    (context["prefetched"]: pk -> объект), а не делает запрос на каждую запись.
+    В prefetched должны лежать только объекты, подходящие под queryset поля.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get("prefetched")
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        obj = prefetched.get(pk)
+        if obj is None:
+            self.fail("does_not_exist", pk_value=data)
+        return obj
+
+
 class HabitSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Habit
         fields = "__all__"
@@ -23,7 +49,11 @@ class HabitSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         # поддержка PATCH: берём текущее значение из instance, если не пришло в attrs
         def get_val(name):
-            return attrs.get(name, getattr(self.instance, name, None))
+            # не attrs.get(name, getattr(...)): дефолт вычислился бы всегда,
+            # а для linked_habit это лишний запрос за старой связью
+            if name in attrs:
+                return attrs[name]
+            return getattr(self.instance, name, None)
 
         is_pleasant = get_val("is_pleasant")
         reward = get_val("reward")
@@ -48,7 +78,96 @@ class HabitSerializer(serializers.ModelSerializer):
             # Разрешим связывать только свои привычки (если нужно — можно убрать это правило)
             req = self.context.get("request")
             user = getattr(req, "user", None)
-            if linked and user and linked.user != user:
+            if linked and user and linked.user_id != user.id:
                 raise serializers.ValidationError({"linked_habit": "Можно связывать только свои привычки."})
 
         return attrs
+
+
+class HabitReadSerializer(serializers.BaseSerializer):
+    """
+    Только вывод: строки из .values() -> dict в формате HabitSerializer.
+
+    Функции to_representation полей HabitSerializer собираются один раз на класс,
+    а не по набору полей на каждый объект; связи в строках уже лежат как pk.
+    `fields` — какие поля выводить (по умолчанию все).
+    """
+
+    _converters = None
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        converters = self.converters()
+        self.plan = [(name, converters[name]) for name in (fields or converters)]
+
+    @classmethod
+    def converters(cls):
+        if cls._converters is None:
+            cls._converters = {
+                name: None if isinstance(field, serializers.RelatedField) else field.to_representation
+                for name, field in HabitSerializer().fields.items()
+            }
+        return cls._converters
+
+    @classmethod
+    def field_names(cls):
+        return tuple(cls.converters())
+
+    def to_representation(self, row):
+        data = {}
+        for name, convert in self.plan:
+            value = row[name]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+
+class HabitBulkOperationSerializer(serializers.Serializer):
+    """Одна операция пакетного запроса к /api/habits/bulk/."""
+
+    OPS = ("create", "update", "delete")
+
+    op = serializers.ChoiceField(choices=OPS)
+    id = serializers.IntegerField(required=False, min_value=1)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs["op"] != "create" and "id" not in attrs:
+            raise serializers.ValidationError({"id": "Для update/delete нужен id привычки."})
+        if attrs["op"] != "delete" and "data" not in attrs:
+            raise serializers.ValidationError({"data": "Для create/update нужны данные привычки."})
+        return attrs
+
+
+class HabitCompletionSerializer(serializers.Serializer):
+    """Отметка выполнения: дата (по умолчанию сегодня) для привычки из context["habit"]."""
+
+    date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        habit = self.context["habit"]
+        if habit.is_pleasant:
+            raise serializers.ValidationError("Приятная привычка — это награда, её выполнение не отмечается.")
+        day = attrs.setdefault("date", timezone.localdate())
+        if day > timezone.localdate():
+            raise serializers.ValidationError({"date": "Нельзя отметить выполнение в будущем."})
+        if day < habit.created_at:
+            raise serializers.ValidationError({"date": "Дата раньше создания привычки."})
+        return attrs
+
+
+class HabitStreakSerializer(serializers.Serializer):
+    """Ответ complete/streak — готовый словарь из habits.completions.streak_summary."""
+
+    habit = serializers.IntegerField()
+    periodicity = serializers.IntegerField()
+    current_streak = serializers.IntegerField()
+    longest_streak = serializers.IntegerField()
+    total_completions = serializers.IntegerField()
+    periods_completed = serializers.IntegerField()
+    adherence = serializers.FloatField()
+    last_completed_on = serializers.DateField(allow_null=True)
+    completed_this_period = serializers.BooleanField()
+
+
+class HabitStatsQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(required=False, default=365, min_value=1, max_value=366)
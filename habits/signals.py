@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .conditional import record_deletion
+from .feed import FEED_FIELDS, feed_snapshot, invalidate_public_feed
+from .models import Habit
+
+# bulk_create/bulk_update не шлют post_save, поэтому пакетные операции
+# сообщают об изменениях этим сигналом. queryset.delete шлёт pre_delete/post_delete
+# на каждую строку, но внутри bulk_deleting() приёмники удаления молчат:
+# пакет делает их работу сам, одним запросом и одним сигналом.
+# Аргументы: habit_ids — id затронутых привычек.
+habits_bulk_changed = Signal()
+
+IS_PUBLIC = FEED_FIELDS.index("is_public")
+
+_bulk_deleting = ContextVar("habits_bulk_deleting", default=False)
+
+
+@contextmanager
+def bulk_deleting():
+    """Удаление пачкой: построчные приёмники pre_delete/post_delete пропускаются."""
+    token = _bulk_deleting.set(True)
+    try:
+        yield
+    finally:
+        _bulk_deleting.reset(token)
+
+
+def deleting_in_bulk():
+    return _bulk_deleting.get()
+
+
+@receiver(post_init, sender=Habit)
+def remember_feed_state(sender, instance, **kwargs):
+    instance._feed_snapshot = feed_snapshot(instance)
+
+
+@receiver(post_save, sender=Habit)
+def invalidate_feed_on_save(sender, instance, created, **kwargs):
+    before, after = instance._feed_snapshot, feed_snapshot(instance)
+    instance._feed_snapshot = after
+    # лента меняется, только если привычка была или стала публичной
+    # и поменялось что-то, кроме служебных полей рассылки
+    if (before[IS_PUBLIC] or after[IS_PUBLIC]) and (created or before != after):
+        invalidate_public_feed()
+
+
+@receiver(post_delete, sender=Habit)
+def invalidate_feed_on_delete(sender, instance, **kwargs):
+    if deleting_in_bulk():
+        return
+    # на приятную привычку могут ссылаться публичные (linked_habit -> NULL без сигналов)
+    if instance.is_public or instance.is_pleasant:
+        invalidate_public_feed()
+
+
+@receiver(habits_bulk_changed, sender=Habit)
+def invalidate_feed_on_bulk(sender, habit_ids, **kwargs):
+    # снимков «до» у пакетных операций нет — сбрасываем без разбора
+    invalidate_public_feed()
+
+
+@receiver(pre_delete, sender=Habit)
+def touch_linking_habits(sender, instance, **kwargs):
+    # linked_habit у ссылающихся обнулится через SET_NULL без save — двигаем им updated_at сами
+    if instance.is_pleasant and not deleting_in_bulk():
+        Habit.objects.filter(linked_habit=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Habit)
+def remember_deletion(sender, instance, **kwargs):
+    if not deleting_in_bulk():
+        record_deletion(instance.user_id)
@@ -1,9 +1,30 @@
-from datetime import time
+import json
+from datetime import datetime, time, timedelta
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from asgiref.sync import SyncToAsync, sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.db.models import Count, Max
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient, APITestCase
-from habits.models import Habit
+from rest_framework_simplejwt.tokens import AccessToken
+from habit_tracker.querybudget import QueryBudget
+from habits.bulk import write_habits
+from habits.completions import record_completion, record_completions
+from habits.feed import feed_cache_stats
+from habits.models import Habit, HabitCompletion, HabitStats
+from habits.schedule import reminder_window
+from habits.serializers import HabitSerializer
+from habits.views import HabitViewSet, PublicHabitListView
+from notifications.models import TelegramAccount
+from notifications.tasks import CHUNK_SIZE, process_reminder_retries, send_due_habits
+from notifications.testing import StubClient
 
 User = get_user_model()
 API = "/api/habits/"
@@ -233,3 +254,844 @@ class TestPermissionsCRUD(APITestCase):
         r = self.client.post(API, payload, format="json")
         self.assertEqual(r.status_code, 201)
         self.assertEqual(r.data["user"], self.u1.id)
+
+
+class TestBulkHabits(APITestCase):
+    URL = f"{API}bulk/"
+
+    def setUp(self):
+        self.user = User.objects.create(username="bulk")
+        self.other = User.objects.create(username="other")
+        self.client.force_authenticate(user=self.user)
+        self.pleasant = Habit.objects.create(
+            user=self.user, place="дом", time=time(9, 0), action="ванна",
+            is_pleasant=True, periodicity=1, execution_time=60,
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="зарядка",
+            periodicity=1, execution_time=60, reward="кофе",
+        )
+
+    def _create(self, **extra):
+        data = {
+            "place": "парк", "time": "07:30", "action": "бег", "periodicity": 2,
+            "execution_time": 90, "is_pleasant": False, "reward": "смузи",
+        }
+        data.update(extra)
+        return {"op": "create", "data": data}
+
+    def test_mixed_batch(self):
+        foreign = Habit.objects.create(
+            user=self.other, place="офис", time=time(8, 0), action="чужая",
+            periodicity=1, execution_time=60, reward="чай",
+        )
+        ops = [
+            self._create(),
+            self._create(action="с наградой-связкой", reward=None, linked_habit=self.pleasant.id),
+            {"op": "update", "id": self.habit.id, "data": {"place": "балкон"}},
+            {"op": "delete", "id": self.pleasant.id},
+        ]
+        r = self.client.post(self.URL, ops, format="json")
+        # связь с удаляемой привычкой — ошибка, и ничего не записано
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("linked_habit", r.data["results"][1]["errors"])
+        self.assertEqual(Habit.objects.filter(user=self.user).count(), 2)
+
+        ops[3] = {"op": "delete", "id": foreign.id}
+        r = self.client.post(self.URL, ops, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("id", r.data["results"][3]["errors"])
+
+        ops.pop()
+        r = self.client.post(self.URL, ops, format="json")
+        self.assertEqual(r.status_code, 200, r.data)
+        created = Habit.objects.get(pk=r.data["results"][1]["id"])
+        self.assertEqual(created.linked_habit_id, self.pleasant.id)
+        self.assertEqual(created.user, self.user)
+        self.assertIsNotNone(created.next_due_at)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.place, "балкон")
+        self.assertEqual(r.data["results"][2]["data"]["place"], "балкон")
+
+        r = self.client.post(self.URL, [{"op": "delete", "id": self.habit.id}], format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(Habit.objects.filter(pk=self.habit.id).exists())
+
+    def test_publishes_each_change_once(self):
+        ops = [
+            self._create(),
+            {"op": "update", "id": self.pleasant.id, "data": {"place": "сад"}},
+            {"op": "delete", "id": self.habit.id},
+        ]
+        with patch("notifications.signals.publish_habit_changes") as publish:
+            r = self.client.post(self.URL, ops, format="json")
+        self.assertEqual(r.status_code, 200, r.data)
+        published = [pk for call in publish.call_args_list for pk in call.args[0]]
+        self.assertEqual(sorted(published), sorted([r.data["results"][0]["id"], self.pleasant.id, self.habit.id]))
+
+    def test_same_rules_as_single_api(self):
+        not_pleasant = self.habit.id
+        ops = [
+            self._create(),
+            self._create(is_pleasant=True),  # приятная с наградой
+            self._create(reward=None),  # ни награды, ни связи
+            self._create(reward=None, linked_habit=not_pleasant),  # связь не с приятной
+            self._create(execution_time=121),
+            {"op": "update", "id": self.pleasant.id, "data": {"reward": "торт"}},
+        ]
+        r = self.client.post(self.URL, ops, format="json")
+        self.assertEqual(r.status_code, 400)
+        results = r.data["results"]
+        self.assertNotIn("errors", results[0])
+        self.assertIn("reward", results[1]["errors"])
+        self.assertIn("non_field_errors", results[2]["errors"])
+        self.assertIn("linked_habit", results[3]["errors"])
+        self.assertIn("execution_time", results[4]["errors"])
+        self.assertIn("reward", results[5]["errors"])
+        self.assertEqual(Habit.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def run(n):
+            ops = [self._create(reward=None, linked_habit=self.pleasant.id) for _ in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.post(self.URL, ops, format="json")
+            self.assertEqual(r.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(2), run(20))
+
+
+class TestCursorPagination(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="pager")
+        self.ids = [
+            Habit.objects.create(
+                user=self.user, place="дом", time=time(8, i), action=f"h{i}",
+                periodicity=1, execution_time=10, reward="чай", is_public=True,
+            ).id
+            for i in range(12)
+        ]
+
+    def _walk(self, url):
+        seen, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            queries += [q["sql"] for q in ctx.captured_queries]
+            seen += [x["id"] for x in r.data["results"]]
+            url = r.data["next"]
+        return seen, queries
+
+    def test_cursor_mode_walks_feed_without_count(self):
+        seen, queries = self._walk("/api/public/?pagination=cursor")
+        self.assertEqual(seen, self.ids)
+        self.assertFalse([q for q in queries if "COUNT(" in q])
+        self.assertFalse([q for q in queries if "OFFSET" in q])
+
+    def test_cursor_for_own_habits_and_page_size(self):
+        self.client.force_authenticate(user=self.user)
+        r = self.client.get(f"{API}?pagination=cursor&page_size=10")
+        self.assertEqual(len(r.data["results"]), 10)
+        self.assertNotIn("count", r.data)
+        r = self.client.get(r.data["next"])
+        self.assertEqual([x["id"] for x in r.data["results"]], self.ids[10:])
+
+    def test_page_numbers_stay_default(self):
+        r = self.client.get("/api/public/?page=2")
+        self.assertEqual(r.data["count"], 12)
+        self.assertEqual([x["id"] for x in r.data["results"]], self.ids[5:10])
+
+
+class TestPublicFeedCache(APITestCase):
+    URL = "/api/public/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="feed")
+        self.public = self._habit("бег", is_public=True)
+        self.private = self._habit("отжимания")
+
+    def _habit(self, action, **extra):
+        return Habit.objects.create(
+            user=self.user, place="парк", time=time(7, 0), action=action,
+            periodicity=1, execution_time=60, reward="кофе", **extra,
+        )
+
+    def _get(self):
+        r = self.client.get(self.URL)
+        self.assertEqual(r.status_code, 200)
+        return r["X-Cache"], [x["action"] for x in r.data["results"]]
+
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self._get(), ("MISS", ["бег"]))
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get(), ("HIT", ["бег"]))
+        self.assertEqual(feed_cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_public_changes_invalidate(self):
+        self._get()
+        self.public.action = "бег трусцой"
+        self.public.save()
+        self.assertEqual(self._get(), ("MISS", ["бег трусцой"]))
+
+        self.private.is_public = True
+        self.private.save()
+        self.assertEqual(self._get(), ("MISS", ["бег трусцой", "отжимания"]))
+
+        self.public.delete()
+        self.assertEqual(self._get(), ("MISS", ["отжимания"]))
+
+    def test_private_and_reminder_changes_keep_cache(self):
+        self._get()
+        self.private.action = "планка"
+        self.private.save()
+        self._habit("приседания")
+        self.public.last_reminded_at = timezone.localdate()
+        self.public.save(update_fields=["last_reminded_at"])
+        self.assertEqual(self._get(), ("HIT", ["бег"]))
+
+    def test_bulk_writes_invalidate(self):
+        self._get()
+        self.private.is_public = True
+        write_habits(updates=[self.private])
+        self.assertEqual(self._get()[0], "MISS")
+
+
+class TestConditionalGet(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="poller")
+        self.client.force_authenticate(user=self.user)
+        self.habits = [
+            Habit.objects.create(
+                user=self.user, place="дом", time=time(9, i), action=f"h{i}",
+                periodicity=1, execution_time=30, reward="чай",
+            )
+            for i in range(3)
+        ]
+
+    def _etag(self, url=API):
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        return r["ETag"]
+
+    def test_list_not_modified_costs_one_query(self):
+        r = self.client.get(API)
+        with self.assertNumQueries(1):
+            again = self.client.get(API, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+        again = self.client.get(API, HTTP_IF_MODIFIED_SINCE=r["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+        self.assertNotEqual(self._etag(API + "?page_size=2"), r["ETag"])
+
+    def test_changes_produce_new_etag(self):
+        etags = {self._etag()}
+        self.client.patch(f"{API}{self.habits[0].id}/", {"place": "сад"}, format="json")
+        etags.add(self._etag())
+        self.client.delete(f"{API}{self.habits[1].id}/")
+        etags.add(self._etag())
+        self.habits[2].place = "офис"
+        write_habits(updates=[self.habits[2]])
+        etags.add(self._etag())
+        self.assertEqual(len(etags), 4)
+
+    def test_detail(self):
+        url = f"{API}{self.habits[0].id}/"
+        etag = self._etag(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.patch(url, {"place": "сад"}, format="json")
+        r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["place"], "сад")
+
+
+@skipUnless(connection.vendor == "sqlite", "разбор плана запроса — под EXPLAIN QUERY PLAN SQLite")
+class TestHotQueryPlans(TestCase):
+    """Горячие запросы должны идти по индексу, а не полным сканом таблицы."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="planner")
+        self.now = timezone.now()
+        self.window_start, self.window_end = reminder_window(self.now)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = Habit._meta.db_table
+        for line in plan.splitlines():
+            self.assertFalse(
+                f"SCAN {table}" in line and "USING" not in line,
+                f"полный скан {table}:\n{plan}\n{queryset.query}",
+            )
+        self.assertIn("USING", plan)
+
+    def test_own_list(self):
+        request = Mock(user=self.user)
+        queryset = HabitViewSet(request=request).get_queryset()
+        self.assertUsesIndex(queryset[:5])
+        self.assertUsesIndex(queryset.filter(id__gt=10)[:5])
+
+    def test_public_feed(self):
+        queryset = PublicHabitListView.queryset
+        self.assertUsesIndex(queryset[:5])
+        self.assertUsesIndex(queryset.filter(id__gt=10)[:5])
+        self.assertUsesIndex(queryset.order_by())
+
+    def test_collection_version(self):
+        self.assertUsesIndex(
+            Habit.objects.filter(user=self.user).order_by().values("user").annotate(n=Count("id"), m=Max("updated_at"))
+        )
+
+    def test_reminder_queries(self):
+        due = Habit.objects.filter(next_due_at__gte=self.window_start, next_due_at__lt=self.window_end)
+        self.assertUsesIndex(due.filter(id__gt=0).order_by("id")[:CHUNK_SIZE])
+        missed = Habit.objects.filter(next_due_at__lt=self.window_start)
+        self.assertUsesIndex(missed.order_by().values_list("id", flat=True))
+        self.assertUsesIndex(missed.filter(id__in=[1, 2, 3]).order_by("id"))
+
+
+class TestReadSerializer(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="reader")
+        self.client.force_authenticate(user=self.user)
+        self.pleasant = Habit.objects.create(
+            user=self.user, place="диван", time=time(21, 0), action="книга",
+            is_pleasant=True, periodicity=1, execution_time=120, is_public=True,
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place="парк", time=time(7, 30), action="бег", linked_habit=self.pleasant,
+            periodicity=2, execution_time=90, is_public=True, last_reminded_at=timezone.localdate(),
+        )
+
+    def test_same_output_as_model_serializer(self):
+        r = self.client.get(API)
+        expected = HabitSerializer([self.pleasant, self.habit], many=True).data
+        self.assertEqual(r.json()["results"], [dict(x) for x in expected])
+        r = self.client.get(f"{API}{self.habit.id}/")
+        self.assertEqual(r.json(), dict(HabitSerializer(self.habit).data))
+
+    def test_sparse_fields_narrow_select(self):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get("/api/public/?fields=action,time&pagination=cursor")
+        self.assertEqual(r.data["results"][1], {"id": self.habit.id, "time": "07:30:00", "action": "бег"})
+        select = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT"))
+        self.assertIn('"action"', select)
+        self.assertNotIn('"reward"', select)
+        self.assertNotIn('"place"', select)
+
+        r = self.client.get(f"{API}{self.habit.id}/?fields=linked_habit")
+        self.assertEqual(r.data, {"id": self.habit.id, "linked_habit": self.pleasant.id})
+
+    def test_unknown_field(self):
+        r = self.client.get(f"{API}?fields=action,password")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("password", str(r.data["fields"]))
+
+
+class TestCompletions(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="done")
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.localdate()
+        self.habit = self._habit(periodicity=1)
+
+    def _habit(self, periodicity, days_ago=30, **extra):
+        habit = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="зарядка",
+            periodicity=periodicity, execution_time=60, reward="кофе", **extra,
+        )
+        # created_at — auto_now_add, сдвигаем историю назад
+        Habit.objects.filter(pk=habit.pk).update(created_at=self.today - timedelta(days=days_ago))
+        habit.refresh_from_db()
+        return habit
+
+    def _complete(self, habit, days_ago, expected=201):
+        r = self.client.post(f"{API}{habit.id}/complete/", {"date": str(self.today - timedelta(days=days_ago))}, format="json")
+        self.assertEqual(r.status_code, expected, r.data)
+        return r.data
+
+    def test_daily_streak(self):
+        for days_ago in (5, 4, 2, 1, 0):
+            data = self._complete(self.habit, days_ago)
+        self.assertEqual((data["current_streak"], data["longest_streak"], data["total_completions"]), (3, 3, 5))
+        self.assertTrue(data["completed_this_period"])
+
+        # повтор за тот же день — 200 и без двойного счёта
+        self.assertEqual(self._complete(self.habit, 0, expected=200)["total_completions"], 5)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 5)
+
+    def test_streak_respects_periodicity(self):
+        # раз в 3 дня от создания 11 дней назад: периоды по 3 дня, сегодня — четвёртый;
+        # по отметке в каждом, дни между — не пропуски
+        habit = self._habit(periodicity=3, days_ago=11)
+        for days_ago in (11, 7, 4, 1):
+            data = self._complete(habit, days_ago)
+        self.assertEqual((data["current_streak"], data["periods_completed"]), (4, 4))
+        # две отметки в одном периоде не удлиняют серию
+        data = self._complete(habit, 0)
+        self.assertEqual((data["current_streak"], data["total_completions"]), (4, 5))
+
+    def test_streak_expires_without_rescanning(self):
+        self._complete(self.habit, 10)
+        self._complete(self.habit, 9)
+        # серия оборвалась: прошло больше периода, но рекорд остаётся
+        with self.assertNumQueries(1):
+            r = self.client.get(f"{API}{self.habit.id}/streak/")
+        self.assertEqual((r.data["current_streak"], r.data["longest_streak"]), (0, 2))
+        self.assertEqual(r.data["adherence"], round(2 / 31, 4))
+
+    def test_backfill_and_undo_rebuild(self):
+        for days_ago in (3, 1, 0):
+            self._complete(self.habit, days_ago)
+        # отметка задним числом закрывает пропуск
+        data = self._complete(self.habit, 2)
+        self.assertEqual((data["current_streak"], data["longest_streak"]), (4, 4))
+
+        r = self.client.delete(f"{API}{self.habit.id}/complete/?date={self.today - timedelta(days=1)}")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data["current_streak"], r.data["longest_streak"]), (1, 2))
+        r = self.client.delete(f"{API}{self.habit.id}/complete/?date={self.today - timedelta(days=1)}")
+        self.assertEqual(r.status_code, 404)
+
+    def test_periodicity_change_rebuilds_rollup(self):
+        for days_ago in (4, 2, 0):
+            self._complete(self.habit, days_ago)
+        self.assertEqual(self.habit.stats.current_streak, 1)
+        # как у bulk — без save и сигналов; свёртка помнит, с какой периодичностью посчитана
+        Habit.objects.filter(pk=self.habit.pk).update(periodicity=2)
+        r = self.client.get(f"{API}{self.habit.id}/streak/")
+        self.assertEqual((r.data["current_streak"], r.data["periods_completed"]), (3, 3))
+        self.assertEqual(HabitStats.objects.get(pk=self.habit.pk).periodicity, 2)
+
+    def test_bulk_record_matches_single(self):
+        days = (9, 8, 7, 5, 4, 2, 1)
+        single, bulk, backfill = self._habit(periodicity=1), self._habit(periodicity=2), self._habit(periodicity=1)
+        twin = self._habit(periodicity=2)
+        for days_ago in days:
+            record_completion(single, self.today - timedelta(days=days_ago))
+            record_completion(twin, self.today - timedelta(days=days_ago))
+        record_completion(backfill, self.today)
+
+        created = record_completions(
+            [(single.pk, self.today)]
+            + [(bulk.pk, self.today - timedelta(days=d)) for d in days]
+            # задним числом — пересчёт из журнала, вместе с остальными отметками пачки
+            + [(backfill.pk, self.today - timedelta(days=d)) for d in (3, 1, 2)]
+            # повтор и чужая несуществующая привычка — пропускаются
+            + [(single.pk, self.today - timedelta(days=1)), (999999, self.today)]
+        )
+        self.assertEqual(len(created), 1 + len(days) + 3)
+        record_completion(single, self.today - timedelta(days=30))
+
+        fields = ("current_streak", "longest_streak", "total_completions", "periods_completed", "last_period", "last_completed_on")
+        stats = {s.habit_id: s for s in HabitStats.objects.all()}
+        self.assertEqual([getattr(stats[bulk.pk], f) for f in fields], [getattr(stats[twin.pk], f) for f in fields])
+        self.assertEqual((stats[backfill.pk].current_streak, stats[backfill.pk].total_completions), (4, 4))
+        self.assertEqual(stats[single.pk].total_completions, len(days) + 2)
+
+    def test_validation(self):
+        pleasant = Habit.objects.create(
+            user=self.user, place="дом", time=time(9, 0), action="ванна",
+            is_pleasant=True, periodicity=1, execution_time=60,
+        )
+        self.assertEqual(self.client.post(f"{API}{pleasant.id}/complete/", {}, format="json").status_code, 400)
+        self._complete(self.habit, -1, expected=400)
+        self._complete(self.habit, 31, expected=400)
+
+        other = User.objects.create(username="other-done")
+        self.client.force_authenticate(user=other)
+        self._complete(self.habit, 0, expected=404)
+
+
+class TestHabitStatsEndpoint(APITestCase):
+    URL = f"{API}stats/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="stats")
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.localdate()
+        self.daily = self._habit(1, days_ago=30)
+        self.every3 = self._habit(3, days_ago=11)
+        for days_ago in (2, 1, 0):
+            record_completion(self.daily, self.today - timedelta(days=days_ago))
+        # 6 дней назад — период, начавшийся до окна; 4 и 3 — один и тот же период
+        for days_ago in (6, 4, 3):
+            record_completion(self.every3, self.today - timedelta(days=days_ago))
+
+    def _habit(self, periodicity, days_ago):
+        habit = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action=f"раз в {periodicity}",
+            periodicity=periodicity, execution_time=60, reward="чай",
+        )
+        Habit.objects.filter(pk=habit.pk).update(created_at=self.today - timedelta(days=days_ago))
+        habit.refresh_from_db()
+        return habit
+
+    def test_week_window(self):
+        r = self.client.get(self.URL, {"days": 7})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data["due"], r.data["completed"]), (9, 4))
+        self.assertEqual(r.data["daily"]["due"], [1, 2, 1, 1, 2, 1, 1])
+        self.assertEqual(r.data["daily"]["completed"], [1, 0, 1, 1, 1, 1, 1])
+        per_habit = {row["habit"]: (row["due"], row["completed"]) for row in r.data["per_habit"]}
+        self.assertEqual(per_habit, {self.daily.id: (7, 3), self.every3.id: (2, 1)})
+        self.assertEqual(sum(w["due"] for w in r.data["weekly"]), 9)
+        self.assertEqual(sum(w["completed"] for w in r.data["weekly"]), 4)
+
+    def test_cached_until_next_completion(self):
+        first = self.client.get(self.URL).data
+        # из кэша: только версия списка привычек
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.URL).data, first)
+
+        record_completion(self.daily, self.today - timedelta(days=3))
+        self.assertEqual(self.client.get(self.URL).data["completed"], first["completed"] + 1)
+
+    def test_days_validation(self):
+        self.assertEqual(self.client.get(self.URL, {"days": 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {"days": 367}).status_code, 400)
+
+
+class TestExportImport(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="export")
+        self.client.force_authenticate(user=self.user)
+        self.pleasant = Habit.objects.create(
+            user=self.user, place="дом", time=time(21, 0), action="ванна",
+            is_pleasant=True, periodicity=1, execution_time=60,
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place="парк", time=time(7, 30), action="бег, трусцой",
+            periodicity=2, execution_time=90, linked_habit=self.pleasant,
+        )
+        self.plain = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="зарядка",
+            periodicity=1, execution_time=60, reward="кофе", is_public=True,
+        )
+        # ссылка «вперёд»: приятная создана позже той, что на неё ссылается
+        self.late = Habit.objects.create(
+            user=self.user, place="дом", time=time(22, 0), action="чтение",
+            is_pleasant=True, periodicity=1, execution_time=30,
+        )
+        Habit.objects.filter(pk=self.plain.pk).update(linked_habit=self.late, reward=None)
+
+    def _export(self, fmt):
+        r = self.client.get(f"{API}export/", {"fmt": fmt})
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        return b"".join(r.streaming_content).decode()
+
+    def _import(self, body, content_type="application/x-ndjson", user=None):
+        client = APIClient()
+        client.force_authenticate(user=user or User.objects.create(username=f"import-{User.objects.count()}"))
+        r = client.generic("POST", f"{API}import/", body.encode(), content_type=content_type)
+        self.assertEqual(r.status_code, 200, r.content)
+        return r.data, client
+
+    def test_export_ndjson(self):
+        lines = [json.loads(line) for line in self._export("ndjson").splitlines()]
+        # приятные — первыми, чтобы ссылки при импорте шли после них
+        self.assertEqual([d["id"] for d in lines], [self.pleasant.id, self.late.id, self.habit.id, self.plain.id])
+        self.assertEqual(lines[2]["linked_habit"], self.pleasant.id)
+        self.assertEqual(lines[2]["time"], "07:30:00")
+        self.assertNotIn("user", lines[0])
+
+    def test_export_is_chunked(self):
+        with patch("habits.transfer.EXPORT_CHUNK", 1), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self._export("ndjson").splitlines()), 4)
+        # по порции на строку + пустой добор на каждую группу
+        self.assertEqual(sum("habits_habit" in q["sql"] for q in queries.captured_queries), 6)
+
+    def test_roundtrip(self):
+        for fmt, content_type in (("ndjson", "application/x-ndjson"), ("csv", "text/csv")):
+            with self.subTest(fmt=fmt), patch("habits.transfer.IMPORT_BATCH", 1):
+                report, _ = self._import(self._export(fmt), content_type)
+                self.assertEqual((report["created"], report["failed"]), (4, 0))
+                user = User.objects.latest("id")
+                imported = {h.action: h for h in Habit.objects.filter(user=user).select_related("linked_habit")}
+                self.assertEqual(imported["бег, трусцой"].linked_habit.action, "ванна")
+                self.assertEqual(imported["зарядка"].linked_habit.action, "чтение")
+                self.assertTrue(imported["зарядка"].is_public)
+                self.assertEqual(imported["ванна"].user, user)
+
+    def test_errors_per_line(self):
+        body = "\n".join([
+            json.dumps({"place": "дом", "time": "08:00", "action": "ок", "periodicity": 1, "execution_time": 10, "reward": "чай"}),
+            "{не json",
+            "",
+            # те же правила, что у API: награда и связанная одновременно
+            json.dumps({"place": "дом", "time": "08:00", "action": "плохо", "periodicity": 1, "execution_time": 10,
+                        "reward": "чай", "linked_habit": self.pleasant.id}),
+            json.dumps({"place": "дом", "time": "08:00", "action": "долго", "periodicity": 1, "execution_time": 500, "reward": "чай"}),
+        ])
+        report, _ = self._import(body)
+        self.assertEqual((report["created"], report["failed"]), (1, 3))
+        self.assertEqual([e["line"] for e in report["errors"]], [2, 4, 5])
+        self.assertIn("non_field_errors", report["errors"][1]["errors"])
+        self.assertIn("execution_time", report["errors"][2]["errors"])
+
+    def test_multipart_csv_upload(self):
+        upload = SimpleUploadedFile("habits.csv", self._export("csv").encode(), content_type="text/csv")
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create(username="upload"))
+        r = client.post(f"{API}import/", {"file": upload}, format="multipart")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(r.data["created"], 4)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(f"{API}export/", {"fmt": "xml"}).status_code, 400)
+
+
+class TestAsyncViews(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="async")
+        self.auth = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.sync = APIClient()
+        self.sync.credentials(HTTP_AUTHORIZATION=self.auth["Authorization"])
+        # заголовки AsyncClient(headers=...) в ASGI-scope не попадают — передаём в каждом запросе
+        self.async_client = AsyncClient()
+        for i in range(7):
+            Habit.objects.create(
+                user=self.user, place="дом", time=time(8, i), action=f"h{i}",
+                periodicity=1, execution_time=30, reward="чай", is_public=i % 2 == 0,
+            )
+
+    async def _same(self, path, sync_path=None):
+        response = await self.async_client.get(f"/api/async/{path}", headers=self.auth)
+        expected = await sync_to_async(self.sync.get)(f"/api/{sync_path or path}")
+        self.assertEqual(response.status_code, expected.status_code)
+        # ссылки next/previous ведут на свой адрес, остальное совпадает
+        self.assertEqual(
+            json.loads(response.content.decode().replace("/api/async/", "/api/")), expected.json(),
+        )
+        return response, expected
+
+    async def test_same_output_as_sync_views(self):
+        habit = await Habit.objects.filter(user=self.user).afirst()
+        for path in ("habits/", "habits/?page=2&page_size=3", "habits/?fields=action,time", f"habits/{habit.id}/", "public/?page_size=2"):
+            with self.subTest(path=path):
+                response, expected = await self._same(path)
+                if "ETag" in expected:
+                    self.assertEqual(response["ETag"], expected["ETag"])
+        response, _ = await self._same("habits/?page=2&page_size=3")
+        self.assertEqual(response.json()["next"], "http://testserver/api/async/habits/?page=3&page_size=3")
+        self.assertEqual(response.json()["previous"], "http://testserver/api/async/habits/?page_size=3")
+
+    async def test_errors(self):
+        for path in ("habits/?page=9", "habits/?fields=nope", "habits/999999/"):
+            with self.subTest(path=path):
+                await self._same(path)
+        response = await AsyncClient().get("/api/async/habits/")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+        response = await AsyncClient().get("/api/async/public/", headers={"Authorization": "Bearer broken"})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_conditional_get_and_feed_cache(self):
+        response = await self.async_client.get("/api/async/habits/", headers=self.auth)
+        response = await self.async_client.get("/api/async/habits/", headers={**self.auth, "If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual((await AsyncClient().get("/api/async/public/"))["X-Cache"], "MISS")
+        self.assertEqual((await AsyncClient().get("/api/async/public/"))["X-Cache"], "HIT")
+
+    async def test_inactive_user_rejected(self):
+        self.user.is_active = False
+        await self.user.asave()
+        self.assertEqual((await self.async_client.get("/api/async/habits/", headers=self.auth)).status_code, 401)
+
+    async def test_writes_and_cursor_go_to_sync_views(self):
+        data = {"place": "сад", "time": "09:00", "action": "полив", "periodicity": 1, "execution_time": 60, "reward": "чай"}
+        response = await self.async_client.post("/api/async/habits/", data, content_type="application/json", headers=self.auth)
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.delete(f"/api/async/habits/{response.json()['id']}/", headers=self.auth)
+        self.assertEqual(response.status_code, 204)
+        await self._same("habits/?pagination=cursor&page_size=2")
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0, DEBUG=True)
+    async def test_middleware_chain_stays_async(self):
+        # sync-only middleware превратил бы всю цепочку ASGI в SyncToAsync
+        self.assertNotIsInstance(ASGIHandler()._middleware_chain, SyncToAsync)
+        response = await self.async_client.get("/api/async/habits/", headers=self.auth)
+        # запросы async ORM видны обоим middleware
+        count = int(response["X-Query-Count"])
+        self.assertGreater(count, 0)
+        self.assertIn("db;dur=", response["Server-Timing"])
+        self.assertIn(f'desc="{count} queries"', response["Server-Timing"])
+
+
+class TestQueryBudgets(APITestCase):
+    """Каждый эндпоинт укладывается в свой бюджет SQL-запросов (query_budgets у view)."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="budget")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.pleasant = self._habit("ванна", is_pleasant=True, reward=None, is_public=True)
+        self.habits = [self._habit(f"h{i}", linked_habit=self.pleasant, reward=None, is_public=True) for i in range(6)]
+
+    def _habit(self, action, **extra):
+        data = dict(user=self.user, place="дом", time=time(8, 0), action=action, periodicity=1, execution_time=30, reward="чай")
+        data.update(extra)
+        return Habit.objects.create(**data)
+
+    def _payload(self, **extra):
+        data = {"place": "сад", "time": "09:00", "action": "полив", "periodicity": 1, "execution_time": 60, "linked_habit": self.pleasant.id}
+        data.update(extra)
+        return data
+
+    def _call(self, action, method, url, data=None, expected=200):
+        with QueryBudget(HabitViewSet.query_budgets[action], action, strict=True):
+            r = getattr(self.client, method)(url, data, format="json")
+        self.assertEqual(r.status_code, expected, r.content)
+        return r
+
+    def test_read_endpoints(self):
+        self._call("list", "get", API)
+        self._call("list", "get", API + "?pagination=cursor&page_size=50")
+        self._call("retrieve", "get", f"{API}{self.habits[0].id}/")
+
+    def test_write_endpoints(self):
+        self._call("create", "post", API, self._payload(), expected=201)
+        self._call("partial_update", "patch", f"{API}{self.habits[0].id}/", {"place": "сад"})
+        self._call("update", "put", f"{API}{self.habits[1].id}/", self._payload())
+        self._call("destroy", "delete", f"{API}{self.habits[2].id}/", expected=204)
+        # приятная со ссылками: ещё обнуление linked_habit и отметка updated_at у ссылающихся
+        self._call("destroy", "delete", f"{API}{self.pleasant.id}/", expected=204)
+
+    def test_bulk(self):
+        ops = [{"op": "create", "data": self._payload()} for _ in range(5)]
+        ops += [{"op": "update", "id": h.id, "data": {"place": "сад"}} for h in self.habits[:3]]
+        ops += [{"op": "delete", "id": h.id} for h in self.habits[3:]]
+        self._call("bulk", "post", API + "bulk/", ops)
+
+    def test_bulk_delete_linked_pleasant(self):
+        # бюджет не зависит от числа удаляемых приятных привычек со ссылками
+        pleasant = [self._habit(f"p{i}", is_pleasant=True, reward=None, is_public=True) for i in range(40)]
+        linking = [self._habit(f"l{i}", linked_habit=p, reward=None) for i, p in enumerate(pleasant)]
+        before = Habit.objects.get(pk=linking[0].pk).updated_at
+        self._call("bulk", "post", API + "bulk/", [{"op": "delete", "id": h.id} for h in pleasant])
+        touched = Habit.objects.get(pk=linking[0].pk)
+        self.assertIsNone(touched.linked_habit_id)
+        self.assertGreater(touched.updated_at, before)
+
+    def test_completions(self):
+        url = f"{API}{self.habits[0].id}/"
+        self._call("complete", "post", url + "complete/", {}, expected=201)
+        self._call("complete", "post", url + "complete/", {}, expected=200)
+        self._call("streak", "get", url + "streak/")
+        self._call("stats", "get", API + "stats/")
+
+    def test_public_feed(self):
+        self.client.credentials()
+        with QueryBudget(PublicHabitListView.query_budget, "public", strict=True):
+            self.client.get("/api/public/")
+        with QueryBudget(0, "public (кэш)", strict=True):
+            self.client.get("/api/public/")
+
+    # все напоминания в один чат — снимаем лимит Telegram на чат, чтобы не ждать
+    @override_settings(TELEGRAM_PER_CHAT_RATE=1000)
+    def test_send_due_habits(self):
+        TelegramAccount.objects.create(user=self.user, chat_id="42")
+        today = timezone.localdate()
+
+        def tick(extra):
+            at = timezone.make_aware(datetime.combine(today, time(10, extra)))
+            with patch("django.utils.timezone.now", return_value=at - timedelta(hours=1)):
+                for i in range(extra):
+                    self._habit(f"due{i}", time=at.time())
+            with patch("django.utils.timezone.now", return_value=at), \
+                    patch("notifications.tasks.get_client", return_value=StubClient()):
+                with QueryBudget(send_due_habits.query_budget, "send_due_habits", strict=True) as budget:
+                    self.assertEqual(send_due_habits()["sent"], extra)
+            return budget.count
+
+        self.assertEqual(tick(2), tick(20))
+
+    @override_settings(TELEGRAM_PER_CHAT_RATE=1000)
+    def test_process_reminder_retries(self):
+        TelegramAccount.objects.create(user=self.user, chat_id="42")
+        today = timezone.localdate()
+
+        def tick(extra):
+            at = timezone.make_aware(datetime.combine(today, time(11, extra)))
+            with patch("django.utils.timezone.now", return_value=at - timedelta(hours=1)):
+                for i in range(extra):
+                    self._habit(f"retry{i}", time=at.time())
+            with patch("django.utils.timezone.now", return_value=at), \
+                    patch("notifications.tasks.get_client", return_value=StubClient(ok=False)):
+                send_due_habits()
+            with patch("django.utils.timezone.now", return_value=at + timedelta(minutes=1)), \
+                    patch("notifications.retry.get_client", return_value=StubClient()):
+                with QueryBudget(process_reminder_retries.query_budget, "process_reminder_retries", strict=True) as budget:
+                    self.assertEqual(process_reminder_retries()["sent"], extra)
+            return budget.count
+
+        self.assertEqual(tick(2), tick(20))
+
+    @override_settings(DEBUG=True)
+    def test_debug_middleware_reports_over_budget(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        r = client.get(API)
+        self.assertEqual(r["X-Query-Count"], "4")
+        with patch.dict(HabitViewSet.query_budgets, {"list": 1}), \
+                self.assertLogs("habit_tracker.querybudget", "WARNING") as logs:
+            client.get(API)
+        self.assertIn("HabitViewSet.list", logs.output[0])
+
+
+class TestServerTiming(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="timed")
+        Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="зарядка",
+            periodicity=1, execution_time=30, reward="чай", is_public=True,
+        )
+
+    def _client(self):
+        # middleware читает настройку при загрузке — нужен свежий клиент
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        return client
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_phases_in_header_and_log(self):
+        with self.assertLogs("habit_tracker.timing", "INFO") as logs:
+            r = self._client().get(API)
+        names = [part.split(";")[0] for part in r["Server-Timing"].split(", ")]
+        self.assertEqual(names, ["auth", "perm", "query", "serialize", "render", "version", "db", "total"])
+        self.assertIn('db;dur=', r["Server-Timing"])
+        self.assertIn('desc="4 queries"', r["Server-Timing"])
+
+        record = logs.records[0]
+        self.assertEqual(record.path, API)
+        self.assertEqual(record.db_queries, 4)
+        self.assertGreaterEqual(record.timing["total"], record.timing["serialize"])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_detail_and_public(self):
+        habit_id = Habit.objects.get().id
+        r = self._client().get(f"{API}{habit_id}/")
+        self.assertIn("query;dur=", r["Server-Timing"])
+        self.assertIn("serialize;dur=", r["Server-Timing"])
+        r = APIClient().get("/api/public/")
+        self.assertIn("cache;dur=", r["Server-Timing"])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.0)
+    def test_disabled(self):
+        self.assertNotIn("Server-Timing", self._client().get(API))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.5)
+    def test_sampling(self):
+        client = self._client()
+        with patch("habit_tracker.timing.random.random", side_effect=[0.9, 0.1]):
+            self.assertNotIn("Server-Timing", client.get(API))
+            self.assertIn("Server-Timing", client.get(API))
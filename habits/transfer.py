@@ -0,0 +1,184 @@
+import codecs
+import csv
+import json
+
+from .bulk import build_habit, prefetch_linked, write_habits
+from .models import Habit
+from .serializers import HabitReadSerializer
+
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Что выгружаем: всё, что принимает импорт, плюс id — на него ссылаются linked_habit
+EXPORT_FIELDS = (
+    "id", "place", "time", "action", "is_pleasant", "linked_habit",
+    "periodicity", "reward", "execution_time", "is_public",
+)
+EXPORT_CHUNK = 500
+IMPORT_BATCH = 500
+# Больше ошибок не перечисляем, только считаем
+MAX_REPORTED_ERRORS = 100
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def _rows(user):
+    """
+    Привычки пользователя keyset-порциями: сначала приятные, потом остальные,
+    чтобы при импорте строка со ссылкой шла после привычки, на которую ссылается.
+    """
+    serializer = HabitReadSerializer(fields=EXPORT_FIELDS)
+    for is_pleasant in (True, False):
+        queryset = Habit.objects.filter(user=user, is_pleasant=is_pleasant).order_by("id").values(*EXPORT_FIELDS)
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:EXPORT_CHUNK])
+            for row in chunk:
+                yield serializer.to_representation(row)
+            if len(chunk) < EXPORT_CHUNK:
+                break
+            last_id = chunk[-1]["id"]
+
+
+def export_lines(user, fmt):
+    """Строки выгрузки (str) — для StreamingHttpResponse; в памяти не больше порции."""
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for data in _rows(user):
+            yield writer.writerow([_csv_value(data[name]) for name in EXPORT_FIELDS])
+    else:
+        for data in _rows(user):
+            yield json.dumps(data, ensure_ascii=False) + "\n"
+
+
+def _text_lines(stream):
+    """Байтовый поток -> строки str; многобайтные символы на стыке кусков не рвутся."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    for chunk in iter(lambda: stream.read(64 * 1024), b""):
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        yield from (line + "\n" for line in lines)
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _parse_ndjson(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield number, None, {"non_field_errors": ["Строка — не JSON."]}
+            continue
+        if not isinstance(data, dict):
+            yield number, None, {"non_field_errors": ["Ожидается JSON-объект."]}
+            continue
+        yield number, data, None
+
+
+def _parse_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # пустое значение в CSV — отсутствие значения (null в NDJSON)
+        data = {key: value for key, value in row.items() if key and value != ""}
+        if None in row:
+            yield reader.line_num, None, {"non_field_errors": ["Лишние колонки в строке."]}
+            continue
+        yield reader.line_num, data, None
+
+
+class HabitImport:
+    """
+    Импорт выгрузки построчно: строки проверяются правилами одиночного API
+    (build_habit) и пишутся пачками по IMPORT_BATCH. Ошибочные строки
+    пропускаются и попадают в отчёт с номером строки; остальные сохраняются.
+    linked_habit из файла — id в выгрузке: ссылки на привычки из этого же файла
+    переводятся на новые id, остальные считаются id существующих привычек.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self._pending = []
+        self._pending_ids = set()
+        # id приятной привычки в выгрузке -> id после импорта
+        self._id_map = {}
+
+    def run(self, stream, fmt):
+        parse = _parse_csv if fmt == "csv" else _parse_ndjson
+        for line, data, errors in parse(_text_lines(stream)):
+            if errors:
+                self._error(line, errors)
+                continue
+            # ссылка на приятную привычку из ещё не записанной пачки — сначала пишем пачку
+            if self._ref(data.get("linked_habit")) in self._pending_ids:
+                self.flush()
+            self._pending.append((line, data))
+            if self._ref(data.get("id")) is not None:
+                self._pending_ids.add(self._ref(data["id"]))
+            if len(self._pending) >= IMPORT_BATCH:
+                self.flush()
+        self.flush()
+        return self.report()
+
+    @staticmethod
+    def _ref(value):
+        try:
+            return int(value) if value not in (None, "") and not isinstance(value, bool) else None
+        except (TypeError, ValueError):
+            return None
+
+    def _error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def flush(self):
+        pending, self._pending, self._pending_ids = self._pending, [], set()
+        if not pending:
+            return
+        for _, data in pending:
+            ref = self._ref(data.get("linked_habit"))
+            if ref in self._id_map:
+                data["linked_habit"] = self._id_map[ref]
+        prefetched = prefetch_linked(data for _, data in pending)
+
+        valid = []
+        for line, data in pending:
+            habit, errors = build_habit(self.request, data, prefetched)
+            if errors:
+                self._error(line, errors)
+            else:
+                valid.append((data, habit))
+        write_habits(creates=[habit for _, habit in valid])
+        self.created += len(valid)
+        for data, habit in valid:
+            ref = self._ref(data.get("id"))
+            if habit.is_pleasant and ref is not None:
+                self._id_map[ref] = habit.pk
+
+    def report(self):
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -1,12 +1,27 @@
+from django.conf import settings
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
+from . import async_views
 from .views import HabitViewSet, PublicHabitListView
 
 
 router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habit')
 
+# Async-вариант чтения (list/retrieve/публичная лента); остальные методы
+# эти view передают синхронным. Всегда доступны под /api/async/...,
+# при HABITS_ASYNC_READS — и по основным адресам.
+async_urlpatterns = [
+    path('habits/', async_views.habit_list),
+    path('habits/<int:pk>/', async_views.habit_detail),
+    path('public/', async_views.public_list),
+]
+
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls)),
     path('public/', PublicHabitListView.as_view(), name='public-habits'),
 ]
+
+if settings.HABITS_ASYNC_READS:
+    urlpatterns = async_urlpatterns + urlpatterns
@@ -1,31 +1,292 @@
-from rest_framework import viewsets, permissions, generics
-from .models import Habit
-from .serializers import HabitSerializer
-from habit_tracker.pagination import HabitPagination
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, generics, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from .analytics import user_stats
+from .bulk import apply_operations
+from .completions import record_completion, remove_completion, streak_summary
+from .conditional import collection_version, make_etag, not_modified, set_validators
+from .feed import get_page, set_page
+from .models import Habit, HabitStats
+from .serializers import (
+    HabitBulkOperationSerializer, HabitCompletionSerializer, HabitReadSerializer, HabitSerializer, HabitStatsQuerySerializer,
+    HabitStreakSerializer,
+)
+from .transfer import CONTENT_TYPES, FORMATS, HabitImport, export_lines
+from habit_tracker.pagination import SwitchableHabitPagination
+from habit_tracker.timing import ServerTimingMixin, get_timer
 from .permissions import IsOwnerOrReadOnly
 
+FMT_PARAMETER = openapi.Parameter("fmt", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(FORMATS))
 
-class HabitViewSet(viewsets.ModelViewSet):
+
+def read_fields(raw, param="fields"):
+    """Поля ответа по ?fields=a,b (None — все); id выбирается всегда."""
+    names = HabitReadSerializer.field_names()
+    if raw:
+        requested = {name.strip() for name in raw.split(",") if name.strip()}
+        unknown = requested - set(names)
+        if unknown:
+            raise ValidationError({param: f"Неизвестные поля: {', '.join(sorted(unknown))}."})
+        names = tuple(name for name in names if name == "id" or name in requested)
+    return names
+
+
+class ReadRowsMixin:
+    """
+    list/retrieve читают строки .values() и отдают их через HabitReadSerializer.
+    ?fields=a,b сужает и ответ, и SELECT; id выбирается всегда (ключ и курсор).
+    """
+    fields_query_param = "fields"
+    read_actions = ("list", "retrieve")
+    # что ещё нужно выбрать помимо выводимых полей (например, для ETag)
+    extra_read_fields = ()
+
+    def is_read_path(self):
+        # у обычных ListAPIView нет action — это всегда list
+        action = getattr(self, "action", "list")
+        return action in self.read_actions and not getattr(self, "swagger_fake_view", False)
+
+    def get_read_fields(self):
+        if not hasattr(self, "_read_fields"):
+            self._read_fields = read_fields(self.request.query_params.get(self.fields_query_param), self.fields_query_param)
+        return self._read_fields
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.is_read_path():
+            fields = self.get_read_fields()
+            queryset = queryset.values(*fields, *(f for f in self.extra_read_fields if f not in fields))
+        return queryset
+
+    def get_serializer_class(self):
+        if self.is_read_path():
+            return HabitReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_read_path():
+            kwargs["fields"] = self.get_read_fields()
+        return super().get_serializer(*args, **kwargs)
+
+
+class HabitViewSet(ServerTimingMixin, ReadRowsMixin, viewsets.ModelViewSet):
     """
     CRUD по привычкам текущего пользователя.
     """
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     serializer_class = HabitSerializer
-    pagination_class = HabitPagination
+    pagination_class = SwitchableHabitPagination
+    # "cursor" — keyset-страницы по умолчанию; ?pagination=... переопределяет
+    pagination_mode = "page"
+    extra_read_fields = ("updated_at",)
+    # Бюджеты SQL-запросов по action, включая выборку пользователя при JWT
+    # (habit_tracker.querybudget; проверяются тестами)
+    query_budgets = {
+        "list": 4,
+        "retrieve": 2,
+        "create": 3,
+        "update": 4,
+        "partial_update": 4,
+        # каскадом — журнал выполнений, свёртка, журнал доставки, повторы и недоставленные напоминания
+        "destroy": 10,
+        # + SAVEPOINT/RELEASE, когда вызван внутри внешней транзакции
+        "bulk": 15,
+        "complete": 8,
+        "streak": 2,
+        # версия списка + привычки + три агрегата по журналу; из кэша — 2
+        "stats": 6,
+        # выгрузка читает порции уже после view; импорт пишет пачками — зависит от файла
+        "export_habits": 1,
+        "import_habits": None,
+    }
 
     def get_queryset(self):
         # Сортировка нужна, чтобы не ловить UnorderedObjectListWarning при пагинации
-        return Habit.objects.filter(user=self.request.user).order_by("id")
+        queryset = Habit.objects.filter(user=self.request.user).order_by("id")
+        if getattr(self, "action", None) in ("complete", "streak"):
+            # свёртка серий приходит тем же запросом, что и привычка
+            queryset = queryset.select_related("stats")
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Версию списка проверяем до выборки и сериализации: на 304 больше ничего не делаем
+        with get_timer(request).phase("version"):
+            count, changed, deleted_at = collection_version(request.user)
+        last_modified = max(filter(None, (changed, deleted_at)))
+        etag = make_etag(request, request.user.pk, count, changed, deleted_at)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Строка, а не экземпляр модели: queryset уже ограничен владельцем,
+        # поэтому объектная проверка IsOwnerOrReadOnly здесь ничего не добавляет
+        timer = get_timer(request)
+        with timer.phase("query"):
+            row = get_object_or_404(self.filter_queryset(self.get_queryset()), pk=self.kwargs["pk"])
+        etag = make_etag(request, row["id"], row["updated_at"])
+        response = not_modified(request, etag, row["updated_at"])
+        if response is None:
+            with timer.phase("serialize"):
+                data = self.get_serializer(row).data
+            response = Response(data)
+        return set_validators(response, etag, row["updated_at"])
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_update(self, serializer):
+        # queryset уже отфильтрован по владельцу; подставляем загруженного пользователя,
+        # чтобы full_clean не проверял user_id отдельным запросом
+        serializer.save(user=self.request.user)
+
+    @swagger_auto_schema(
+        method="post", request_body=HabitCompletionSerializer,
+        responses={201: HabitStreakSerializer, 200: "Уже отмечено за эту дату"},
+    )
+    @swagger_auto_schema(
+        method="delete", query_serializer=HabitCompletionSerializer, responses={200: HabitStreakSerializer},
+    )
+    @action(detail=True, methods=["post", "delete"])
+    def complete(self, request, pk=None):
+        """
+        POST — отметить выполнение за дату (по умолчанию сегодня), DELETE — снять отметку.
+        Отвечает сериями и выполнением плана из свёртки HabitStats.
+        """
+        habit = self.get_object()
+        data = request.data if request.method == "POST" else request.query_params
+        serializer = HabitCompletionSerializer(data=data, context={"habit": habit})
+        serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data["date"]
+        if request.method == "POST":
+            stats, created = record_completion(habit, day)
+            code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        else:
+            stats = remove_completion(habit, day)
+            if stats is None:
+                return Response({"date": "За эту дату отметки нет."}, status=status.HTTP_404_NOT_FOUND)
+            code = status.HTTP_200_OK
+        return Response(HabitStreakSerializer(streak_summary(habit, stats)).data, status=code)
+
+    @swagger_auto_schema(responses={200: HabitStreakSerializer})
+    @action(detail=True, methods=["get"])
+    def streak(self, request, pk=None):
+        """Текущая и лучшая серии, выполнение плана — из свёртки, без чтения журнала."""
+        habit = self.get_object()
+        try:
+            stats = habit.stats
+        except HabitStats.DoesNotExist:
+            stats = None
+        return Response(HabitStreakSerializer(streak_summary(habit, stats)).data)
+
+    @swagger_auto_schema(query_serializer=HabitStatsQuerySerializer, responses={200: "Выполнение плана по дням, неделям и привычкам"})
+    @action(detail=False, methods=["get"])
+    def stats(self, request):
+        """
+        Выполнение плана по всем привычкам за последние ?days= дней (по умолчанию 365):
+        ряды по дням для тепловой карты, по неделям и по каждой привычке.
+        Кэшируется до следующей отметки или правки привычек.
+        """
+        params = HabitStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        with get_timer(request).phase("query"):
+            data = user_stats(request.user, params.validated_data["days"])
+        return Response(data)
 
-class PublicHabitListView(generics.ListAPIView):
+    def get_transfer_format(self, default="ndjson"):
+        fmt = self.request.query_params.get("fmt") or default
+        if fmt not in FORMATS:
+            raise ValidationError({"fmt": f"Формат: {', '.join(FORMATS)}."})
+        return fmt
+
+    @swagger_auto_schema(
+        manual_parameters=[FMT_PARAMETER],
+        responses={200: "NDJSON или CSV, потоком"},
+    )
+    @action(detail=False, methods=["get"], url_path="export")
+    def export_habits(self, request):
+        """
+        Все привычки пользователя одним потоком (?fmt=ndjson|csv): строки формируются
+        порциями по мере отправки, память не растёт с числом привычек.
+        ?fmt, а не ?format: format занят выбором рендерера DRF.
+        """
+        fmt = self.get_transfer_format()
+        response = StreamingHttpResponse(export_lines(request.user, fmt), content_type=f"{CONTENT_TYPES[fmt]}; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="habits.{fmt}"'
+        return response
+
+    @swagger_auto_schema(
+        manual_parameters=[FMT_PARAMETER],
+        responses={200: "Сколько создано и ошибки по строкам"},
+    )
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_habits(self, request):
+        """
+        Импорт выгрузки: тело запроса (application/x-ndjson, text/csv) или файл
+        в multipart-поле file. Файл читается построчно и пишется пачками;
+        строки с ошибками пропускаются и перечисляются в ответе с номером.
+        """
+        if request.content_type.startswith("multipart/"):
+            stream = request.FILES.get("file")
+            if stream is None:
+                raise ValidationError({"file": "Нужен файл выгрузки."})
+            default = "csv" if stream.name.lower().endswith(".csv") else "ndjson"
+        else:
+            stream = request.stream
+            default = "csv" if request.content_type.startswith("text/csv") else "ndjson"
+        if stream is None:
+            raise ValidationError("Пустой запрос.")
+        report = HabitImport(request).run(stream, self.get_transfer_format(default))
+        return Response(report, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        request_body=HabitBulkOperationSerializer(many=True),
+        responses={200: "Результаты по каждой операции", 400: "Ошибки по позициям, ничего не записано"},
+    )
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Пакет create/update/delete одной транзакцией.
+        Правила те же, что у одиночных запросов; при любой ошибке не пишем ничего.
+        """
+        operations = HabitBulkOperationSerializer(data=request.data, many=True)
+        operations.is_valid(raise_exception=True)
+        results, ok = apply_operations(request, operations.validated_data)
+        return Response(
+            {"results": results},
+            status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class PublicHabitListView(ServerTimingMixin, ReadRowsMixin, generics.ListAPIView):
     """
     Публичные привычки (is_public=True) для общего доступа.
     """
     queryset = Habit.objects.filter(is_public=True).order_by("id")
     serializer_class = HabitSerializer
-    pagination_class = HabitPagination
+    pagination_class = SwitchableHabitPagination
+    pagination_mode = "page"
     permission_classes = [permissions.AllowAny]
+    # COUNT + страница (+ пользователь, если пришёл с токеном); из кэша — 0
+    query_budget = 3
+
+    def list(self, request, *args, **kwargs):
+        # Готовые страницы ленты лежат в кэше; версию ключа сбрасывают сигналы Habit
+        if not settings.PUBLIC_FEED_CACHE_TTL:
+            return super().list(request, *args, **kwargs)
+        with get_timer(request).phase("cache"):
+            data = get_page(request)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+        response = super().list(request, *args, **kwargs)
+        set_page(request, response.data)
+        response["X-Cache"] = "MISS"
+        return response
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import TelegramAccount
+from .models import ReminderDeadLetter, ReminderDelivery, ReminderRetry, TelegramAccount, TelegramOffset
+from .retry import replay
 
 
 @admin.register(TelegramAccount)
@@ -7,3 +8,33 @@ class TelegramAccountAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "chat_id")  # убрали created_at
     search_fields = ("user__username", "chat_id")
     list_select_related = ("user",)
+
+
+@admin.register(ReminderDelivery)
+class ReminderDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "habit", "scheduled_for", "status", "sent_at")
+    list_filter = ("status",)
+    list_select_related = ("habit",)
+
+
+@admin.register(TelegramOffset)
+class TelegramOffsetAdmin(admin.ModelAdmin):
+    list_display = ("bot_id", "offset", "updated_at")
+
+
+@admin.register(ReminderRetry)
+class ReminderRetryAdmin(admin.ModelAdmin):
+    list_display = ("id", "habit", "scheduled_for", "attempts", "next_attempt_at", "expires_at", "last_error")
+    list_select_related = ("habit",)
+
+
+@admin.register(ReminderDeadLetter)
+class ReminderDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ("id", "habit", "scheduled_for", "reason", "attempts", "last_error", "failed_at")
+    list_filter = ("reason",)
+    list_select_related = ("habit",)
+    actions = ["replay_selected"]
+
+    @admin.action(description="Переотправить")
+    def replay_selected(self, request, queryset):
+        self.message_user(request, f"Возвращено в очередь повторов: {replay(queryset)}")
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+
+SEQ_KEY = "habit-changes:seq"
+# Сколько живёт запись ленты: если демон отстал сильнее, он перечитает день целиком
+CHANGE_TTL = 60 * 60
+
+
+def _entry_key(seq):
+    return f"habit-changes:{seq}"
+
+
+def publish_habit_changes(habit_ids):
+    """
+    Кладёт id изменённых привычек в ленту изменений в кэше.
+
+    Лента общая для процессов, если кэш общий (Redis): API пишет,
+    демон напоминаний читает. На locmem видна только внутри процесса.
+    """
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return
+    cache.add(SEQ_KEY, 0, timeout=None)
+    last = cache.incr(SEQ_KEY, len(habit_ids))
+    first = last - len(habit_ids) + 1
+    cache.set_many({_entry_key(seq): habit_id for seq, habit_id in zip(range(first, last + 1), habit_ids)}, timeout=CHANGE_TTL)
+
+
+class ChangeCursor:
+    """Позиция читателя в ленте изменений."""
+
+    def __init__(self):
+        self.position = cache.get(SEQ_KEY, 0)
+
+    def poll(self):
+        """
+        Возвращает (ids, complete). complete=False — часть записей уже истекла
+        (или кэш сбросили), и читателю нужно перечитать состояние целиком.
+        """
+        head = cache.get(SEQ_KEY, 0)
+        if head < self.position:
+            self.position = head
+            return set(), False
+        if head == self.position:
+            return set(), True
+        keys = [_entry_key(seq) for seq in range(self.position + 1, head + 1)]
+        values = cache.get_many(keys)
+        self.position = head
+        return set(values.values()), len(values) == len(keys)
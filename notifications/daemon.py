@@ -0,0 +1,139 @@
+import logging
+import time as time_module
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from habits.models import Habit
+from habits.schedule import reminder_window
+from notifications.changes import ChangeCursor
+from notifications.tasks import CHUNK_SIZE, ID_BATCH, deliver_due, roll_forward_missed
+from notifications.wheel import MINUTES_PER_DAY, TimingWheel
+
+logger = logging.getLogger(__name__)
+
+
+def minute_of_day(moment):
+    local = timezone.localtime(moment)
+    return local.hour * 60 + local.minute
+
+
+class ReminderDaemon:
+    """
+    Долгоживущий процесс рассылки вместо опроса БД из Celery beat.
+
+    Раз в сутки грузит расписание дня (id + next_due_at по индексу)
+    в колесо по минутам, дальше каждую минуту отправляет только слот
+    этой минуты. Изменения привычек приходят через ленту изменений
+    (сигналы Habit -> кэш), поэтому таблицу целиком больше не сканируем.
+    """
+
+    def __init__(self, sleep=time_module.sleep):
+        self.sleep = sleep
+        self.wheel = TimingWheel()
+        self.cursor = None
+        self.day = None
+        self.last_minute = -1
+        self.totals = Counter(sent=0, skipped=0, failed=0)
+
+    def _day_bounds(self, day):
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(day, time.min), tz)
+        return start, start + timedelta(days=1)
+
+    def load_day(self, now):
+        """Полная загрузка расписания на сегодняшний остаток дня."""
+        self.cursor = ChangeCursor()
+        self.day = now.date()
+        self.wheel.clear()
+
+        window_start, _ = reminder_window(now)
+        roll_forward_missed(window_start, now)
+
+        # вчерашние слоты (тик в 00:00) уже отработал вчерашний день
+        day_start, day_end = self._day_bounds(self.day)
+        load_from = max(window_start, day_start)
+        rows = (
+            Habit.objects.filter(next_due_at__gte=load_from, next_due_at__lt=day_end)
+            .order_by()
+            .values_list("id", "next_due_at")
+        )
+        for habit_id, due in rows.iterator(chunk_size=CHUNK_SIZE):
+            self.wheel.add(habit_id, minute_of_day(due))
+        self.last_minute = minute_of_day(load_from) - 1
+        logger.info("Расписание на %s: %s напоминаний", self.day, len(self.wheel))
+
+    def apply_changes(self, now):
+        """Переносит в колесе только привычки, изменившиеся с прошлого тика."""
+        ids, complete = self.cursor.poll()
+        if not complete:
+            logger.warning("Лента изменений потеряла записи — перечитываем день")
+            self.load_day(now)
+            return
+        if not ids:
+            return
+
+        for habit_id in ids:
+            self.wheel.discard(habit_id)
+        window_start, _ = reminder_window(now)
+        _, day_end = self._day_bounds(self.day)
+        ids = sorted(ids)
+        for i in range(0, len(ids), ID_BATCH):
+            rows = Habit.objects.filter(
+                id__in=ids[i:i + ID_BATCH], next_due_at__gte=window_start, next_due_at__lt=day_end
+            ).values_list("id", "next_due_at")
+            for habit_id, due in rows:
+                # слот, чья минута уже снята с колеса, — на ближайший тик: deliver_due по ids
+                # отправит его с опозданием
+                minute = max(minute_of_day(due), self.last_minute + 1)
+                if minute < MINUTES_PER_DAY:
+                    self.wheel.add(habit_id, minute)
+
+    def tick(self, now=None):
+        now = timezone.localtime(now)
+        if now.date() != self.day:
+            self.load_day(now)
+        else:
+            self.apply_changes(now)
+
+        current = minute_of_day(now)
+        due = []
+        for minute in range(self.last_minute + 1, current + 1):
+            due.extend(self.wheel.pop(minute))
+        self.last_minute = max(self.last_minute, current)
+
+        if not due:
+            return {"sent": 0, "skipped": 0, "failed": 0}
+
+        # после отставшего тика здесь и прошедшие минуты — deliver_due по ids шлёт их
+        # с опозданием; то, что не ушло, повторяет очередь повторов (notifications.retry)
+        counts = deliver_due(now, ids=due)
+        self.totals.update(counts)
+        return counts
+
+    @staticmethod
+    def check_change_feed():
+        """
+        Лента изменений живёт в кэше: на locmem (CACHE_URL не задан) правки
+        из процессов API демону не видны. Возвращает False и пишет warning.
+        """
+        if "LocMemCache" not in settings.CACHES["default"]["BACKEND"]:
+            return True
+        logger.warning(
+            "CACHE_URL не задан: лента изменений в locmem видна только этому процессу — "
+            "правки привычек через API демон увидит лишь при перезагрузке дня"
+        )
+        return False
+
+    def run_forever(self):
+        logger.info("Демон напоминаний запущен")
+        self.check_change_feed()
+        while True:
+            counts = self.tick()
+            if any(counts.values()):
+                logger.info("Тик: %s", counts)
+            # спим до начала следующей минуты
+            now = timezone.localtime()
+            self.sleep(60 - now.second - now.microsecond / 1_000_000)
@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.conf import settings
+
+from notifications.ingest import DONE_PREFIX
+from notifications.utils import OutgoingMessage
+
+# Лимиты Bot API: длина текста сообщения и кнопок inline-клавиатуры
+MAX_MESSAGE_LENGTH = 4096
+MAX_BUTTONS = 100
+BUTTON_TEXT_LENGTH = 40
+# запас под заголовок с номером части
+HEADER_RESERVE = 64
+
+
+class DigestBuilder:
+    """
+    Копит напоминания по чатам и собирает из них сообщения: одно на чат за окно,
+    длинные делятся на части по REMINDER_DIGEST_MAX_HABITS привычек и лимиту
+    длины текста. ref сообщения — кортеж id привычек, которые оно покрывает.
+    """
+
+    def __init__(self, max_habits=None):
+        max_habits = max_habits or settings.REMINDER_DIGEST_MAX_HABITS
+        self.max_habits = max(1, min(max_habits, MAX_BUTTONS))
+        self._chats = defaultdict(list)
+
+    def add(self, chat_id, habit_id, action, place):
+        self._chats[chat_id].append((habit_id, action, place))
+
+    def __len__(self):
+        return sum(len(items) for items in self._chats.values())
+
+    def _parts(self, items):
+        part, length = [], HEADER_RESERVE
+        for item in items:
+            line = len(_line(item)) + 1
+            if part and (len(part) >= self.max_habits or length + line > MAX_MESSAGE_LENGTH):
+                yield part
+                part, length = [], HEADER_RESERVE
+            part.append(item)
+            length += line
+        if part:
+            yield part
+
+    def messages(self):
+        messages = []
+        for chat_id, items in self._chats.items():
+            parts = list(self._parts(items))
+            for number, part in enumerate(parts, start=1):
+                messages.append(_render(chat_id, part, number, len(parts)))
+        return messages
+
+
+def _line(item):
+    _, action, place = item
+    return f"• {action} в {place}"
+
+
+def _render(chat_id, part, number, total):
+    ids = tuple(habit_id for habit_id, _, _ in part)
+    if len(part) == 1 and total == 1:
+        habit_id, action, place = part[0]
+        return OutgoingMessage(
+            chat_id, f"Напоминание: {action} в {place} — сейчас!", ref=ids,
+            # нажатие приходит воркеру приёма обновлений (notifications.ingest)
+            buttons=(("Выполнено", f"{DONE_PREFIX}{habit_id}"),),
+        )
+    header = "Напоминания — сейчас:" if total == 1 else f"Напоминания — сейчас ({number}/{total}):"
+    text = "\n".join([header, *map(_line, part)])
+    buttons = tuple(
+        (f"✅ {action}"[:BUTTON_TEXT_LENGTH], f"{DONE_PREFIX}{habit_id}") for habit_id, action, _ in part
+    )
+    return OutgoingMessage(chat_id, text, ref=ids, buttons=buttons)
@@ -0,0 +1,240 @@
+import logging
+import time as time_module
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from habits.completions import record_completions
+from habits.models import Habit
+from notifications import metrics
+from notifications.linking import read_link_token
+from notifications.models import TelegramAccount, TelegramOffset
+from notifications.ratelimit import OutboundQueue
+from notifications.utils import OutgoingMessage, TelegramAPIError, get_client
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_UPDATES = ("message", "callback_query")
+DONE_PREFIX = "done:"
+# Пауза после ошибки getUpdates, удваивается до MAX_BACKOFF
+BACKOFF = 1
+MAX_BACKOFF = 60
+
+LINKED_TEXT = "Готово: напоминания о привычках будут приходить в этот чат."
+BAD_LINK_TEXT = "Ссылка для привязки недействительна или устарела — получите новую в приложении."
+START_TEXT = "Чтобы получать напоминания, откройте ссылку привязки из приложения."
+DONE_TEXT = "Отмечено ✅"
+ALREADY_DONE_TEXT = "Уже отмечено"
+UNKNOWN_HABIT_TEXT = "Привычка не найдена"
+BAD_DAY_TEXT = "За этот день отметить нельзя"
+
+
+@dataclass
+class UpdateBatch:
+    """Что нужно сделать по пачке обновлений; заполняется parse_updates без запросов к БД."""
+
+    next_offset: int
+    # (user_id, chat_id) в порядке обновлений
+    links: list = field(default_factory=list)
+    # chat_id -> ответ на /start, если привязки не будет
+    replies: dict = field(default_factory=dict)
+    # (callback_query_id, chat_id, habit_id или None, день)
+    callbacks: list = field(default_factory=list)
+
+
+def _chat_id(chat):
+    return str(chat["id"]) if chat and "id" in chat else None
+
+
+def _local_date(unix_time):
+    return timezone.localdate(datetime.fromtimestamp(unix_time, tz=dt_timezone.utc))
+
+
+def parse_updates(updates, offset):
+    """Разбирает пачку: /start <токен> — привязка, callback done:<id> — выполнение."""
+    batch = UpdateBatch(next_offset=offset)
+    for update in updates:
+        batch.next_offset = max(batch.next_offset, update["update_id"] + 1)
+        message = update.get("message")
+        if message:
+            chat_id = _chat_id(message.get("chat"))
+            command, _, argument = (message.get("text") or "").partition(" ")
+            # в группах команда приходит как /start@имя_бота
+            if chat_id is None or command.split("@")[0] != "/start":
+                continue
+            user_id = read_link_token(argument.strip()) if argument.strip() else None
+            if user_id is None:
+                batch.replies[chat_id] = BAD_LINK_TEXT if argument.strip() else START_TEXT
+            else:
+                batch.links.append((user_id, chat_id))
+                batch.replies.pop(chat_id, None)
+            continue
+
+        callback = update.get("callback_query")
+        if callback:
+            data = callback.get("data") or ""
+            reminder = callback.get("message") or {}
+            chat_id = _chat_id(reminder.get("chat")) or _chat_id(callback.get("from"))
+            habit_id = None
+            if data.startswith(DONE_PREFIX) and data[len(DONE_PREFIX):].isdigit():
+                habit_id = int(data[len(DONE_PREFIX):])
+            # выполнение — за день напоминания, даже если кнопку нажали позже
+            day = _local_date(reminder["date"]) if reminder.get("date") else timezone.localdate()
+            batch.callbacks.append((callback["id"], chat_id, habit_id, day))
+    return batch
+
+
+def _resolve_links(links):
+    """Последняя привязка побеждает: у пользователя один чат, у чата один пользователь."""
+    user_chat, chat_user = {}, {}
+    for user_id, chat_id in links:
+        old_chat = user_chat.pop(user_id, None)
+        if old_chat is not None:
+            chat_user.pop(old_chat, None)
+        old_user = chat_user.pop(chat_id, None)
+        if old_user is not None:
+            user_chat.pop(old_user, None)
+        user_chat[user_id] = chat_id
+        chat_user[chat_id] = user_id
+    return user_chat
+
+
+def apply_links(links):
+    """
+    Upsert TelegramAccount пачкой. Чат, который теперь принадлежит другому
+    пользователю, сначала отвязывается. Возвращает привязанные {user_id: chat_id}.
+    """
+    user_chat = _resolve_links(links)
+    existing = set(get_user_model().objects.filter(pk__in=user_chat).values_list("pk", flat=True))
+    user_chat = {user_id: chat_id for user_id, chat_id in user_chat.items() if user_id in existing}
+    if not user_chat:
+        return {}
+    stale = [
+        pk
+        for pk, user_id, chat_id in TelegramAccount.objects.filter(chat_id__in=user_chat.values()).values_list("pk", "user_id", "chat_id")
+        if user_chat.get(user_id) != chat_id
+    ]
+    if stale:
+        TelegramAccount.objects.filter(pk__in=stale).delete()
+    TelegramAccount.objects.bulk_create(
+        [TelegramAccount(user_id=user_id, chat_id=chat_id) for user_id, chat_id in user_chat.items()],
+        update_conflicts=True, unique_fields=["user"], update_fields=["chat_id"],
+    )
+    return user_chat
+
+
+def apply_completions(callbacks):
+    """
+    Отметки из кнопок пачкой, по правилам POST /habits/{id}/complete/: привычка
+    владельца чата, не приятная, день — не раньше её создания и не в будущем.
+    Возвращает ({callback_query_id: текст ответа}, сколько отмечено).
+    """
+    requested = {(chat_id, habit_id) for _, chat_id, habit_id, _ in callbacks if habit_id is not None and chat_id}
+    created_on = {}
+    if requested:
+        created_on = {
+            (chat_id, habit_id): created_at
+            for chat_id, habit_id, created_at in Habit.objects.filter(
+                pk__in={habit_id for _, habit_id in requested},
+                user__telegram__chat_id__in={chat_id for chat_id, _ in requested},
+                is_pleasant=False,
+            ).values_list("user__telegram__chat_id", "pk", "created_at")
+        }
+    today = timezone.localdate()
+    answers, marks = {}, set()
+    for callback_id, chat_id, habit_id, day in callbacks:
+        if (chat_id, habit_id) not in created_on:
+            answers[callback_id] = UNKNOWN_HABIT_TEXT
+        elif not created_on[chat_id, habit_id] <= day <= today:
+            answers[callback_id] = BAD_DAY_TEXT
+        else:
+            marks.add((habit_id, day))
+    created = record_completions(marks)
+    for callback_id, chat_id, habit_id, day in callbacks:
+        if callback_id not in answers:
+            answers[callback_id] = DONE_TEXT if (habit_id, day) in created else ALREADY_DONE_TEXT
+    return answers, len(created)
+
+
+class UpdateIngestor:
+    """
+    Воркер приёма обновлений бота: getUpdates long polling пачками до
+    TELEGRAM_UPDATES_LIMIT. Пачка применяется целиком в одной транзакции —
+    upsert привязок, отметки выполнения и новый offset, — а ответы (сообщения
+    о привязке, answerCallbackQuery) уходят после коммита.
+    """
+
+    def __init__(self, client=None, poll_timeout=None, limit=None, sleep=time_module.sleep):
+        self.client = client or get_client()
+        self.poll_timeout = settings.TELEGRAM_POLL_TIMEOUT if poll_timeout is None else poll_timeout
+        self.limit = limit or settings.TELEGRAM_UPDATES_LIMIT
+        self.sleep = sleep
+        # offset хранится на бота: id бота — часть токена до ':'
+        self.bot_id = (self.client.token or "").split(":")[0]
+        self.offset = None
+        self.totals = Counter(updates=0, linked=0, completed=0)
+
+    def load_offset(self):
+        self.offset = TelegramOffset.objects.filter(bot_id=self.bot_id).values_list("offset", flat=True).first() or 0
+        return self.offset
+
+    def apply(self, updates):
+        """Применяет пачку; возвращает счётчики. Повтор той же пачки ничего не удваивает."""
+        if self.offset is None:
+            self.load_offset()
+        batch = parse_updates(updates, self.offset)
+        with transaction.atomic():
+            linked = apply_links(batch.links)
+            answers, completed = apply_completions(batch.callbacks)
+            TelegramOffset.objects.update_or_create(bot_id=self.bot_id, defaults={"offset": batch.next_offset})
+        self.offset = batch.next_offset
+
+        replies = {chat_id: LINKED_TEXT for chat_id in linked.values()}
+        replies.update(batch.replies)
+        if replies:
+            queue = OutboundQueue(self.client)
+            queue.extend(OutgoingMessage(chat_id, text) for chat_id, text in replies.items())
+            queue.drain()
+        if answers:
+            self.client.call_many(
+                "answerCallbackQuery", [{"callback_query_id": cid, "text": text} for cid, text in answers.items()],
+            )
+
+        counts = {"updates": len(updates), "linked": len(linked), "completed": completed}
+        self.totals.update(counts)
+        metrics.inc("updates", counts["updates"])
+        metrics.inc("linked", counts["linked"])
+        metrics.inc("completed_from_chat", counts["completed"])
+        metrics.flush()
+        return counts
+
+    def poll_once(self):
+        if self.offset is None:
+            self.load_offset()
+        updates = self.client.get_updates(self.offset, timeout=self.poll_timeout, limit=self.limit, allowed_updates=ALLOWED_UPDATES)
+        if not updates:
+            return {"updates": 0, "linked": 0, "completed": 0}
+        return self.apply(updates)
+
+    def run_forever(self):
+        logger.info("Приём обновлений Telegram запущен (бот %s)", self.bot_id)
+        backoff = BACKOFF
+        while True:
+            try:
+                counts = self.poll_once()
+            except (requests.RequestException, TelegramAPIError) as exc:
+                # 409 — у бота включён webhook или getUpdates опрашивает другой процесс
+                wait = getattr(exc, "retry_after", None) or backoff
+                logger.warning("getUpdates: %s; повтор через %s с", exc, wait)
+                self.sleep(wait)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = BACKOFF
+            if counts["updates"]:
+                logger.info("Пачка обновлений: %s", counts)
@@ -0,0 +1,74 @@
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from notifications.models import ReminderDelivery
+
+# Порция для удаления по списку id — ниже лимита параметров SQLite
+RELEASE_BATCH = 500
+# Захваты, переданные очереди повторов (notifications.retry)
+RETRY_TOKEN = "retry"
+
+
+def claim(slots):
+    """
+    Захватывает напоминания {habit_id: слот}. Insert-or-ignore по уникальному
+    (habit, scheduled_for): чужие захваты молча пропускаются, и на SQLite,
+    и на PostgreSQL (ON CONFLICT DO NOTHING).
+    Возвращает (token, множество id, захваченных этим вызовом).
+    """
+    if not slots:
+        return None, set()
+    token = uuid.uuid4().hex
+    ReminderDelivery.objects.bulk_create(
+        [ReminderDelivery(habit_id=habit_id, scheduled_for=slot, claim_token=token) for habit_id, slot in slots.items()],
+        ignore_conflicts=True,
+    )
+    # ignore_conflicts не возвращает, что вставилось, — перечитываем свои строки по токену
+    claimed = set(ReminderDelivery.objects.filter(claim_token=token).values_list("habit_id", flat=True))
+    return token, claimed
+
+
+def defer(token, habit_ids):
+    """Передаёт захват неотправленных очереди повторов: минутная рассылка их больше не шлёт."""
+    habit_ids = list(habit_ids)
+    for i in range(0, len(habit_ids), RELEASE_BATCH):
+        ReminderDelivery.objects.filter(claim_token=token, habit_id__in=habit_ids[i:i + RELEASE_BATCH]).update(claim_token=RETRY_TOKEN)
+
+
+def slots_q(slots):
+    """Условие «одна из пар (habit_id, слот)»."""
+    return reduce(or_, (Q(habit_id=habit_id, scheduled_for=slot) for habit_id, slot in slots))
+
+
+def hold(slots):
+    """Захватывает пары (habit_id, слот) за очередью повторов; уже отправленные не трогает."""
+    ReminderDelivery.objects.bulk_create(
+        [ReminderDelivery(habit_id=habit_id, scheduled_for=slot, claim_token=RETRY_TOKEN) for habit_id, slot in slots],
+        ignore_conflicts=True,
+    )
+
+
+def mark_slots_sent(slots, now):
+    """Повторы доставлены: захваты очереди для пар (habit_id, слот) — в отправленные."""
+    slots = list(slots)
+    # на пару — по два параметра
+    for i in range(0, len(slots), RELEASE_BATCH // 2):
+        ReminderDelivery.objects.filter(slots_q(slots[i:i + RELEASE_BATCH // 2]), claim_token=RETRY_TOKEN).update(
+            status=ReminderDelivery.SENT, sent_at=now,
+        )
+
+
+def mark_sent(token, now):
+    """Все оставшиеся захваты токена — доставлены (неудачные к этому моменту переданы очереди через defer)."""
+    return ReminderDelivery.objects.filter(claim_token=token, status=ReminderDelivery.CLAIMED).update(
+        status=ReminderDelivery.SENT, sent_at=now,
+    )
+
+
+def prune(before):
+    """Удаляет записи журнала о слотах раньше `before`."""
+    deleted, _ = ReminderDelivery.objects.filter(scheduled_for__lt=before).delete()
+    return deleted
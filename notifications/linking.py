@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core import signing
+
+SALT = "notifications.telegram-link"
+
+
+def _signer():
+    return signing.TimestampSigner(salt=SALT)
+
+
+def make_link_token(user):
+    """
+    Подписанный id пользователя для /start: «id_время_подпись».
+    В параметре start Telegram допускает только [A-Za-z0-9_-] и до 64 символов,
+    поэтому разделители подписи ':' заменены на '_'.
+    """
+    return _signer().sign(str(user.pk)).replace(":", "_")
+
+
+def read_link_token(token):
+    """id пользователя из токена или None (подделан, испорчен, истёк TELEGRAM_LINK_MAX_AGE)."""
+    parts = token.split("_", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        value = _signer().unsign(":".join(parts), max_age=settings.TELEGRAM_LINK_MAX_AGE)
+        return int(value)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def link_url(token):
+    """Ссылка https://t.me/<бот>?start=<токен>, если известно имя бота."""
+    if not settings.TELEGRAM_BOT_USERNAME:
+        return None
+    return f"https://t.me/{settings.TELEGRAM_BOT_USERNAME}?start={token}"
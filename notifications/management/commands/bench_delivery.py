@@ -0,0 +1,162 @@
+import json
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from habit_tracker.benchmarking import isolated_database, percentiles
+from habits.models import Habit
+from notifications import utils
+from notifications.models import ReminderDeadLetter, ReminderRetry, TelegramAccount
+from notifications.tasks import send_due_habits
+from notifications.testing import FakeBotAPIServer
+from notifications.utils import TelegramClient
+
+BATCH = 2000
+# слот всех напоминаний замера; тик — через секунду после него
+SLOT = time(9, 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет N напоминаний через настоящий путь send_due_habits -> TelegramClient -> HTTP "
+        "до локальной заглушки Bot API с заданной задержкой, долей 5xx и 429. Меряет сообщения/с, "
+        "перцентили sendMessage и сколько соединений открыл клиент. Результат — JSON для сравнения прогонов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reminders", type=int, default=5000)
+        parser.add_argument("--per-chat", type=int, default=1, help="Напоминаний на чат (больше 1 — дайджесты)")
+        parser.add_argument("--latency-ms", type=float, default=50, help="Задержка ответа заглушки")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Разброс задержки ±")
+        parser.add_argument("--error-rate", type=float, default=0, help="Доля ответов 500")
+        parser.add_argument("--throttle-rate", type=float, default=0, help="Доля ответов 429")
+        parser.add_argument("--retry-after", type=float, default=1, help="retry_after в ответах 429, секунды")
+        parser.add_argument("--concurrency", type=int, help="TELEGRAM_CONCURRENCY на время замера")
+        parser.add_argument(
+            "--global-rate", type=float, default=0,
+            help="TELEGRAM_GLOBAL_RATE на время замера (0 — без лимита: меряем клиент, а не ожидание токенов)",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Куда записать JSON (по умолчанию bench_delivery_<дата-время>.json)")
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        now = timezone.make_aware(datetime.combine(day, SLOT)) + timedelta(seconds=1)
+        limits = {"TELEGRAM_GLOBAL_RATE": options["global_rate"] or 1e9, "REMINDER_SHARDS": 1}
+        if options["concurrency"]:
+            limits["TELEGRAM_CONCURRENCY"] = options["concurrency"]
+
+        api = FakeBotAPIServer(
+            token="bench:token", latency=options["latency_ms"] / 1000, jitter=options["jitter_ms"] / 1000,
+            error_rate=options["error_rate"], throttle_rate=options["throttle_rate"],
+            retry_after=options["retry_after"], seed=options["seed"], keep_messages=False,
+        )
+        with isolated_database(), api, override_settings(
+            TELEGRAM_API_URL=api.base_url, TELEGRAM_BOT_TOKEN=api.token, **limits,
+        ):
+            dataset = self._seed(options["reminders"], options["per_chat"], now)
+            self.stdout.write(f"данные: {dataset['reminders']} напоминаний в {dataset['chats']} чатов")
+            report = self._deliver(api, now)
+            report["concurrency"] = settings.TELEGRAM_CONCURRENCY
+
+        report.update(
+            started_at=timezone.now().isoformat(),
+            params={
+                k: options[k] for k in (
+                    "reminders", "per_chat", "latency_ms", "jitter_ms", "error_rate", "throttle_rate",
+                    "retry_after", "global_rate", "seed",
+                )
+            },
+            dataset=dataset,
+        )
+        output = options["output"] or f"bench_delivery_{timezone.localtime():%Y%m%d-%H%M%S}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        latency, server = report["latency_ms"], report["server"]
+        self.stdout.write(
+            f"отправлено: {report['sent']} напоминаний, {server['delivered']} сообщений за {report['seconds']} с "
+            f"— {report['messages_per_second']} сообщ/с\n"
+            f"sendMessage, мс: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}\n"
+            f"запросов: {report['requests']}, параллельно: {report['concurrency']}, соединений открыто: {server['connections']}, "
+            f"429: {server['throttled']}, 5xx: {server['errors']}\n"
+            f"в очереди повторов: {report['retry_queued']}, недоставленных: {report['dead_lettered']}\n"
+            f"результат: {output}"
+        )
+
+    def _seed(self, reminders, per_chat, now):
+        User = get_user_model()
+        per_chat = max(per_chat, 1)
+        chats = -(-reminders // per_chat)
+        users = User.objects.bulk_create(
+            [User(username=f"bench-{i}", password="!") for i in range(chats)], batch_size=BATCH,
+        )
+        TelegramAccount.objects.bulk_create(
+            [TelegramAccount(user=u, chat_id=str(10_000 + u.pk)) for u in users], batch_size=BATCH,
+        )
+        # bulk_create не вызывает save(), слот ставим сами
+        slot = timezone.make_aware(datetime.combine(now.date(), SLOT))
+        with patch("django.utils.timezone.now", return_value=now - timedelta(hours=1)):
+            Habit.objects.bulk_create(
+                [
+                    Habit(
+                        user=users[i // per_chat], place="дом", action=f"привычка {i}", time=SLOT,
+                        reward="награда", periodicity=1, execution_time=60, next_due_at=slot,
+                    )
+                    for i in range(reminders)
+                ],
+                batch_size=BATCH,
+            )
+        return {"reminders": reminders, "chats": chats}
+
+    def _deliver(self, api, now):
+        # свежий клиент из новых настроек: пул соединений считаем с нуля
+        utils._client = None
+        durations = []
+        lock = threading.Lock()
+        send = TelegramClient.send
+
+        def timed_send(client, message):
+            t0 = time_module.perf_counter()
+            try:
+                return send(client, message)
+            finally:
+                elapsed = time_module.perf_counter() - t0
+                with lock:
+                    durations.append(elapsed)
+
+        try:
+            with patch("django.utils.timezone.now", return_value=now), \
+                    patch.object(TelegramClient, "send", timed_send):
+                started = time_module.perf_counter()
+                counts = send_due_habits()
+                seconds = time_module.perf_counter() - started
+        finally:
+            if utils._client is not None:
+                utils._client.close()
+            utils._client = None
+
+        latencies = [d * 1000 for d in durations]
+        return {
+            **counts,
+            "seconds": round(seconds, 3),
+            "messages_per_second": round(api.delivered / seconds, 1) if seconds else 0.0,
+            "requests": len(durations),
+            "latency_ms": {
+                **{k: round(v, 2) for k, v in percentiles(latencies).items()},
+                "max": round(max(latencies, default=0), 2),
+            },
+            "server": {
+                "delivered": api.delivered, "connections": api.connections,
+                "throttled": api.rejected, "errors": api.errors,
+            },
+            "retry_queued": ReminderRetry.objects.count(),
+            "dead_lettered": ReminderDeadLetter.objects.count(),
+        }
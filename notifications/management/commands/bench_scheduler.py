@@ -0,0 +1,201 @@
+import json
+import random
+import resource
+import time as time_module
+import tracemalloc
+from datetime import datetime, time, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from habit_tracker.benchmarking import isolated_database, percentiles
+from habit_tracker.querybudget import QueryBudget
+from habits.models import Habit
+from habits.schedule import compute_next_due
+from notifications.daemon import ReminderDaemon
+from notifications.models import TelegramAccount
+from notifications.tasks import send_due_habits
+from notifications.testing import StubClient
+
+# Пики времени напоминаний: (доля, центр в минутах от полуночи, разброс в минутах)
+TIME_PEAKS = ((0.4, 7 * 60 + 30, 45), (0.2, 13 * 60, 60), (0.3, 21 * 60, 60))
+PERIODICITY_WEIGHTS = {1: 60, 2: 10, 3: 10, 4: 2, 5: 2, 6: 1, 7: 15}
+PLEASANT_SHARE = 0.15
+WITH_CHAT_SHARE = 0.95
+BATCH = 2000
+
+
+def random_minute(rng):
+    roll = rng.random()
+    for share, center, spread in TIME_PEAKS:
+        if roll < share:
+            return min(max(int(rng.gauss(center, spread)), 0), 24 * 60 - 1)
+        roll -= share
+    return rng.randrange(24 * 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сутки минутных тиков рассылки (1440) на синтетических данных во временной БД: "
+        "задержка тика, запросы на тик, пик памяти, сколько отправлено. Результат — JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--habits-per-user", type=int, default=5, help="В среднем; фактически 1..2N-1")
+        parser.add_argument("--mode", choices=("beat", "daemon"), default="beat",
+                            help="beat — send_due_habits каждую минуту, daemon — ReminderDaemon.tick")
+        parser.add_argument(
+            "--times-per-user", type=int, default=0,
+            help="Сколько разных времён у привычек пользователя (0 — у каждой своё); на одно время — один дайджест",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Куда записать JSON (по умолчанию bench_scheduler_<дата-время>.json)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        day = timezone.localdate()
+        tz = timezone.get_current_timezone()
+        day_start = timezone.make_aware(datetime.combine(day, time.min), tz)
+
+        # Лимиты Telegram здесь не меряем: отправка — заглушка, ждать токенов незачем
+        with isolated_database(), override_settings(
+            TELEGRAM_GLOBAL_RATE=1e9, TELEGRAM_PER_CHAT_RATE=1e9, REMINDER_SHARDS=1,
+        ):
+            dataset = self._seed(
+                rng, options["users"], options["habits_per_user"], day, day_start, options["times_per_user"],
+            )
+            self.stdout.write(
+                f"данные: {dataset['users']} польз., {dataset['habits']} привычек, "
+                f"ожидается напоминаний за день: {dataset['expected']}"
+            )
+            report = self._replay(options["mode"], day_start)
+
+        report.update(
+            mode=options["mode"],
+            started_at=timezone.now().isoformat(),
+            params={k: options[k] for k in ("users", "habits_per_user", "times_per_user", "seed")},
+            dataset=dataset,
+        )
+        output = options["output"] or f"bench_scheduler_{timezone.localtime():%Y%m%d-%H%M%S}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        latency, queries = report["latency_ms"], report["queries_per_tick"]
+        self.stdout.write(
+            f"тиков: {report['ticks']}, отправлено: {report['sent']} (пропущено {report['skipped']}, "
+            f"ошибок {report['failed']}) за {report['seconds']} с\n"
+            f"сообщений: {report['messages']}, в пиковую минуту: {report['peak_minute']['messages']} "
+            f"на {report['peak_minute']['sent']} напоминаний\n"
+            f"тик, мс: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}\n"
+            f"запросов на тик: p50 {queries['p50']}  p95 {queries['p95']}  max {queries['max']}  всего {queries['total']}\n"
+            f"пик памяти (tracemalloc): {report['peak_memory_kb']} КБ, max RSS: {report['max_rss_kb']} КБ\n"
+            f"результат: {output}"
+        )
+
+    def _seed(self, rng, users, per_user, day, day_start, times_per_user=0):
+        User = get_user_model()
+        created_users = User.objects.bulk_create(
+            [User(username=f"bench-{i}", password="!") for i in range(users)], batch_size=BATCH,
+        )
+        TelegramAccount.objects.bulk_create(
+            [TelegramAccount(user=u, chat_id=str(10_000 + u.pk)) for u in created_users if rng.random() < WITH_CHAT_SHARE],
+            batch_size=BATCH,
+        )
+        with_chat = set(TelegramAccount.objects.values_list("user_id", flat=True))
+
+        periods, weights = zip(*PERIODICITY_WEIGHTS.items())
+        habits = []
+        for user in created_users:
+            times = [random_minute(rng) for _ in range(times_per_user)]
+            for _ in range(rng.randint(1, max(2 * per_user - 1, 1))):
+                minute = rng.choice(times) if times else random_minute(rng)
+                pleasant = rng.random() < PLEASANT_SHARE
+                habits.append(Habit(
+                    user=user, place="дом", action="привычка", time=time(minute // 60, minute % 60),
+                    is_pleasant=pleasant, reward=None if pleasant else "награда",
+                    periodicity=rng.choices(periods, weights)[0], execution_time=60,
+                ))
+        Habit.objects.bulk_create(habits, batch_size=BATCH)
+
+        # auto_now_add ставит сегодня — раскидываем даты создания, чтобы периодичность работала
+        expected = 0
+        day_end = day_start + timedelta(days=1)
+        for habit in habits:
+            habit.created_at = day - timedelta(days=rng.randrange(30))
+            habit.next_due_at = None if habit.is_pleasant else compute_next_due(
+                habit.created_at, habit.time, habit.periodicity, now=day_start,
+            )
+            if habit.next_due_at and habit.next_due_at < day_end and habit.user_id in with_chat:
+                expected += 1
+        Habit.objects.bulk_update(habits, ["created_at", "next_due_at"], batch_size=BATCH)
+        return {"users": users, "with_chat": len(with_chat), "habits": len(habits), "expected": expected}
+
+    def _replay(self, mode, day_start):
+        clock = {"now": day_start}
+        client = StubClient()
+        # без накопления отправленного: память меряем у планировщика, а не у заглушки
+        client.sent = _Discard()
+        daemon = ReminderDaemon(sleep=lambda seconds: None) if mode == "daemon" else None
+
+        latencies, query_counts, ticks = [], [], []
+        totals = {"sent": 0, "skipped": 0, "failed": 0}
+        peak_minute = {"sent": 0, "messages": 0}
+        tracemalloc.start()
+        started = time_module.perf_counter()
+        with patch("django.utils.timezone.now", new=lambda: clock["now"]), \
+                patch("notifications.tasks.get_client", return_value=client):
+            for minute in range(24 * 60):
+                # beat срабатывает в начале минуты
+                clock["now"] = day_start + timedelta(minutes=minute, seconds=1)
+                t0 = time_module.perf_counter()
+                messages_before = client.sent.count
+                with QueryBudget(None, "tick") as budget:
+                    counts = daemon.tick(clock["now"]) if daemon else send_due_habits()
+                elapsed = (time_module.perf_counter() - t0) * 1000
+                latencies.append(elapsed)
+                query_counts.append(budget.count)
+                ticks.append((elapsed, minute, budget.count, counts["sent"]))
+                for key in totals:
+                    totals[key] += counts[key]
+                # пиковая минута: сколько напоминаний и сколько вызовов sendMessage на них
+                if counts["sent"] > peak_minute["sent"]:
+                    peak_minute = {"sent": counts["sent"], "messages": client.sent.count - messages_before}
+        seconds = time_module.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        slowest = sorted(ticks, reverse=True)[:5]
+        return {
+            "ticks": len(latencies),
+            **totals,
+            # сообщений меньше напоминаний: дайджест на чат за окно
+            "messages": client.sent.count,
+            "peak_minute": peak_minute,
+            "seconds": round(seconds, 2),
+            "latency_ms": {
+                **{k: round(v, 2) for k, v in percentiles(latencies).items()},
+                "max": round(max(latencies), 2),
+                "mean": round(sum(latencies) / len(latencies), 2),
+            },
+            "queries_per_tick": {**percentiles(query_counts), "max": max(query_counts), "total": sum(query_counts)},
+            "peak_memory_kb": peak // 1024,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "slowest_ticks": [
+                {"minute": f"{m // 60:02d}:{m % 60:02d}", "ms": round(ms, 2), "queries": q, "sent": sent}
+                for ms, m, q, sent in slowest
+            ],
+        }
+
+
+class _Discard:
+    """Вместо списка отправленного — только счётчик сообщений."""
+
+    def __init__(self):
+        self.count = 0
+
+    def extend(self, items):
+        self.count += len(items)
@@ -0,0 +1,149 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+PREFIX = "habit_tracker_"
+KEY_PREFIX = "metrics:"
+
+
+class Metric:
+    def __init__(self, name, help_text):
+        self.name = PREFIX + name
+        self.help = help_text
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def keys(self):
+        return [KEY_PREFIX + self.name]
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def bucket_key(self, index):
+        return f"{KEY_PREFIX}{self.name}:bucket:{index}"
+
+    @property
+    def sum_key(self):
+        # кэш умеет incr только целых — сумму храним в микросекундах
+        return f"{KEY_PREFIX}{self.name}:sum_us"
+
+    @property
+    def count_key(self):
+        return f"{KEY_PREFIX}{self.name}:count"
+
+    def keys(self):
+        return [self.bucket_key(i) for i in range(len(self.buckets) + 1)] + [self.sum_key, self.count_key]
+
+
+COUNTERS = {
+    "ticks": CounterMetric("reminder_ticks_total", "Обработанные тики рассылки (по шардам)."),
+    "scanned": CounterMetric("reminder_habits_scanned_total", "Привычки, выбранные в окно напоминания."),
+    "rolled_forward": CounterMetric(
+        "reminder_rolled_forward_total", "Привычки, чьё окно прошло без напоминания и слот перенесён.",
+    ),
+    "skipped": CounterMetric("reminder_skipped_no_chat_total", "Пропущены: у пользователя нет TelegramAccount."),
+    "claimed_elsewhere": CounterMetric(
+        "reminder_claimed_elsewhere_total", "Слот уже захвачен другим воркером или тиком — не отправляли.",
+    ),
+    "sent": CounterMetric("reminder_sent_total", "Доставленные напоминания."),
+    "messages": CounterMetric(
+        "reminder_messages_total", "Сообщения с напоминаниями: дайджест на чат за окно, длинные — частями.",
+    ),
+    "failed": CounterMetric("reminder_failed_total", "Напоминания, которые не удалось доставить."),
+    "retry_queued": CounterMetric("reminder_retry_queued_total", "Напоминания, поставленные в очередь повторов."),
+    "retry_sent": CounterMetric("reminder_retry_sent_total", "Напоминания, доставленные повтором."),
+    "dead_lettered": CounterMetric(
+        "reminder_dead_lettered_total", "Напоминания, ушедшие в недоставленные: устарели, кончились попытки, отклонены.",
+    ),
+    "throttled": CounterMetric("telegram_throttled_total", "Ожидания собственных лимитов отправки."),
+    "retried": CounterMetric("telegram_retried_total", "Повторы после 429 от Telegram."),
+    "dropped": CounterMetric("telegram_dropped_total", "Сообщения, брошенные после лимита повторов 429."),
+    "updates": CounterMetric("telegram_updates_total", "Обновления, полученные через getUpdates."),
+    "linked": CounterMetric("telegram_linked_total", "Чаты, привязанные к пользователям через /start."),
+    "completed_from_chat": CounterMetric("habit_completions_from_chat_total", "Выполнения, отмеченные кнопкой в Telegram."),
+}
+HISTOGRAMS = {
+    "telegram_request": HistogramMetric(
+        "telegram_request_seconds", "Время запроса к Bot API (round trip).",
+        (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    "delivery": HistogramMetric(
+        "reminder_delivery_seconds", "Длительность одного тика рассылки (шарда).",
+        (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60),
+    ),
+}
+
+
+def _incr(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+class MetricsBuffer:
+    """
+    Копит приращения в памяти процесса и сбрасывает их в общий кэш
+    одним проходом (flush). Через Redis метрики складываются между всеми
+    воркерами Celery и процессами API; на locmem видны только свои.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = defaultdict(int)
+
+    def inc(self, name, value=1):
+        if value:
+            with self._lock:
+                self._deltas[COUNTERS[name].keys()[0]] += value
+
+    def observe(self, name, seconds):
+        metric = HISTOGRAMS[name]
+        # в кэше — попадания в свою корзину, накопительные суммы считаются при выводе
+        index = bisect_left(metric.buckets, seconds)
+        with self._lock:
+            self._deltas[metric.bucket_key(index)] += 1
+            self._deltas[metric.sum_key] += round(seconds * 1_000_000)
+            self._deltas[metric.count_key] += 1
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+        for key, delta in deltas.items():
+            _incr(key, delta)
+
+
+buffer = MetricsBuffer()
+inc = buffer.inc
+observe = buffer.observe
+flush = buffer.flush
+
+
+def render_metrics():
+    """Все метрики в текстовом формате Prometheus (exposition 0.0.4)."""
+    metrics = [*COUNTERS.values(), *HISTOGRAMS.values()]
+    values = cache.get_many([key for metric in metrics for key in metric.keys()])
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if metric.kind == "counter":
+            lines.append(f"{metric.name} {values.get(metric.keys()[0], 0)}")
+            continue
+        cumulative = 0
+        for index, bound in enumerate((*map(float, metric.buckets), "+Inf")):
+            cumulative += values.get(metric.bucket_key(index), 0)
+            lines.append(f'{metric.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric.name}_sum {values.get(metric.sum_key, 0) / 1_000_000}")
+        lines.append(f"{metric.name}_count {values.get(metric.count_key, 0)}")
+    return "\n".join(lines) + "\n"
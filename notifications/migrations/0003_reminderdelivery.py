@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_tune_indexes'),
+        ('notifications', '0002_alter_telegramaccount_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_for', models.DateTimeField(verbose_name='Слот напоминания')),
+                ('claim_token', models.CharField(max_length=32, verbose_name='Токен захвата')),
+                ('status', models.CharField(choices=[('claimed', 'Захвачено'), ('sent', 'Отправлено')], default='claimed', max_length=16, verbose_name='Статус')),
+                ('claimed_at', models.DateTimeField(auto_now_add=True, verbose_name='Захвачено')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Доставка напоминания',
+                'verbose_name_plural': 'Доставки напоминаний',
+                'indexes': [models.Index(fields=['claim_token'], name='reminder_delivery_claim_idx'), models.Index(fields=['scheduled_for'], name='reminder_delivery_slot_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'scheduled_for'), name='reminder_delivery_once')],
+            },
+        ),
+    ]
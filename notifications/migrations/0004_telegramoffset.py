@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_reminderdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bot_id', models.CharField(max_length=64, unique=True, verbose_name='Бот')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Следующее обновление')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Offset обновлений Telegram',
+                'verbose_name_plural': 'Offset обновлений Telegram',
+            },
+        ),
+    ]
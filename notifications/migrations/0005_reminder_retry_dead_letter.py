@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0007_habitcompletion_habitstats'),
+        ('notifications', '0004_telegramoffset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_for', models.DateTimeField(verbose_name='Слот напоминания')),
+                ('attempts', models.PositiveSmallIntegerField(verbose_name='Попыток')),
+                ('reason', models.CharField(choices=[('expired', 'Устарело'), ('attempts', 'Кончились попытки'), ('rejected', 'Отклонено Telegram'), ('no_chat', 'Нет чата')], max_length=16, verbose_name='Причина')),
+                ('last_error', models.CharField(blank=True, max_length=255, verbose_name='Последняя ошибка')),
+                ('failed_at', models.DateTimeField(verbose_name='Отброшено')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Недоставленное напоминание',
+                'verbose_name_plural': 'Недоставленные напоминания',
+                'indexes': [models.Index(fields=['failed_at'], name='reminder_dead_letter_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'scheduled_for'), name='reminder_dead_letter_once')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReminderRetry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_for', models.DateTimeField(verbose_name='Слот напоминания')),
+                ('attempts', models.PositiveSmallIntegerField(default=1, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(verbose_name='Следующая попытка')),
+                ('expires_at', models.DateTimeField(verbose_name='Устаревает')),
+                ('last_error', models.CharField(blank=True, max_length=255, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлено')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='retries', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Повтор напоминания',
+                'verbose_name_plural': 'Повторы напоминаний',
+                'indexes': [models.Index(fields=['next_attempt_at'], name='reminder_retry_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'scheduled_for'), name='reminder_retry_once')],
+            },
+        ),
+    ]
@@ -13,3 +13,134 @@ class TelegramAccount(models.Model):
     class Meta:
         verbose_name = "Аккаунт Telegram"
         verbose_name_plural = "Аккаунты Telegram"
+
+
+class ReminderDelivery(models.Model):
+    """
+    Журнал доставки: одна строка на (привычка, слот напоминания).
+
+    Уникальность пары — это и есть захват: воркер вставляет строки для своей
+    порции с insert-or-ignore и шлёт только те, что вставил сам (по claim_token).
+    Поэтому перекрывающиеся тики и параллельные воркеры не дублируют напоминания.
+    """
+
+    CLAIMED = "claimed"
+    SENT = "sent"
+    STATUS_CHOICES = [(CLAIMED, "Захвачено"), (SENT, "Отправлено")]
+
+    habit = models.ForeignKey(
+        "habits.Habit", on_delete=models.CASCADE, related_name="deliveries", verbose_name="Привычка",
+        # habit_id — первая колонка уникального ограничения, отдельный индекс не нужен
+        db_index=False,
+    )
+    scheduled_for = models.DateTimeField(verbose_name="Слот напоминания")
+    claim_token = models.CharField(max_length=32, verbose_name="Токен захвата")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=CLAIMED, verbose_name="Статус")
+    claimed_at = models.DateTimeField(auto_now_add=True, verbose_name="Захвачено")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    def __str__(self):
+        return f"{self.habit_id} @ {self.scheduled_for} ({self.status})"
+
+    class Meta:
+        verbose_name = "Доставка напоминания"
+        verbose_name_plural = "Доставки напоминаний"
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "scheduled_for"], name="reminder_delivery_once"),
+        ]
+        indexes = [
+            # выбор своих захватов и чистка старых строк
+            models.Index(fields=["claim_token"], name="reminder_delivery_claim_idx"),
+            models.Index(fields=["scheduled_for"], name="reminder_delivery_slot_idx"),
+        ]
+
+
+class TelegramOffset(models.Model):
+    """
+    Offset getUpdates: id следующего непрочитанного обновления для бота.
+    Сохраняется в одной транзакции с результатами пачки, поэтому после падения
+    воркер перечитает только необработанное (а повтор обработки безопасен).
+    """
+
+    bot_id = models.CharField(max_length=64, unique=True, verbose_name="Бот")
+    offset = models.BigIntegerField(default=0, verbose_name="Следующее обновление")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    def __str__(self):
+        return f"{self.bot_id}: {self.offset}"
+
+    class Meta:
+        verbose_name = "Offset обновлений Telegram"
+        verbose_name_plural = "Offset обновлений Telegram"
+
+
+class ReminderRetry(models.Model):
+    """
+    Очередь повторов: напоминание, которое не удалось доставить в своё окно.
+    Слот в журнале доставки остаётся захваченным за очередью (ledger.RETRY_TOKEN),
+    поэтому минутная рассылка его не трогает; повторы шлёт отдельная задача
+    с экспоненциальной задержкой. После expires_at или REMINDER_RETRY_MAX_ATTEMPTS
+    попыток запись уходит в ReminderDeadLetter.
+    """
+
+    habit = models.ForeignKey(
+        "habits.Habit", on_delete=models.CASCADE, related_name="retries", verbose_name="Привычка", db_index=False,
+    )
+    scheduled_for = models.DateTimeField(verbose_name="Слот напоминания")
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(verbose_name="Следующая попытка")
+    expires_at = models.DateTimeField(verbose_name="Устаревает")
+    last_error = models.CharField(max_length=255, blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Поставлено")
+
+    def __str__(self):
+        return f"{self.habit_id} @ {self.scheduled_for} (попыток: {self.attempts})"
+
+    class Meta:
+        verbose_name = "Повтор напоминания"
+        verbose_name_plural = "Повторы напоминаний"
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "scheduled_for"], name="reminder_retry_once"),
+        ]
+        indexes = [
+            # выборка созревших повторов
+            models.Index(fields=["next_attempt_at"], name="reminder_retry_due_idx"),
+        ]
+
+
+class ReminderDeadLetter(models.Model):
+    """
+    Напоминание, от которого отказались: устарело, кончились попытки, Telegram
+    отклонил его насовсем (4xx: бот заблокирован, чата нет) или чат отвязан.
+    Из админки их можно переотправить пачкой (retry.replay).
+    """
+
+    EXPIRED = "expired"
+    ATTEMPTS = "attempts"
+    REJECTED = "rejected"
+    NO_CHAT = "no_chat"
+    REASON_CHOICES = [
+        (EXPIRED, "Устарело"), (ATTEMPTS, "Кончились попытки"), (REJECTED, "Отклонено Telegram"), (NO_CHAT, "Нет чата"),
+    ]
+
+    habit = models.ForeignKey(
+        "habits.Habit", on_delete=models.CASCADE, related_name="dead_letters", verbose_name="Привычка", db_index=False,
+    )
+    scheduled_for = models.DateTimeField(verbose_name="Слот напоминания")
+    attempts = models.PositiveSmallIntegerField(verbose_name="Попыток")
+    reason = models.CharField(max_length=16, choices=REASON_CHOICES, verbose_name="Причина")
+    last_error = models.CharField(max_length=255, blank=True, verbose_name="Последняя ошибка")
+    failed_at = models.DateTimeField(verbose_name="Отброшено")
+
+    def __str__(self):
+        return f"{self.habit_id} @ {self.scheduled_for} ({self.reason})"
+
+    class Meta:
+        verbose_name = "Недоставленное напоминание"
+        verbose_name_plural = "Недоставленные напоминания"
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "scheduled_for"], name="reminder_dead_letter_once"),
+        ]
+        indexes = [
+            models.Index(fields=["failed_at"], name="reminder_dead_letter_at_idx"),
+        ]
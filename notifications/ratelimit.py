@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """Классический token bucket: `rate` токенов в секунду, запас до `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now=None) -> float:
+        """Сколько секунд ждать до свободного токена (0 — можно сейчас)."""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now=None):
+        now = self.clock() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def block_until(self, moment):
+        """Telegram прислал 429 — не трогаем этот ключ до `moment`."""
+        self.blocked_until = max(self.blocked_until, moment)
+
+
+class OutboundQueue:
+    """
+    Исходящая очередь с учётом лимитов Telegram.
+
+    Общий bucket держит ~30 сообщений/с на бота, по bucket'у на чат — ~1/с.
+    Сообщение, получившее 429, не теряется: чат блокируется на retry_after,
+    а сообщение встаёт обратно в очередь. retry_after в ответе Telegram — ожидание
+    для всего бота, поэтому на это время замирает и общий bucket. Отбрасываем только после
+    `max_attempts` попыток или если ждать пришлось бы дольше `max_wait`.
+
+    Счётчики в `stats`: sent, failed, throttled (ждали лимит), retried (429),
+    dropped (сдались после 429).
+    """
+
+    def __init__(self, client, global_rate=None, per_chat_rate=None, max_attempts=None, max_wait=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.client = client
+        self.clock = clock
+        self.sleep = sleep
+        self.per_chat_rate = per_chat_rate or settings.TELEGRAM_PER_CHAT_RATE
+        self.max_attempts = max_attempts or settings.TELEGRAM_MAX_ATTEMPTS
+        self.max_wait = max_wait if max_wait is not None else settings.TELEGRAM_MAX_RETRY_WAIT
+        self.global_bucket = TokenBucket(global_rate or settings.TELEGRAM_GLOBAL_RATE, clock=clock)
+        self.chat_buckets = {}
+        self.stats = Counter()
+        self._heap = []
+        self._seq = itertools.count()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1, clock=self.clock)
+        return bucket
+
+    def put(self, message):
+        heapq.heappush(self._heap, (self.clock(), next(self._seq), message, 0))
+
+    def extend(self, messages):
+        for message in messages:
+            self.put(message)
+
+    def _next_wave(self, now):
+        """Забирает из очереди то, что можно отправить прямо сейчас, не нарушая лимитов."""
+        wave = []
+        deferred = []
+        limit = getattr(self.client, "concurrency", 1)
+        while self._heap and self._heap[0][0] <= now and len(wave) < limit:
+            if self.global_bucket.wait_time(now) > 0:
+                self.stats["throttled"] += 1
+                break
+            ready_at, seq, message, attempts = heapq.heappop(self._heap)
+            bucket = self._chat_bucket(message.chat_id)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait > 0:
+                # возвращаем в очередь уже после сборки волны, чтобы не выбрать его снова
+                self.stats["throttled"] += 1
+                deferred.append((now + chat_wait, seq, message, attempts))
+                continue
+            bucket.consume(now)
+            self.global_bucket.consume(now)
+            wave.append((seq, message, attempts))
+        for item in deferred:
+            heapq.heappush(self._heap, item)
+        return wave
+
+    def drain(self):
+        """Отправляет всё, что в очереди; результаты — в порядке постановки."""
+        started = self.clock()
+        results = {}
+
+        while self._heap:
+            wave = self._next_wave(self.clock())
+            if not wave:
+                delay = max(self._heap[0][0], self.clock() + self.global_bucket.wait_time()) - self.clock()
+                self.sleep(max(delay, 0.001))
+                continue
+
+            for (seq, message, attempts), result in zip(wave, self.client.send_many([m for _, m, _ in wave])):
+                if result.status != 429:
+                    self.stats["sent" if result.ok else "failed"] += 1
+                    results[seq] = result
+                    continue
+
+                retry_at = self.clock() + (result.retry_after or 1)
+                self._chat_bucket(message.chat_id).block_until(retry_at)
+                if result.retry_after:
+                    # flood wait на бота: другие чаты тоже ждут, иначе ловим новые 429
+                    self.global_bucket.block_until(retry_at)
+                if attempts + 1 >= self.max_attempts or retry_at - started > self.max_wait:
+                    self.stats["dropped"] += 1
+                    results[seq] = result
+                else:
+                    self.stats["retried"] += 1
+                    heapq.heappush(self._heap, (retry_at, seq, message, attempts + 1))
+
+        return [results[seq] for seq in sorted(results)]
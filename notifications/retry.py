@@ -0,0 +1,237 @@
+import random
+from collections import Counter
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from habits.models import Habit
+from habits.schedule import compute_next_due
+from notifications import ledger, metrics
+from notifications.digest import DigestBuilder
+from notifications.models import ReminderDeadLetter, ReminderRetry
+from notifications.ratelimit import OutboundQueue
+from notifications.utils import get_client
+
+# Сколько созревших повторов берём за заход
+RETRY_BATCH = 500
+# На время отправки повтор отодвигается, чтобы его не взял параллельный запуск
+LEASE = timedelta(minutes=5)
+
+RETRY_FIELDS = (
+    "id", "habit_id", "scheduled_for", "attempts", "expires_at",
+    "habit__action", "habit__place", "habit__time", "habit__created_at", "habit__periodicity",
+    "habit__last_reminded_at", "habit__user__telegram__chat_id",
+)
+
+
+def backoff(attempts, rng=random):
+    """
+    Задержка перед следующей попыткой после `attempts` неудачных:
+    REMINDER_RETRY_BASE_DELAY·2^(attempts-1), не больше REMINDER_RETRY_MAX_DELAY.
+    Половина задержки — случайная, чтобы сбой не возвращался одной волной.
+    """
+    delay = min(settings.REMINDER_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), settings.REMINDER_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay / 2 + rng.uniform(0, delay / 2))
+
+
+def is_retryable(result):
+    """Сеть, таймаут, 5xx и 429 — временные; остальные 4xx повтор не исправит."""
+    return result.status is None or result.status == 429 or result.status >= 500
+
+
+def describe(result):
+    return (result.error or f"HTTP {result.status}")[:255]
+
+
+def enqueue(failures, now):
+    """
+    Ставит в очередь неудачи минутной рассылки: failures — (habit_id, слот, результат).
+    Временные ошибки ждут повтора, окончательные сразу уходят в недоставленные.
+    Возвращает число поставленных в очередь.
+    """
+    retries, rejected = [], []
+    for habit_id, slot, result in failures:
+        if is_retryable(result):
+            retries.append(ReminderRetry(
+                habit_id=habit_id, scheduled_for=slot, attempts=1, next_attempt_at=now + backoff(1),
+                expires_at=slot + timedelta(seconds=settings.REMINDER_RETRY_MAX_AGE), last_error=describe(result),
+            ))
+        else:
+            rejected.append(ReminderDeadLetter(
+                habit_id=habit_id, scheduled_for=slot, attempts=1,
+                reason=ReminderDeadLetter.REJECTED, last_error=describe(result), failed_at=now,
+            ))
+    ReminderRetry.objects.bulk_create(retries, ignore_conflicts=True)
+    _bury(rejected)
+    metrics.inc("retry_queued", len(retries))
+    return len(retries)
+
+
+def expire(slots, now):
+    """
+    Слоты {habit_id: слот}, которые не успели отправить и до REMINDER_RETRY_MAX_AGE
+    (демон отстал), — сразу в недоставленные. Уже захваченные (отправлены
+    или ждут в очереди) пропускаются. Возвращает число отброшенных.
+    """
+    token, claimed = ledger.claim(slots)
+    if not claimed:
+        return 0
+    # захват — за очередью, как у остальных недоставленных: replay его и ждёт
+    ledger.defer(token, claimed)
+    _bury([
+        ReminderDeadLetter(
+            habit_id=habit_id, scheduled_for=slots[habit_id], attempts=0,
+            reason=ReminderDeadLetter.EXPIRED, failed_at=now,
+        )
+        for habit_id in claimed
+    ])
+    return len(claimed)
+
+
+def _bury(dead):
+    """Пишет недоставленные (upsert по слоту) и убирает их из очереди."""
+    if not dead:
+        return
+    ReminderDeadLetter.objects.bulk_create(
+        dead, update_conflicts=True, unique_fields=["habit", "scheduled_for"],
+        update_fields=["attempts", "reason", "last_error", "failed_at"],
+    )
+    for i in range(0, len(dead), ledger.RELEASE_BATCH // 2):
+        batch = [(d.habit_id, d.scheduled_for) for d in dead[i:i + ledger.RELEASE_BATCH // 2]]
+        ReminderRetry.objects.filter(ledger.slots_q(batch)).delete()
+    metrics.inc("dead_lettered", len(dead))
+
+
+def _lease(now):
+    """
+    Забирает созревшие повторы и отодвигает их на LEASE. Где есть SKIP LOCKED
+    (PostgreSQL), параллельные запуски ещё и не читают чужие строки.
+    """
+    due = ReminderRetry.objects.filter(next_attempt_at__lte=now).order_by("next_attempt_at")
+    locking = connection.features.has_select_for_update_skip_locked
+    if locking:
+        due = due.select_for_update(skip_locked=True, of=("self",))
+    with transaction.atomic() if locking else nullcontext():
+        rows = list(due.values(*RETRY_FIELDS)[:RETRY_BATCH])
+        ReminderRetry.objects.filter(pk__in=[row["id"] for row in rows]).update(next_attempt_at=now + LEASE)
+    return rows
+
+
+def _dead(row, reason, now, result=None):
+    return ReminderDeadLetter(
+        habit_id=row["habit_id"], scheduled_for=row["scheduled_for"],
+        attempts=row["attempts"] + (result is not None), reason=reason,
+        last_error=describe(result) if result is not None else "", failed_at=now,
+    )
+
+
+def process_due(now=None, client=None):
+    """
+    Один проход очереди повторов: созревшие записи отправляются дайджестом
+    на чат, как в минутной рассылке. Удачные — отметка в привычке и в журнале,
+    неудачные — следующая попытка с backoff, устаревшие (expires_at) и исчерпавшие
+    REMINDER_RETRY_MAX_ATTEMPTS — в недоставленные.
+    Возвращает счётчики: sent, failed (будет повтор), dead.
+    """
+    now = now or timezone.now()
+    counts = Counter(sent=0, failed=0, dead=0)
+    queue = OutboundQueue(client or get_client())
+    while True:
+        rows = _lease(now)
+        if not rows:
+            break
+        dead, live = [], {}
+        # сначала свежие слоты: из нескольких слотов одной привычки шлём последний
+        for row in sorted(rows, key=lambda row: row["scheduled_for"], reverse=True):
+            if row["expires_at"] <= now or row["habit_id"] in live:
+                dead.append(_dead(row, ReminderDeadLetter.EXPIRED, now))
+            elif not row["habit__user__telegram__chat_id"]:
+                dead.append(_dead(row, ReminderDeadLetter.NO_CHAT, now))
+            else:
+                live[row["habit_id"]] = row
+
+        digest = DigestBuilder()
+        for habit_id, row in live.items():
+            digest.add(row["habit__user__telegram__chat_id"], habit_id, row["habit__action"], row["habit__place"])
+        queue.extend(digest.messages())
+        results = queue.drain()
+
+        sent, retries = [], []
+        for r in results:
+            for habit_id in r.message.ref:
+                row = live[habit_id]
+                if r.ok:
+                    sent.append(row)
+                elif not is_retryable(r):
+                    dead.append(_dead(row, ReminderDeadLetter.REJECTED, now, r))
+                elif row["attempts"] + 1 >= settings.REMINDER_RETRY_MAX_ATTEMPTS:
+                    dead.append(_dead(row, ReminderDeadLetter.ATTEMPTS, now, r))
+                else:
+                    retries.append(ReminderRetry(
+                        id=row["id"], attempts=row["attempts"] + 1,
+                        next_attempt_at=now + backoff(row["attempts"] + 1), last_error=describe(r),
+                    ))
+
+        with transaction.atomic():
+            _mark_reminded(sent, now)
+            ReminderRetry.objects.filter(pk__in=[row["id"] for row in sent]).delete()
+            ReminderRetry.objects.bulk_update(retries, ["attempts", "next_attempt_at", "last_error"])
+            _bury(dead)
+        counts["sent"] += len(sent)
+        counts["failed"] += len(retries)
+        counts["dead"] += len(dead)
+
+    metrics.inc("retry_sent", counts["sent"])
+    metrics.flush()
+    return dict(counts)
+
+
+def _mark_reminded(rows, now):
+    """Как после обычной отправки: last_reminded_at и следующий слот; журнал — в отправленные."""
+    reminded = []
+    for row in rows:
+        day = timezone.localdate(row["scheduled_for"])
+        # привычке уже напомнили за более поздний слот — расписание не откатываем
+        if row["habit__last_reminded_at"] and row["habit__last_reminded_at"] >= day:
+            continue
+        reminded.append(Habit(
+            id=row["habit_id"], last_reminded_at=day,
+            next_due_at=compute_next_due(
+                row["habit__created_at"], row["habit__time"], row["habit__periodicity"], day, now=now,
+            ),
+            updated_at=now,
+        ))
+    Habit.objects.bulk_update(reminded, ["last_reminded_at", "next_due_at", "updated_at"])
+    ledger.mark_slots_sent([(row["habit_id"], row["scheduled_for"]) for row in rows], now)
+
+
+def replay(dead_letters, now=None):
+    """
+    Возвращает недоставленные в очередь повторов пачкой: попытки считаются
+    заново, срок жизни — REMINDER_RETRY_MAX_AGE от текущего момента.
+    Возвращает число переотправляемых.
+    """
+    now = now or timezone.now()
+    rows = list(dead_letters.values_list("pk", "habit_id", "scheduled_for"))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        ReminderRetry.objects.bulk_create(
+            [
+                ReminderRetry(
+                    habit_id=habit_id, scheduled_for=slot, attempts=0, next_attempt_at=now,
+                    expires_at=now + timedelta(seconds=settings.REMINDER_RETRY_MAX_AGE), last_error="переотправка",
+                )
+                for _, habit_id, slot in rows
+            ],
+            ignore_conflicts=True,
+        )
+        # захват в журнале мог уйти при чистке — возвращаем его очереди
+        ledger.hold((habit_id, slot) for _, habit_id, slot in rows)
+        ReminderDeadLetter.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    metrics.inc("retry_queued", len(rows))
+    metrics.flush()
+    return len(rows)
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from habits.models import Habit
+from habits.signals import deleting_in_bulk, habits_bulk_changed
+from notifications.changes import publish_habit_changes
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def publish_habit_change(sender, instance, **kwargs):
+    # Демон напоминаний подхватит новое расписание без пересканирования;
+    # удалённые пачкой придут одним habits_bulk_changed
+    if not deleting_in_bulk():
+        publish_habit_changes([instance.pk])
+
+
+@receiver(habits_bulk_changed, sender=Habit)
+def publish_bulk_habit_changes(sender, habit_ids, **kwargs):
+    publish_habit_changes(habit_ids)
@@ -1,54 +1,266 @@
-from datetime import timedelta
+import time as time_module
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.functions import Mod
 from django.utils import timezone
-from celery import shared_task
+from celery import chord, group, shared_task
 from habits.models import Habit
-from notifications.utils import send_telegram_message
+from habits.schedule import REMINDER_TOLERANCE, compute_next_due, reminder_window
+from notifications import ledger, metrics, retry
+from notifications.digest import DigestBuilder
+from notifications.ratelimit import OutboundQueue
+from notifications.utils import get_client
 
+# Сколько строк читаем из БД за один заход
+CHUNK_SIZE = 2000
+# Порция для выборки по явному списку id — ниже лимита параметров SQLite
+ID_BATCH = 500
 
-@shared_task
-def send_due_habits():
+# Только те колонки, что нужны для отправки и пересчёта следующего слота
+DUE_FIELDS = ("id", "action", "place", "time", "created_at", "periodicity", "next_due_at", "user__telegram__chat_id")
+SCHEDULE_FIELDS = ("id", "time", "created_at", "periodicity", "last_reminded_at", "next_due_at", "user__telegram__chat_id")
+
+
+def _chunks(qs, fields, ids=None):
     """
-    Отправляет напоминания за текущую минуту с допуском ±1 минута,
-    учитывает периодичность и не шлёт повторно в тот же день.
+    Keyset-пагинация по id: каждая порция — отдельный индексный запрос.
+    Если передан список ids, читаем только их, порциями по первичному ключу.
+    """
+    if ids is not None:
+        ids = sorted(set(ids))
+        for i in range(0, len(ids), ID_BATCH):
+            rows = list(qs.filter(id__in=ids[i:i + ID_BATCH]).order_by("id").values_list(*fields))
+            if rows:
+                yield rows
+        return
+
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).order_by("id").values_list(*fields)[:CHUNK_SIZE])
+        if rows:
+            yield rows
+        # неполная порция — последняя, лишний пустой запрос не нужен
+        if len(rows) < CHUNK_SIZE:
+            return
+        last_id = rows[-1][0]
+
+
+def _shard(qs, shard, shards):
+    """Шард — привычки пользователей с user_id % shards == shard."""
+    if shards <= 1:
+        return qs
+    return qs.alias(shard=Mod("user_id", shards)).filter(shard=shard)
+
+
+def roll_forward_missed(window_start, now, shard=0, shards=1, ids=None, stale=None):
+    """
+    Переносит на следующий слот привычки, чьё окно уже прошло без напоминания
+    (нет chat_id, ошибка отправки, простой beat). Иначе они застрянут в прошлом.
+    В `stale` (словарь), если передан, — {habit_id: пропущенный слот} привычек с чатом.
+    """
+    missed = _shard(Habit.objects.filter(next_due_at__lt=window_start), shard, shards)
+    if ids is None:
+        # Открытый снизу диапазон с ORDER BY id планировщик охотнее читает полным сканом,
+        # поэтому сначала забираем id по индексу next_due_at (их немного), потом — порциями по PK
+        ids = list(missed.order_by().values_list("id", flat=True))
+    moved = 0
+    for rows in _chunks(missed, SCHEDULE_FIELDS, ids):
+        batch = [
+            Habit(
+                id=habit_id,
+                next_due_at=compute_next_due(created_at, time, periodicity, last_reminded_at, now=now),
+                updated_at=now,
+            )
+            for habit_id, time, created_at, periodicity, last_reminded_at, _, _ in rows
+        ]
+        if stale is not None:
+            stale.update((row[0], row[5]) for row in rows if row[6])
+        # updated_at явно: bulk_update не применяет auto_now, а версия списков (ETag) от него зависит
+        Habit.objects.bulk_update(batch, ["next_due_at", "updated_at"])
+        moved += len(batch)
+    return moved
+
+
+def _claimed_chunks(due, ids=None):
+    """
+    Порции строк окна вместе с захватом в журнале доставки: (rows, token, claimed).
+
+    От дублей защищает insert-or-ignore в журнал. Где есть SKIP LOCKED (PostgreSQL),
+    выборка порции и захват идут в одной транзакции, и параллельные воркеры ещё
+    и не читают строки, которые прямо сейчас захватывает другой.
+    """
+    locking = connection.features.has_select_for_update_skip_locked
+    if locking:
+        due = due.select_for_update(skip_locked=True, of=("self",))
+    chunks = _chunks(due, DUE_FIELDS, ids)
+    while True:
+        with transaction.atomic() if locking else nullcontext():
+            rows = next(chunks, None)
+            if rows is None:
+                return
+            token, claimed = ledger.claim({row[0]: row[6] for row in rows if row[7]})
+        yield rows, token, claimed
+
+
+def deliver_due(now, shard=0, shards=1, ids=None):
+    """
+    Отправляет напоминания одного шарда за окно вокруг `now`.
+    `ids` ограничивает выборку заранее известными привычками (демон с колесом);
+    их слоты, оставшиеся позади окна после отставшего тика, тоже отправляются —
+    с опозданием, пока не старше REMINDER_RETRY_MAX_AGE.
+    Возвращает счётчики: sent, skipped (нет chat_id), failed (не доставлено —
+    ушло в очередь повторов или в недоставленные).
     """
-    tz_now = timezone.localtime()
-    today = tz_now.date()
+    started = time_module.perf_counter()
+    today = now.date()
+    window_start, window_end = reminder_window(now)
+    due_from = window_start
+    if ids is not None:
+        # демон снимает с колеса все минуты с прошлого тика: окно ±1 минута их бы не покрыло
+        due_from = min(window_start, now - timedelta(seconds=settings.REMINDER_RETRY_MAX_AGE))
 
-    # Окно: с предыдущей минуты включительно до следующей (не включая)
-    minute_start = tz_now.replace(second=0, microsecond=0)
-    window_start = minute_start - timedelta(minutes=1)
-    window_end = minute_start + timedelta(minutes=1)
+    # слоты с колеса, устаревшие раньше отправки, — в недоставленные, а не молча на следующий период
+    stale = {} if ids is not None else None
+    metrics.inc("rolled_forward", roll_forward_missed(due_from, now, shard, shards, ids, stale))
 
-    qs = Habit.objects.filter(is_pleasant=False).exclude(last_reminded_at=today)
-    sent = 0
+    due = _shard(Habit.objects.filter(next_due_at__gte=due_from, next_due_at__lt=window_end), shard, shards)
+    # Одна очередь на весь тик, чтобы лимиты Telegram считались по всем порциям;
+    # общий лимит бота делим между шардами, которые шлют параллельно
+    queue = OutboundQueue(get_client(), global_rate=settings.TELEGRAM_GLOBAL_RATE / max(shards, 1))
+    counts = Counter(sent=0, skipped=0, failed=retry.expire(stale or {}, now))
 
-    for h in qs.select_related("user"):
-        # Проверка периодичности: раз в N дней от created_at
-        days_passed = (today - h.created_at).days
-        if days_passed % h.periodicity != 0:
-            continue
+    # Сначала захватываем всё окно, потом шлём: привычки одного чата из разных порций
+    # попадают в один дайджест
+    digest = DigestBuilder()
+    schedule = {}
+    slots = {}
+    claims = {}
+    unreachable = []
+    for rows, token, claimed in _claimed_chunks(due, ids):
+        metrics.inc("scanned", len(rows))
+        for habit_id, action, place, time, created_at, periodicity, next_due_at, chat_id in rows:
+            # Есть ли chat_id у пользователя; без него слот сразу переносим на следующий
+            # период — иначе он попадёт и в следующее окно ±1 минута и посчитается дважды
+            if not chat_id:
+                counts["skipped"] += 1
+                unreachable.append(Habit(
+                    id=habit_id,
+                    next_due_at=compute_next_due(created_at, time, periodicity, now=window_end + REMINDER_TOLERANCE),
+                    updated_at=now,
+                ))
+                continue
+            # слот уже взял другой воркер или перекрывшийся тик
+            if habit_id not in claimed:
+                metrics.inc("claimed_elsewhere")
+                continue
+            digest.add(chat_id, habit_id, action, place)
+            schedule[habit_id] = (created_at, time, periodicity)
+            slots[habit_id] = next_due_at
+            claims[habit_id] = token
 
-        # Время привычки на сегодня (aware)
-        scheduled_dt = timezone.make_aware(
-            timezone.datetime.combine(today, h.time),
-            timezone.get_current_timezone(),
+    # Одно сообщение на чат вместо сообщения на привычку; пачка уходит через пул
+    # соединений, очередь сама выдерживает лимиты и переотправляет после 429
+    messages = digest.messages()
+    queue.extend(messages)
+    results = queue.drain()
+    reminded = [
+        Habit(
+            id=habit_id,
+            last_reminded_at=today,
+            next_due_at=compute_next_due(*schedule[habit_id], today, now=now),
+            updated_at=now,
         )
+        for r in results
+        if r.ok
+        for habit_id in r.message.ref
+    ]
+    # неудачные остаются захваченными за очередью повторов (notifications.retry),
+    # остальные — в журнал как отправленные
+    failed = defaultdict(list)
+    failures = []
+    for r in results:
+        if not r.ok:
+            for habit_id in r.message.ref:
+                failed[claims[habit_id]].append(habit_id)
+                failures.append((habit_id, slots[habit_id], r))
+    # итоги отправки — одной транзакцией: после сбоя посередине не останется
+    # захватов, которые ни отправлены, ни стоят в очереди
+    with transaction.atomic():
+        Habit.objects.bulk_update(reminded, ["last_reminded_at", "next_due_at", "updated_at"])
+        Habit.objects.bulk_update(unreachable, ["next_due_at", "updated_at"])
+        for token in dict.fromkeys(claims.values()):
+            ledger.defer(token, failed[token])
+            ledger.mark_sent(token, now)
+        retry.enqueue(failures, now)
+    counts["sent"] += len(reminded)
+    counts["failed"] += len(schedule) - len(reminded)
+    metrics.inc("messages", len(messages))
+
+    for name, value in counts.items():
+        metrics.inc(name, value)
+    for name in ("throttled", "retried", "dropped"):
+        metrics.inc(name, queue.stats[name])
+    metrics.inc("ticks")
+    metrics.observe("delivery", time_module.perf_counter() - started)
+    # одна пачка incr в общий кэш на тик, а не на каждое сообщение
+    metrics.flush()
+    return dict(counts)
+
+
+@shared_task
+def send_due_habits_shard(now, shard, shards):
+    """Воркер: обрабатывает один шард окна, зафиксированного координатором."""
+    return deliver_due(timezone.localtime(datetime.fromisoformat(now)), shard, shards)
+
+
+@shared_task
+def combine_reminder_results(results):
+    """Колбэк chord: складывает счётчики шардов в один результат."""
+    total = Counter(sent=0, skipped=0, failed=0)
+    for counts in results:
+        total.update(counts)
+    return dict(total)
+
 
-        # Попадаем ли в окно
-        if not (window_start <= scheduled_dt < window_end):
-            continue
+# query_budget: запросов на тик с одной порцией (см. habit_tracker.querybudget);
+# выборки, захват в журнале и bulk_update идут пачками, поэтому от числа привычек
+# в порции не зависит; итоги отправки — в транзакции (SAVEPOINT во внешней)
+@shared_task(bind=True, query_budget=8)
+def send_due_habits(self):
+    """
+    Отправляет напоминания за текущую минуту с допуском ±1 минута,
+    учитывает периодичность и не шлёт повторно в тот же день.
+    Периодичность и время уже учтены в next_due_at, поэтому
+    выбираем только строки из окна по индексу.
+
+    При REMINDER_SHARDS > 1 задача только координирует: фиксирует окно
+    и раздаёт шарды воркерам через chord, результат — сумма по шардам.
+    """
+    now = timezone.localtime()
+    shards = settings.REMINDER_SHARDS
+    if shards <= 1:
+        return deliver_due(now)
 
-        # Есть ли chat_id у пользователя
-        tg = getattr(h.user, "telegram", None)
-        chat_id = getattr(tg, "chat_id", None)
-        if not chat_id:
-            continue
+    header = group(send_due_habits_shard.s(now.isoformat(), shard, shards) for shard in range(shards))
+    return self.replace(chord(header, combine_reminder_results.s()))
 
-        # Пытаемся отправить
-        ok = send_telegram_message(chat_id, f"Напоминание: {h.action} в {h.place} — сейчас!")
-        if ok:
-            h.last_reminded_at = today  # ← добавить эту строку
-            h.save(update_fields=["last_reminded_at"])
-            sent += 1
 
-    return sent
+# query_budget: проход с одной пачкой — выборка и продление, итоги пачкой
+# в одной транзакции и пустая выборка в конце; от размера пачки не зависит
+@shared_task(query_budget=8)
+def process_reminder_retries():
+    """
+    Отдельно от минутной рассылки шлёт созревшие повторы неудачных напоминаний,
+    чтобы сбои Telegram не замедляли основной проход по окну.
+    """
+    return retry.process_due(timezone.now())
+
+
+@shared_task
+def prune_reminder_deliveries():
+    """Чистит журнал доставки старше REMINDER_LEDGER_RETENTION_DAYS."""
+    return ledger.prune(timezone.now() - timedelta(days=settings.REMINDER_LEDGER_RETENTION_DAYS))
@@ -0,0 +1,219 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from notifications.utils import DeliveryResult
+
+
+class _BotAPIHandler(BaseHTTPRequestHandler):
+    # keep-alive, иначе клиентский пул соединений не на чем проверить
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело уходят двумя записями: без TCP_NODELAY Nagle и delayed ACK
+    # добавляют ~40 мс к каждому ответу и искажают замеры
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.fake.on_connect()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+
+        prefix = f"/bot{fake.token}/"
+        if not self.path.startswith(prefix):
+            return self._reply(401, {"ok": False, "error_code": 401, "description": "Unauthorized"})
+
+        method = self.path[len(prefix):]
+        handler = getattr(fake, f"handle_{method}", None)
+        if handler is None:
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+        status, data = handler(payload)
+        self._reply(status, data)
+
+    def _reply(self, status, data):
+        raw = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class _BotAPIHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # пул клиента открывает соединения разом; в очереди на 5 лишние ждут повтора SYN (~1 с)
+    request_queue_size = 128
+
+
+class FakeBotAPIServer:
+    """
+    Локальная заглушка Telegram Bot API для тестов.
+
+        with FakeBotAPIServer() as api:
+            client = TelegramClient(token=api.token, base_url=api.base_url)
+            ...
+            api.messages  # [{"chat_id": ..., "text": ...}, ...]
+
+    Входящие для getUpdates — push_message/push_callback, ответы на
+    нажатия — answered.
+
+    Для нагрузочных замеров sendMessage умеет вести себя как настоящий
+    Telegram: отвечать через latency (± jitter) секунд, с долей error_rate
+    отдавать 500, с долей throttle_rate — 429 с retry_after. keep_messages=False
+    не копит тексты, только счётчики.
+    """
+
+    def __init__(self, token="test-token", latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=None, keep_messages=True):
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.keep_messages = keep_messages
+        self._rng = random.Random(seed)
+        self.messages = []
+        self.delivered = 0
+        self.connections = 0
+        self.rejected = 0
+        self.errors = 0
+        # chat_id -> [retry_after, сколько ещё раз ответить 429]
+        self._throttled = {}
+        # входящие обновления для getUpdates и ответы на нажатия кнопок
+        self.updates = []
+        self.answered = []
+        self.get_updates_calls = 0
+        self._next_update_id = 1
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._httpd = _BotAPIHTTPServer(("127.0.0.1", 0), _BotAPIHandler)
+        self._httpd.fake = self
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def on_connect(self):
+        with self._lock:
+            self.connections += 1
+
+    def inject_429(self, chat_id, retry_after=1, times=1):
+        """Следующие `times` отправок в этот чат получат 429 Too Many Requests."""
+        self._throttled[str(chat_id)] = [retry_after, times]
+
+    def _too_many_requests(self, retry_after):
+        self.rejected += 1
+        return 429, {
+            "ok": False, "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }
+
+    def handle_sendMessage(self, payload):
+        with self._lock:
+            delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+            roll = self._rng.random()
+        # задержка — в потоке соединения, параллельные запросы ждут одновременно
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            throttle = self._throttled.get(str(payload.get("chat_id")))
+            if throttle and throttle[1] > 0:
+                throttle[1] -= 1
+                return self._too_many_requests(throttle[0])
+            if roll < self.error_rate:
+                self.errors += 1
+                return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+            if roll < self.error_rate + self.throttle_rate:
+                return self._too_many_requests(self.retry_after)
+            self.delivered += 1
+            message_id = self.delivered
+            if self.keep_messages:
+                self.messages.append(payload)
+        return 200, {"ok": True, "result": {"message_id": message_id, "chat": {"id": payload.get("chat_id")}}}
+
+    def push_update(self, **update):
+        """Кладёт обновление в очередь getUpdates; update_id назначается по порядку."""
+        with self._lock:
+            update = {"update_id": self._next_update_id, **update}
+            self._next_update_id += 1
+            self.updates.append(update)
+            self._updates_ready.notify_all()
+        return update
+
+    def push_message(self, chat_id, text):
+        return self.push_update(message={
+            "message_id": self._next_update_id, "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"}, "text": text,
+        })
+
+    def push_callback(self, chat_id, data, date=None):
+        """Нажатие inline-кнопки под сообщением бота от date (unix-время, по умолчанию — сейчас)."""
+        return self.push_update(callback_query={
+            "id": f"cb{self._next_update_id}", "from": {"id": int(chat_id)}, "data": data,
+            "message": {"message_id": 1, "date": date or int(time.time()), "chat": {"id": int(chat_id), "type": "private"}},
+        })
+
+    def handle_getUpdates(self, payload):
+        offset = int(payload.get("offset") or 0)
+        limit = int(payload.get("limit") or 100)
+        deadline = time.monotonic() + float(payload.get("timeout") or 0)
+        with self._updates_ready:
+            self.get_updates_calls += 1
+            # как Telegram: offset подтверждает всё, что раньше него
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.monotonic() < deadline and not self._stopping:
+                self._updates_ready.wait(deadline - time.monotonic())
+            result = self.updates[:limit]
+        return 200, {"ok": True, "result": result}
+
+    def handle_answerCallbackQuery(self, payload):
+        with self._lock:
+            self.answered.append(payload)
+        return 200, {"ok": True, "result": True}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._updates_ready:
+            self._stopping = True
+            self._updates_ready.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubClient:
+    """Клиент-заглушка: всё «доставлено», сообщения копятся в sent."""
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.sent = []
+
+    def send_many(self, messages):
+        messages = list(messages)
+        self.sent.extend(messages)
+        return [DeliveryResult(m, ok=self.ok, status=200 if self.ok else 500) for m in messages]
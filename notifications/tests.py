@@ -0,0 +1,896 @@
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from unittest.mock import Mock, PropertyMock, patch
+
+from celery.backends.cache import CacheBackend
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from habit_tracker.celery import app as celery_app
+from habits.models import Habit, HabitCompletion
+from notifications import ledger, metrics, retry
+from notifications.daemon import ReminderDaemon
+from notifications.digest import MAX_MESSAGE_LENGTH, DigestBuilder
+from notifications.ingest import ALREADY_DONE_TEXT, BAD_LINK_TEXT, DONE_TEXT, LINKED_TEXT, UNKNOWN_HABIT_TEXT, UpdateIngestor
+from notifications.linking import make_link_token, read_link_token
+from notifications.models import ReminderDeadLetter, ReminderDelivery, ReminderRetry, TelegramAccount, TelegramOffset
+from notifications.ratelimit import OutboundQueue, TokenBucket
+from notifications.tasks import deliver_due, prune_reminder_deliveries, send_due_habits
+from notifications.testing import FakeBotAPIServer, StubClient
+from notifications.utils import DeliveryResult, OutgoingMessage, TelegramClient
+from notifications.wheel import TimingWheel
+
+User = get_user_model()
+
+
+def moment(hour, minute, second=30, day=None):
+    """Aware-момент в текущей таймзоне; по умолчанию — сегодня (как auto_now_add)."""
+    return timezone.make_aware(datetime.combine(day or timezone.localdate(), time(hour, minute, second)))
+
+
+class TestSendDueHabits(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tg", password="pass")
+        TelegramAccount.objects.create(user=self.user, chat_id="100")
+
+    def _habit(self, at, **extra):
+        data = dict(
+            user=self.user, place="дом", time=at, action="вода",
+            is_pleasant=False, periodicity=1, execution_time=30, reward="чай",
+        )
+        data.update(extra)
+        return Habit.objects.create(**data)
+
+    def _run(self, now, client=None):
+        client = client or StubClient()
+        with patch("django.utils.timezone.now", return_value=now), \
+                patch("notifications.tasks.get_client", return_value=client):
+            sent = send_due_habits()["sent"]
+        return sent, client
+
+    def test_next_due_computed_on_create_and_update(self):
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            h = self._habit(time(8, 0))
+            self.assertEqual(h.next_due_at, moment(8, 0, 0))
+
+            # время уже прошло — слот переезжает на следующий период
+            h.time = time(6, 0)
+            h.periodicity = 3
+            h.save()
+        self.assertEqual(h.next_due_at, moment(6, 0, 0, day=timezone.localdate() + timedelta(days=3)))
+
+    def test_pleasant_habit_has_no_schedule(self):
+        h = self._habit(time(8, 0), is_pleasant=True, reward=None)
+        self.assertIsNone(h.next_due_at)
+
+    def test_sends_only_due_window(self):
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            due = self._habit(time(8, 0))
+            self._habit(time(9, 0), action="позже")
+
+        sent, client = self._run(moment(8, 0))
+        self.assertEqual(sent, 1)
+        self.assertEqual(
+            [(m.chat_id, m.text) for m in client.sent],
+            [("100", "Напоминание: вода в дом — сейчас!")],
+        )
+
+        due.refresh_from_db()
+        self.assertEqual(due.last_reminded_at, timezone.localdate())
+        self.assertEqual(due.next_due_at, moment(8, 0, 0, day=timezone.localdate() + timedelta(days=1)))
+
+        # повторный тик в той же минуте ничего не шлёт
+        sent, client = self._run(moment(8, 0, 50))
+        self.assertEqual(sent, 0)
+        self.assertEqual(client.sent, [])
+
+    def test_failed_send_is_not_marked(self):
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            h = self._habit(time(8, 0))
+
+        sent, _ = self._run(moment(8, 0), StubClient(ok=False))
+        self.assertEqual(sent, 0)
+        h.refresh_from_db()
+        self.assertIsNone(h.last_reminded_at)
+
+        # повтор — дело очереди повторов, минутная рассылка слот больше не шлёт
+        self.assertEqual(self._run(moment(8, 1))[0], 0)
+        self.assertEqual(retry.process_due(moment(8, 1), StubClient())["sent"], 1)
+        h.refresh_from_db()
+        self.assertEqual(h.last_reminded_at, timezone.localdate())
+        self.assertEqual(h.next_due_at, moment(8, 0, 0, day=timezone.localdate() + timedelta(days=1)))
+
+    def test_missed_window_rolls_forward(self):
+        other = User.objects.create_user(username="nochat", password="pass")
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            h = self._habit(time(8, 0), user=other)
+
+        # без chat_id не шлём, слот сразу переезжает на завтра
+        with patch("django.utils.timezone.now", return_value=moment(8, 0)):
+            self.assertEqual(send_due_habits()["skipped"], 1)
+        # следующее окно ±1 минута ещё покрывает 8:00, но пропуск уже посчитан
+        with patch("django.utils.timezone.now", return_value=moment(8, 1)):
+            self.assertEqual(send_due_habits()["skipped"], 0)
+        self._run(moment(8, 5))
+        h.refresh_from_db()
+        self.assertIsNone(h.last_reminded_at)
+        self.assertEqual(h.next_due_at, moment(8, 0, 0, day=timezone.localdate() + timedelta(days=1)))
+
+
+class TestShardedDelivery(TestCase):
+    def setUp(self):
+        # chord даже в eager-режиме хранит результаты — держим их в памяти, а не в Redis
+        backend = CacheBackend(app=celery_app, backend="memory")
+        self.enterContext(patch.object(type(celery_app), "backend", new_callable=PropertyMock, return_value=backend))
+
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            for i in range(12):
+                user = User.objects.create(username=f"s{i}")
+                if i % 4:  # у каждого четвёртого нет Telegram
+                    TelegramAccount.objects.create(user=user, chat_id=str(1000 + i))
+                for minute in (0, 1, 30):
+                    Habit.objects.create(
+                        user=user, place="дом", time=time(8, minute), action=f"h{i}-{minute}",
+                        periodicity=1, execution_time=30, reward="чай",
+                    )
+
+    def _run(self, shards):
+        """Прогоняет тик и откатывает изменения, чтобы сравнить оба пути на одних данных."""
+        client = StubClient()
+        with transaction.atomic(), override_settings(REMINDER_SHARDS=shards), \
+                patch("django.utils.timezone.now", return_value=moment(8, 1)), \
+                patch("notifications.tasks.get_client", return_value=client):
+            result = send_due_habits.apply().get()
+            reminded = set(Habit.objects.filter(last_reminded_at=timezone.localdate()).values_list("id", flat=True))
+            transaction.set_rollback(True)
+        return result, reminded, sorted(m.ref for m in client.sent)
+
+    def test_sharded_result_matches_single_task(self):
+        single = self._run(shards=1)
+        sharded = self._run(shards=4)
+
+        self.assertEqual(single[0], {"sent": 18, "skipped": 6, "failed": 0})
+        self.assertEqual(sharded, single)
+
+
+class TestReminderDigest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="digest")
+        TelegramAccount.objects.create(user=self.user, chat_id="700")
+        other = User.objects.create(username="digest-2")
+        TelegramAccount.objects.create(user=other, chat_id="701")
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            self.habits = [
+                Habit.objects.create(
+                    user=self.user, place="дом", time=time(8, i % 2), action=f"d{i}",
+                    periodicity=1, execution_time=30, reward="чай",
+                )
+                for i in range(6)
+            ]
+            self.single = Habit.objects.create(
+                user=other, place="парк", time=time(8, 0), action="бег",
+                periodicity=1, execution_time=30, reward="чай",
+            )
+
+    def _deliver(self, client):
+        with patch("notifications.tasks.get_client", return_value=client):
+            return deliver_due(moment(8, 1))
+
+    def test_one_message_per_chat(self):
+        client = StubClient()
+        # привычки одного чата в разных порциях выборки — всё равно один дайджест
+        with patch("notifications.tasks.CHUNK_SIZE", 2):
+            counts = self._deliver(client)
+
+        self.assertEqual(counts, {"sent": 7, "skipped": 0, "failed": 0})
+        self.assertEqual(len(client.sent), 2)
+        digest = next(m for m in client.sent if m.chat_id == "700")
+        self.assertEqual(sorted(digest.ref), [h.id for h in self.habits])
+        self.assertEqual(digest.text.splitlines()[0], "Напоминания — сейчас:")
+        self.assertEqual(len(digest.payload()["reply_markup"]["inline_keyboard"]), 6)
+        self.assertEqual(Habit.objects.filter(last_reminded_at=timezone.localdate()).count(), 7)
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 7)
+
+    @override_settings(REMINDER_DIGEST_MAX_HABITS=4)
+    def test_long_digest_is_split(self):
+        client = StubClient()
+        self.assertEqual(self._deliver(client)["sent"], 7)
+        parts = [m for m in client.sent if m.chat_id == "700"]
+        self.assertEqual([len(m.ref) for m in parts], [4, 2])
+        self.assertEqual([m.text.splitlines()[0] for m in parts], ["Напоминания — сейчас (1/2):", "Напоминания — сейчас (2/2):"])
+
+    def test_message_length_limit(self):
+        builder = DigestBuilder(max_habits=100)
+        for i in range(40):
+            builder.add("1", i, "а" * 255, "б" * 255)
+        messages = builder.messages()
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(m.text) <= MAX_MESSAGE_LENGTH for m in messages))
+        self.assertEqual([i for m in messages for i in m.ref], list(range(40)))
+
+    def test_failed_digest_queues_all_its_habits(self):
+        self.assertEqual(self._deliver(StubClient(ok=False)), {"sent": 0, "skipped": 0, "failed": 7})
+        self.assertEqual(ReminderRetry.objects.count(), 7)
+        self.assertEqual(ReminderDelivery.objects.filter(claim_token=ledger.RETRY_TOKEN).count(), 7)
+        self.assertFalse(Habit.objects.filter(last_reminded_at__isnull=False).exists())
+
+
+class OverlappingClient(StubClient):
+    """Пока «шлёт» свою пачку, запускает второй воркер на то же окно."""
+
+    def __init__(self, now):
+        super().__init__()
+        self.now = now
+        self.rival = StubClient()
+        self.rival_counts = None
+
+    def send_many(self, messages):
+        if self.rival_counts is None:
+            with patch("notifications.tasks.get_client", return_value=self.rival):
+                self.rival_counts = deliver_due(self.now)
+        return super().send_many(messages)
+
+
+class TestDeliveryLedger(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.flush()
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            for i in range(3):
+                user = User.objects.create(username=f"l{i}")
+                TelegramAccount.objects.create(user=user, chat_id=str(500 + i))
+                Habit.objects.create(
+                    user=user, place="дом", time=time(8, 0), action=f"l{i}",
+                    periodicity=1, execution_time=30, reward="чай",
+                )
+
+    def test_overlapping_workers_send_once(self):
+        # второй воркер читает те же строки (next_due_at ещё не сдвинут), но слоты уже захвачены
+        client = OverlappingClient(moment(8, 0))
+        with patch("notifications.tasks.get_client", return_value=client):
+            counts = deliver_due(moment(8, 0))
+
+        self.assertEqual(counts["sent"], 3)
+        self.assertEqual(client.rival_counts["sent"], 0)
+        self.assertEqual(client.rival.sent, [])
+        self.assertEqual(len({m.ref for m in client.sent}), 3)
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 3)
+        metrics.flush()
+        self.assertIn("habit_tracker_reminder_claimed_elsewhere_total 3", metrics.render_metrics())
+
+    def test_failed_send_is_deferred_to_retries(self):
+        with patch("notifications.tasks.get_client", return_value=StubClient(ok=False)):
+            self.assertEqual(deliver_due(moment(8, 0))["failed"], 3)
+        self.assertEqual(ReminderDelivery.objects.filter(claim_token=ledger.RETRY_TOKEN).count(), 3)
+
+        client = StubClient()
+        with patch("notifications.tasks.get_client", return_value=client):
+            self.assertEqual(deliver_due(moment(8, 1))["sent"], 0)
+        self.assertEqual(client.sent, [])
+        self.assertEqual(retry.process_due(moment(8, 2), client), {"sent": 3, "failed": 0, "dead": 0})
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 3)
+        self.assertFalse(ReminderRetry.objects.exists())
+
+    def test_claim_is_idempotent(self):
+        habit = Habit.objects.first()
+        token, claimed = ledger.claim({habit.id: habit.next_due_at})
+        self.assertEqual(claimed, {habit.id})
+        self.assertEqual(ledger.claim({habit.id: habit.next_due_at})[1], set())
+        # следующий слот той же привычки — отдельная запись
+        self.assertEqual(ledger.claim({habit.id: habit.next_due_at + timedelta(days=1)})[1], {habit.id})
+
+    def test_prune(self):
+        with patch("notifications.tasks.get_client", return_value=StubClient()):
+            deliver_due(moment(8, 0))
+        with patch("django.utils.timezone.now", return_value=moment(8, 0) + timedelta(days=7, minutes=1)):
+            self.assertEqual(prune_reminder_deliveries(), 3)
+        self.assertFalse(ReminderDelivery.objects.exists())
+
+
+# Настоящие потоки со своими соединениями. На SQLite (тестовая база — файл)
+# проверяется захват insert-or-ignore, на PostgreSQL — ещё и SKIP LOCKED
+class TestConcurrentWorkers(TransactionTestCase):
+    WORKERS = 4
+
+    def setUp(self):
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            for i in range(30):
+                user = User.objects.create(username=f"c{i}")
+                TelegramAccount.objects.create(user=user, chat_id=str(700 + i))
+                Habit.objects.create(
+                    user=user, place="дом", time=time(8, 0), action="вода",
+                    periodicity=1, execution_time=30, reward="чай",
+                )
+
+    def test_parallel_workers_deliver_each_slot_once(self):
+        client = StubClient()
+        start = threading.Barrier(self.WORKERS)
+        results, errors = [], []
+
+        def worker():
+            try:
+                start.wait()
+                results.append(deliver_due(moment(8, 0)))
+            except Exception as exc:  # noqa: BLE001 — ошибку потока покажет assert ниже
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        with patch("notifications.tasks.get_client", return_value=client), \
+                override_settings(TELEGRAM_GLOBAL_RATE=1e9):
+            threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(counts["sent"] for counts in results), 30)
+        refs = [habit_id for message in client.sent for habit_id in message.ref]
+        self.assertEqual(len(refs), 30)
+        self.assertEqual(len(set(refs)), 30)
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 30)
+
+
+class TestReminderRetries(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.flush()
+        user = User.objects.create(username="retry")
+        TelegramAccount.objects.create(user=user, chat_id="900")
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            self.habit = Habit.objects.create(
+                user=user, place="дом", time=time(8, 0), action="вода",
+                periodicity=1, execution_time=30, reward="чай",
+            )
+        with patch("notifications.tasks.get_client", return_value=StubClient(ok=False)):
+            deliver_due(moment(8, 0))
+        self.retry = ReminderRetry.objects.get()
+
+    def test_backoff_grows_with_jitter_and_cap(self):
+        for attempts, delay in ((1, 30), (2, 60), (3, 120), (10, 900)):
+            low = retry.backoff(attempts, rng=Mock(uniform=lambda a, b: a))
+            high = retry.backoff(attempts, rng=Mock(uniform=lambda a, b: b))
+            self.assertEqual((low.total_seconds(), high.total_seconds()), (delay / 2, delay))
+        self.assertLessEqual(self.retry.next_attempt_at, moment(8, 0) + timedelta(seconds=30))
+        self.assertEqual(self.retry.expires_at, moment(8, 0, 0) + timedelta(hours=1))
+
+    def test_not_due_yet(self):
+        client = StubClient()
+        self.assertEqual(retry.process_due(moment(8, 0), client), {"sent": 0, "failed": 0, "dead": 0})
+        self.assertEqual(client.sent, [])
+
+    @override_settings(REMINDER_RETRY_MAX_ATTEMPTS=3)
+    def test_attempts_exhausted_go_to_dead_letters(self):
+        now = moment(8, 1)
+        self.assertEqual(retry.process_due(now, StubClient(ok=False)), {"sent": 0, "failed": 1, "dead": 0})
+        self.retry.refresh_from_db()
+        self.assertEqual((self.retry.attempts, self.retry.last_error), (2, "HTTP 500"))
+        self.assertGreater(self.retry.next_attempt_at, now)
+
+        self.assertEqual(retry.process_due(now + timedelta(minutes=2), StubClient(ok=False))["dead"], 1)
+        dead = ReminderDeadLetter.objects.get()
+        self.assertEqual((dead.reason, dead.attempts), (ReminderDeadLetter.ATTEMPTS, 3))
+        self.assertFalse(ReminderRetry.objects.exists())
+
+    def test_stale_reminder_is_not_sent(self):
+        client = StubClient()
+        self.assertEqual(retry.process_due(moment(9, 0, 0), client)["dead"], 1)
+        self.assertEqual(client.sent, [])
+        self.assertEqual(ReminderDeadLetter.objects.get().reason, ReminderDeadLetter.EXPIRED)
+
+    def test_permanent_error_skips_queue(self):
+        self.retry.delete()
+        # бот заблокирован пользователем
+        rejected = Mock(spec=["send_many"])
+        rejected.send_many = lambda messages: [DeliveryResult(m, ok=False, status=403) for m in messages]
+        with patch("notifications.tasks.get_client", return_value=rejected):
+            deliver_due(moment(8, 0, day=timezone.localdate() + timedelta(days=1)))
+        self.assertFalse(ReminderRetry.objects.exists())
+        self.assertEqual(ReminderDeadLetter.objects.get().reason, ReminderDeadLetter.REJECTED)
+
+    def test_bulk_replay(self):
+        retry.process_due(moment(9, 0, 0), StubClient())
+        ReminderDelivery.objects.all().delete()
+        now = moment(10, 0)
+        self.assertEqual(retry.replay(ReminderDeadLetter.objects.all(), now), 1)
+        self.assertFalse(ReminderDeadLetter.objects.exists())
+
+        client = StubClient()
+        self.assertEqual(retry.process_due(now, client)["sent"], 1)
+        self.assertEqual([m.ref for m in client.sent], [(self.habit.id,)])
+        self.assertEqual(ReminderDelivery.objects.get().status, ReminderDelivery.SENT)
+        metrics.flush()
+        rendered = metrics.render_metrics()
+        self.assertIn("habit_tracker_reminder_retry_sent_total 1", rendered)
+        self.assertIn("habit_tracker_reminder_dead_lettered_total 1", rendered)
+
+
+class TestTimingWheel(TestCase):
+    def test_add_move_pop(self):
+        wheel = TimingWheel()
+        wheel.add(1, 480)
+        wheel.add(2, 480)
+        wheel.add(1, 481)  # перенос
+        self.assertEqual(len(wheel), 2)
+        self.assertEqual(list(wheel.pop(480)), [2])
+        self.assertEqual(list(wheel.pop(480)), [])
+        wheel.discard(1)
+        self.assertEqual(list(wheel.pop(481)), [])
+        self.assertEqual(len(wheel), 0)
+
+
+class TestReminderDaemon(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="daemon")
+        TelegramAccount.objects.create(user=self.user, chat_id="555")
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            self.first = self._habit(time(8, 0), "первая")
+            self.second = self._habit(time(8, 5), "вторая")
+
+    def _habit(self, at, action):
+        return Habit.objects.create(
+            user=self.user, place="дом", time=at, action=action,
+            periodicity=1, execution_time=30, reward="чай",
+        )
+
+    def _tick(self, daemon, now, client):
+        with patch("django.utils.timezone.now", return_value=now), \
+                patch("notifications.tasks.get_client", return_value=client):
+            return daemon.tick()
+
+    def test_fires_slots_and_follows_changes(self):
+        daemon = ReminderDaemon()
+        client = StubClient()
+        self._tick(daemon, moment(7, 59), client)
+        self.assertEqual(len(daemon.wheel), 2)
+
+        self.assertEqual(self._tick(daemon, moment(8, 0), client)["sent"], 1)
+        self.assertEqual([m.ref for m in client.sent], [(self.first.id,)])
+
+        # пустой слот — ни одного запроса к БД
+        with self.assertNumQueries(0):
+            self._tick(daemon, moment(8, 2), client)
+
+        # изменение через API приходит по ленте, без пересканирования
+        with patch("django.utils.timezone.now", return_value=moment(8, 2)):
+            self.second.time = time(8, 3)
+            self.second.save()
+        self.assertEqual(self._tick(daemon, moment(8, 3), client)["sent"], 1)
+        self.assertEqual([m.ref for m in client.sent], [(self.first.id,), (self.second.id,)])
+
+        with self.assertNumQueries(0):
+            self._tick(daemon, moment(8, 5), client)
+
+    def test_lagging_tick_sends_missed_minutes(self):
+        daemon = ReminderDaemon()
+        client = StubClient()
+        self._tick(daemon, moment(7, 59), client)
+        # тик опоздал на несколько минут: слоты 8:00 и 8:05 позади окна ±1 минута
+        counts = self._tick(daemon, moment(8, 9), client)
+        self.assertEqual(counts, {"sent": 2, "skipped": 0, "failed": 0})
+        self.assertEqual(sorted(m.ref for m in client.sent), [(self.first.id, self.second.id)])
+        for habit in (self.first, self.second):
+            habit.refresh_from_db()
+            self.assertEqual(habit.last_reminded_at, timezone.localdate())
+            self.assertEqual(timezone.localdate(habit.next_due_at), timezone.localdate() + timedelta(days=1))
+
+    def test_tick_lagging_past_max_age_dead_letters(self):
+        daemon = ReminderDaemon()
+        client = StubClient()
+        self._tick(daemon, moment(7, 59), client)
+        counts = self._tick(daemon, moment(9, 10), client)
+        self.assertEqual(counts, {"sent": 0, "skipped": 0, "failed": 2})
+        self.assertEqual(client.sent, [])
+        self.assertEqual(
+            sorted(ReminderDeadLetter.objects.values_list("habit_id", "reason")),
+            [(self.first.id, ReminderDeadLetter.EXPIRED), (self.second.id, ReminderDeadLetter.EXPIRED)],
+        )
+        # переотправка из админки доходит
+        retry.replay(ReminderDeadLetter.objects.all(), moment(9, 11))
+        self.assertEqual(retry.process_due(moment(9, 11), client)["sent"], 2)
+
+    def test_warns_about_process_local_change_feed(self):
+        with self.assertLogs("notifications.daemon", "WARNING"):
+            self.assertFalse(ReminderDaemon.check_change_feed())
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://"}}):
+            self.assertTrue(ReminderDaemon.check_change_feed())
+
+    def test_lost_changes_trigger_reload(self):
+        daemon = ReminderDaemon()
+        client = StubClient()
+        self._tick(daemon, moment(7, 59), client)
+
+        with patch("django.utils.timezone.now", return_value=moment(7, 59)):
+            self.second.time = time(8, 0)
+            self.second.save()
+        cache.delete_many([f"habit-changes:{seq}" for seq in range(1, 100)])
+
+        self.assertEqual(self._tick(daemon, moment(8, 0), client)["sent"], 2)
+
+
+class TestTelegramClient(TestCase):
+    def test_send_many_reuses_pooled_connections(self):
+        with FakeBotAPIServer() as api:
+            client = TelegramClient(token=api.token, base_url=api.base_url, concurrency=4)
+            messages = [OutgoingMessage(str(i), f"msg {i}", ref=i) for i in range(20)]
+            results = client.send_many(messages)
+            client.close()
+
+        self.assertEqual([r.message.ref for r in results], list(range(20)))
+        self.assertTrue(all(r.ok and r.status == 200 for r in results))
+        self.assertEqual(sorted(m["text"] for m in api.messages), sorted(m.text for m in messages))
+        self.assertLessEqual(api.connections, 4)
+
+    def test_errors_are_reported_per_message(self):
+        with FakeBotAPIServer() as api:
+            client = TelegramClient(token="wrong", base_url=api.base_url)
+            result = client.send(OutgoingMessage("1", "hi"))
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status, 401)
+
+        # сервер недоступен — не исключение, а неуспешный результат
+        client = TelegramClient(token="t", base_url=api.base_url, timeout=1)
+        result = client.send(OutgoingMessage("1", "hi"))
+        self.assertFalse(result.ok)
+        self.assertTrue(result.error)
+
+
+class TestFakeBotAPIServer(TestCase):
+    def test_latency_and_failure_injection(self):
+        with FakeBotAPIServer(latency=0.05) as api:
+            client = TelegramClient(token=api.token, base_url=api.base_url)
+            started = time_module.perf_counter()
+            self.assertTrue(client.send(OutgoingMessage("1", "hi")).ok)
+            self.assertGreaterEqual(time_module.perf_counter() - started, 0.05)
+
+            api.latency, api.error_rate = 0, 1
+            self.assertEqual(client.send(OutgoingMessage("1", "hi")).status, 500)
+            api.error_rate, api.throttle_rate, api.retry_after = 0, 1, 3
+            result = client.send(OutgoingMessage("1", "hi"))
+            client.close()
+        self.assertEqual((result.status, result.retry_after), (429, 3))
+        self.assertEqual((api.delivered, api.errors, api.rejected), (1, 1, 1))
+
+    def test_rates_are_reproducible(self):
+        def statuses():
+            with FakeBotAPIServer(error_rate=0.3, throttle_rate=0.2, seed=7, keep_messages=False) as api:
+                client = TelegramClient(token=api.token, base_url=api.base_url)
+                result = [client.send(OutgoingMessage("1", "hi")).status for _ in range(40)]
+                client.close()
+            self.assertEqual(api.messages, [])
+            self.assertEqual(api.delivered, result.count(200))
+            return result
+
+        first = statuses()
+        self.assertEqual(first, statuses())
+        self.assertEqual(set(first), {200, 429, 500})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ScriptedClient:
+    """Отвечает по сценарию: chat_id -> список статусов; дальше — 200."""
+
+    concurrency = 8
+
+    def __init__(self, clock, script=None):
+        self.clock = clock
+        self.script = {k: list(v) for k, v in (script or {}).items()}
+        self.calls = []
+
+    def send_many(self, messages):
+        results = []
+        for m in messages:
+            self.calls.append((self.clock(), m.chat_id))
+            status = (self.script.get(m.chat_id) or [200]).pop(0) if self.script.get(m.chat_id) else 200
+            results.append(DeliveryResult(m, ok=status == 200, status=status, retry_after=2 if status == 429 else None))
+        return results
+
+
+class TestOutboundQueue(TestCase):
+    def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, capacity=2, clock=clock)
+        bucket.consume()
+        bucket.consume()
+        self.assertAlmostEqual(bucket.wait_time(), 0.5)
+        clock.sleep(0.5)
+        self.assertEqual(bucket.wait_time(), 0)
+
+    def test_global_and_per_chat_limits(self):
+        clock = FakeClock()
+        client = ScriptedClient(clock)
+        queue = OutboundQueue(client, global_rate=10, per_chat_rate=1, clock=clock, sleep=clock.sleep)
+        queue.extend(OutgoingMessage(str(i % 20), "x", ref=i) for i in range(40))
+        queue.extend(OutgoingMessage("same", "x", ref=i) for i in range(3))
+        results = queue.drain()
+
+        self.assertEqual([r.message.ref for r in results], list(range(40)) + [0, 1, 2])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(queue.stats["sent"], 43)
+        self.assertGreater(queue.stats["throttled"], 0)
+
+        # не больше ~10/с в целом (запас bucket'а — 10) и 1/с в один чат
+        for t0, _ in client.calls:
+            in_second = [c for c in client.calls if t0 <= c[0] < t0 + 1]
+            self.assertLessEqual(len(in_second), 20)
+        same = [t for t, chat in client.calls if chat == "same"]
+        self.assertTrue(all(b - a >= 1 - 1e-9 for a, b in zip(same, same[1:])))
+
+    def test_429_is_requeued_then_dropped(self):
+        clock = FakeClock()
+        client = ScriptedClient(clock, {"a": [429, 200], "b": [429, 429, 429]})
+        queue = OutboundQueue(client, global_rate=30, per_chat_rate=1, max_attempts=3, max_wait=60,
+                              clock=clock, sleep=clock.sleep)
+        queue.extend([OutgoingMessage("a", "x"), OutgoingMessage("b", "x")])
+        a, b = queue.drain()
+
+        self.assertTrue(a.ok)
+        self.assertFalse(b.ok)
+        self.assertEqual(b.status, 429)
+        self.assertEqual(queue.stats["retried"], 3)
+        self.assertEqual(queue.stats["dropped"], 1)
+        # повтор в чат "a" — не раньше, чем через retry_after
+        retry = [t for t, chat in client.calls if chat == "a"]
+        self.assertGreaterEqual(retry[1] - retry[0], 2)
+
+    def test_429_pauses_other_chats(self):
+        clock = FakeClock()
+        client = ScriptedClient(clock, {"a": [429, 200]})
+        # по одному сообщению за волну: остальные чаты ещё в очереди, когда приходит 429
+        client.concurrency = 1
+        queue = OutboundQueue(client, global_rate=30, per_chat_rate=1, max_wait=60, clock=clock, sleep=clock.sleep)
+        queue.put(OutgoingMessage("a", "x"))
+        queue.extend(OutgoingMessage(str(i), "x") for i in range(3))
+        results = queue.drain()
+
+        self.assertTrue(all(r.ok for r in results))
+        # первый ответ — 429 с retry_after=2: до конца ожидания не шлём ни в один чат
+        self.assertEqual(client.calls[0], (0, "a"))
+        self.assertEqual(len(client.calls), 5)
+        self.assertTrue(all(t >= 2 for t, _ in client.calls[1:]))
+
+    def test_retry_after_from_fake_server(self):
+        with FakeBotAPIServer() as api:
+            api.inject_429("7", retry_after=0.2)
+            client = TelegramClient(token=api.token, base_url=api.base_url)
+            queue = OutboundQueue(client)
+            queue.put(OutgoingMessage("7", "hi"))
+            [result] = queue.drain()
+            client.close()
+
+        self.assertTrue(result.ok)
+        self.assertEqual(api.rejected, 1)
+        self.assertEqual(len(api.messages), 1)
+        self.assertEqual(queue.stats["retried"], 1)
+
+
+class TestUpdateIngestion(TestCase):
+    def setUp(self):
+        self.api = FakeBotAPIServer(token="42:secret").start()
+        self.client_api = TelegramClient(token=self.api.token, base_url=self.api.base_url)
+        self.ingestor = UpdateIngestor(client=self.client_api, poll_timeout=0)
+        self.user = User.objects.create_user(username="ingest", password="pass")
+        self.habit = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="вода",
+            periodicity=1, execution_time=30, reward="чай",
+        )
+
+    def tearDown(self):
+        self.client_api.close()
+        self.api.stop()
+
+    def _link(self, chat_id, user=None):
+        self.api.push_message(chat_id, f"/start {make_link_token(user or self.user)}")
+
+    def test_link_token(self):
+        token = make_link_token(self.user)
+        self.assertLessEqual(len(token), 64)
+        self.assertRegex(token, r"^[A-Za-z0-9_-]+$")
+        self.assertEqual(read_link_token(token), self.user.pk)
+        self.assertIsNone(read_link_token(token[:-1] + ("A" if token[-1] != "A" else "B")))
+        self.assertIsNone(read_link_token("garbage"))
+        with override_settings(TELEGRAM_LINK_MAX_AGE=-1):
+            self.assertIsNone(read_link_token(token))
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with override_settings(TELEGRAM_BOT_USERNAME="habits_bot"):
+            data = client.get("/api/notifications/link/").json()
+        self.assertEqual(read_link_token(data["token"]), self.user.pk)
+        self.assertEqual(data["url"], f"https://t.me/habits_bot?start={data['token']}")
+
+    def test_start_links_chat_and_persists_offset(self):
+        self._link(100)
+        self.api.push_message(200, "/start broken-token")
+        self.api.push_message(300, "привет")
+
+        self.assertEqual(self.ingestor.poll_once(), {"updates": 3, "linked": 1, "completed": 0})
+        self.assertEqual(TelegramAccount.objects.get(user=self.user).chat_id, "100")
+        self.assertEqual(
+            sorted((m["chat_id"], m["text"]) for m in self.api.messages),
+            [("100", LINKED_TEXT), ("200", BAD_LINK_TEXT)],
+        )
+        self.assertEqual(TelegramOffset.objects.get(bot_id="42").offset, 4)
+
+        # новый процесс продолжает с сохранённого offset
+        ingestor = UpdateIngestor(client=self.client_api, poll_timeout=0)
+        self.assertEqual(ingestor.poll_once()["updates"], 0)
+        self.assertEqual(ingestor.offset, 4)
+
+    def test_relinking_in_one_batch(self):
+        other = User.objects.create_user(username="ingest-2")
+        TelegramAccount.objects.create(user=other, chat_id="100")
+        # чат 100 переходит к self.user, other привязывает новый чат
+        self._link(100)
+        self._link(500, user=other)
+        self._link(600)
+
+        self.assertEqual(self.ingestor.poll_once()["linked"], 2)
+        self.assertEqual(
+            dict(TelegramAccount.objects.values_list("user__username", "chat_id")),
+            {"ingest": "600", "ingest-2": "500"},
+        )
+
+    def test_done_callbacks(self):
+        TelegramAccount.objects.create(user=self.user, chat_id="100")
+        foreign = Habit.objects.create(
+            user=User.objects.create_user(username="stranger"), place="дом", time=time(9, 0),
+            action="бег", periodicity=1, execution_time=60, reward="сок",
+        )
+        Habit.objects.filter(pk=self.habit.pk).update(created_at=timezone.localdate() - timedelta(days=5))
+        yesterday = int((timezone.now() - timedelta(days=1)).timestamp())
+        first = self.api.push_callback(100, f"done:{self.habit.pk}")
+        again = self.api.push_callback(100, f"done:{self.habit.pk}")
+        late = self.api.push_callback(100, f"done:{self.habit.pk}", date=yesterday)
+        stranger = self.api.push_callback(100, f"done:{foreign.pk}")
+
+        self.assertEqual(self.ingestor.poll_once()["completed"], 2)
+        self.assertEqual(
+            sorted(HabitCompletion.objects.filter(habit=self.habit).values_list("completed_on", flat=True)),
+            [timezone.localdate() - timedelta(days=1), timezone.localdate()],
+        )
+        self.habit.refresh_from_db()
+        self.assertEqual((self.habit.stats.current_streak, self.habit.stats.total_completions), (2, 2))
+        answers = {a["callback_query_id"]: a["text"] for a in self.api.answered}
+        self.assertEqual(answers[first["callback_query"]["id"]], DONE_TEXT)
+        self.assertEqual(answers[again["callback_query"]["id"]], DONE_TEXT)
+        self.assertEqual(answers[late["callback_query"]["id"]], DONE_TEXT)
+        self.assertEqual(answers[stranger["callback_query"]["id"]], UNKNOWN_HABIT_TEXT)
+        self.assertFalse(HabitCompletion.objects.filter(habit=foreign).exists())
+
+        # повторное нажатие в следующей пачке
+        repeat = self.api.push_callback(100, f"done:{self.habit.pk}")
+        self.assertEqual(self.ingestor.poll_once()["completed"], 0)
+        self.assertEqual(self.api.answered[-1], {"callback_query_id": repeat["callback_query"]["id"], "text": ALREADY_DONE_TEXT})
+
+    def test_replayed_batch_is_idempotent(self):
+        TelegramAccount.objects.create(user=self.user, chat_id="100")
+        self._link(100)
+        self.api.push_callback(100, f"done:{self.habit.pk}")
+        updates = self.client_api.get_updates(0)
+        self.ingestor.apply(updates)
+        # падение до подтверждения offset в Telegram: та же пачка ещё раз
+        self.assertEqual(self.ingestor.apply(updates), {"updates": 2, "linked": 1, "completed": 0})
+        self.assertEqual(HabitCompletion.objects.count(), 1)
+        self.assertEqual(TelegramAccount.objects.count(), 1)
+
+    def test_batch_queries_do_not_grow_with_updates(self):
+        def run(n):
+            users = [User.objects.create_user(username=f"bulk-{n}-{i}") for i in range(n)]
+            habits = Habit.objects.bulk_create(
+                Habit(user=u, place="дом", time=time(8, 0), action="вода", periodicity=1, execution_time=30, reward="чай")
+                for u in users
+            )
+            TelegramAccount.objects.bulk_create(TelegramAccount(user=u, chat_id=f"{n}{i}") for i, u in enumerate(users))
+            updates = [
+                {"update_id": i, "callback_query": {
+                    "id": f"{n}-{i}", "data": f"done:{h.pk}",
+                    "message": {"date": int(timezone.now().timestamp()), "chat": {"id": int(f"{n}{i}")}},
+                }}
+                for i, h in enumerate(habits)
+            ]
+            newcomers = [User.objects.create_user(username=f"new-{n}-{i}") for i in range(n)]
+            updates += [
+                {"update_id": n + i, "message": {"chat": {"id": int(f"9{n}{i}")}, "text": f"/start {make_link_token(u)}"}}
+                for i, u in enumerate(newcomers)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                counts = self.ingestor.apply(updates)
+            self.assertEqual((counts["completed"], counts["linked"]), (n, n))
+            return len(queries)
+
+        # первая пачка ещё читает и создаёт offset
+        run(1)
+        self.assertEqual(run(3), run(30))
+
+    def test_reminder_has_done_button(self):
+        TelegramAccount.objects.create(user=self.user, chat_id="100")
+        client = StubClient()
+        with patch("notifications.tasks.get_client", return_value=client):
+            deliver_due(self.habit.next_due_at)
+        self.assertEqual(client.sent[0].payload()["reply_markup"], {
+            "inline_keyboard": [[{"text": "Выполнено", "callback_data": f"done:{self.habit.pk}"}]],
+        })
+
+
+class TestMetrics(TestCase):
+    URL = "/api/notifications/metrics/"
+
+    def setUp(self):
+        # буфер общий на процесс — сбрасываем то, что накопили другие тесты
+        metrics.flush()
+        cache.clear()
+
+    def _scrape(self, **headers):
+        r = self.client.get(self.URL, **headers)
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r["Content-Type"].startswith("text/plain; version=0.0.4"))
+        values = {}
+        for line in r.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                values[name] = float(value)
+        return values
+
+    def test_delivery_counters(self):
+        with_chat = User.objects.create(username="m1")
+        TelegramAccount.objects.create(user=with_chat, chat_id="1")
+        without_chat = User.objects.create(username="m2")
+        with patch("django.utils.timezone.now", return_value=moment(7, 0)):
+            for user in (with_chat, with_chat, without_chat):
+                Habit.objects.create(
+                    user=user, place="дом", time=time(8, 0), action="вода",
+                    periodicity=1, execution_time=30, reward="чай",
+                )
+        client = StubClient()
+        with patch("django.utils.timezone.now", return_value=moment(8, 0)), \
+                patch("notifications.tasks.get_client", return_value=client):
+            send_due_habits()
+
+        values = self._scrape()
+        self.assertEqual(values["habit_tracker_reminder_ticks_total"], 1)
+        self.assertEqual(values["habit_tracker_reminder_habits_scanned_total"], 3)
+        self.assertEqual(values["habit_tracker_reminder_skipped_no_chat_total"], 1)
+        self.assertEqual(values["habit_tracker_reminder_sent_total"], 2)
+        self.assertEqual(values["habit_tracker_reminder_failed_total"], 0)
+        self.assertEqual(values["habit_tracker_reminder_delivery_seconds_count"], 1)
+        self.assertEqual(values['habit_tracker_reminder_delivery_seconds_bucket{le="+Inf"}'], 1)
+
+    def test_telegram_latency_histogram(self):
+        with FakeBotAPIServer() as api:
+            client = TelegramClient(token=api.token, base_url=api.base_url, concurrency=2)
+            client.send_many([OutgoingMessage(str(i), "hi") for i in range(3)])
+            client.close()
+        metrics.flush()
+
+        values = self._scrape()
+        self.assertEqual(values["habit_tracker_telegram_request_seconds_count"], 3)
+        buckets = [v for k, v in values.items() if k.startswith("habit_tracker_telegram_request_seconds_bucket")]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 3)
+        self.assertGreater(values["habit_tracker_telegram_request_seconds_sum"], 0)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+        self.assertEqual(self.client.get(self.URL, HTTP_AUTHORIZATION="Bearer nope").status_code, 401)
+        self.assertIn("habit_tracker_reminder_sent_total", self._scrape(HTTP_AUTHORIZATION="Bearer s3cret"))
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import SetChatIdView
+from .views import SetChatIdView, TelegramLinkView, metrics_view
 
 urlpatterns = [
     path("chat-id/", SetChatIdView.as_view(), name="set-chat-id"),
+    path("link/", TelegramLinkView.as_view(), name="telegram-link"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
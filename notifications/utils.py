@@ -1,18 +1,180 @@
-import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from notifications import metrics
+
+
+@dataclass(frozen=True)
+class OutgoingMessage:
+    chat_id: str
+    text: str
+    # Чем сообщение связано с нашими данными (например, id привычки)
+    ref: object = None
+    # Inline-кнопки, по одной в ряд: ((текст, callback_data), ...)
+    buttons: tuple = ()
+
+    def payload(self):
+        data = {"chat_id": self.chat_id, "text": self.text}
+        if self.buttons:
+            data["reply_markup"] = {
+                "inline_keyboard": [[{"text": text, "callback_data": callback}] for text, callback in self.buttons],
+            }
+        return data
+
+
+@dataclass
+class DeliveryResult:
+    message: OutgoingMessage
+    ok: bool
+    status: int | None = None
+    error: str = ""
+    # Для 429: сколько секунд Telegram просит подождать
+    retry_after: float | None = None
+
+
+class TelegramAPIError(Exception):
+    def __init__(self, description, status=None, retry_after=None):
+        super().__init__(description)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """
+    Клиент Bot API с постоянным пулом соединений.
+
+    Один requests.Session на процесс: TLS-рукопожатие делается один раз
+    на соединение, а не на каждое сообщение. Пачки сообщений уходят
+    параллельно в пуле потоков, не больше `concurrency` одновременно.
+    """
+
+    def __init__(self, token=None, base_url=None, timeout=None, concurrency=None):
+        self.token = token if token is not None else settings.TELEGRAM_BOT_TOKEN
+        self.base_url = (base_url or settings.TELEGRAM_API_URL).rstrip("/")
+        self.timeout = timeout or settings.TELEGRAM_TIMEOUT
+        self.concurrency = concurrency or settings.TELEGRAM_CONCURRENCY
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = None
+
+    def method_url(self, method: str) -> str:
+        return f"{self.base_url}/bot{self.token}/{method}"
 
+    def send(self, message: OutgoingMessage) -> DeliveryResult:
+        if not self.token:
+            return DeliveryResult(message, ok=False, error="TELEGRAM_BOT_TOKEN не задан")
+        started = time.perf_counter()
+        try:
+            resp = self.session.post(
+                self.method_url("sendMessage"),
+                json=message.payload(),
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            return DeliveryResult(message, ok=False, error=str(exc))
+        finally:
+            metrics.observe("telegram_request", time.perf_counter() - started)
+        retry_after = None
+        if resp.status_code == 429:
+            retry_after = _retry_after(resp)
+        return DeliveryResult(message, ok=resp.status_code == 200, status=resp.status_code, retry_after=retry_after)
 
-TELEGRAM_BOT_TOKEN = settings.TELEGRAM_BOT_TOKEN
+    def call(self, method: str, payload: dict, timeout: float | None = None):
+        """
+        Произвольный метод Bot API: result из ответа или исключение
+        (requests.RequestException, TelegramAPIError с кодом и retry_after).
+        """
+        if not self.token:
+            raise TelegramAPIError("TELEGRAM_BOT_TOKEN не задан")
+        started = time.perf_counter()
+        try:
+            resp = self.session.post(self.method_url(method), json=payload, timeout=timeout or self.timeout)
+        finally:
+            metrics.observe("telegram_request", time.perf_counter() - started)
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code != 200 or not data.get("ok"):
+            raise TelegramAPIError(
+                data.get("description") or f"HTTP {resp.status_code}", status=resp.status_code,
+                retry_after=_retry_after(resp) if resp.status_code == 429 else None,
+            )
+        return data.get("result")
+
+    def get_updates(self, offset: int, timeout: int = 0, limit: int = 100, allowed_updates=None) -> list[dict]:
+        """
+        Пачка обновлений начиная с offset. timeout > 0 — long polling: Telegram
+        держит запрос, пока не появятся обновления, поэтому HTTP-таймаут больше.
+        """
+        payload = {"offset": offset, "timeout": timeout, "limit": limit}
+        if allowed_updates is not None:
+            payload["allowed_updates"] = list(allowed_updates)
+        return self.call("getUpdates", payload, timeout=timeout + self.timeout)
+
+    def call_many(self, method: str, payloads) -> list:
+        """call для пачки запросов параллельно; ошибки — в списке результатов вместо исключений."""
+        def safe_call(payload):
+            try:
+                return self.call(method, payload)
+            except (requests.RequestException, TelegramAPIError) as exc:
+                return exc
+        return list(self._pool().map(safe_call, payloads))
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="telegram")
+        return self._executor
+
+    def send_many(self, messages) -> list[DeliveryResult]:
+        """Отправляет пачку параллельно; результаты в том же порядке, что и сообщения."""
+        messages = list(messages)
+        if len(messages) <= 1:
+            return [self.send(m) for m in messages]
+        return list(self._pool().map(self.send, messages))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+
+def _retry_after(resp):
+    """retry_after из тела ответа 429 (parameters.retry_after) или заголовка Retry-After."""
+    try:
+        value = (resp.json().get("parameters") or {}).get("retry_after")
+    except (ValueError, AttributeError):
+        value = None
+    if value is None:
+        value = resp.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+_client = None
+
+
+def get_client() -> TelegramClient:
+    """Общий на процесс клиент (и пул соединений)."""
+    global _client
+    if _client is None:
+        _client = TelegramClient()
+    return _client
 
 
 def send_telegram_message(chat_id: str, text: str) -> bool:
     """Простая отправка сообщения через Telegram Bot API."""
-    if not TELEGRAM_BOT_TOKEN:
-        return False
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    try:
-        resp = requests.post(url, json={"chat_id": chat_id, "text": text})
-        return resp.status_code == 200
-    except Exception:
-        return False
+    result = get_client().send(OutgoingMessage(chat_id, text))
+    metrics.flush()
+    return result.ok
@@ -1,7 +1,13 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema   # ← добавили
+from .linking import link_url, make_link_token
+from .metrics import render_metrics
 from .models import TelegramAccount
 from .serializers import TelegramAccountSerializer
 
@@ -22,3 +28,30 @@ class SetChatIdView(APIView):
             user=request.user, defaults={"chat_id": chat_id}
         )
         return Response({"detail": "chat_id сохранён"}, status=status.HTTP_200_OK)
+
+
+class TelegramLinkView(APIView):
+    """
+    Ссылка для привязки чата: пользователь открывает её и жмёт Start,
+    воркер приёма обновлений (runner.py --ingest) сохраняет chat_id сам.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(responses={200: "token и url (https://t.me/<бот>?start=<token>)"})
+    def get(self, request):
+        token = make_link_token(request.user)
+        return Response({"token": token, "url": link_url(token)})
+
+
+def metrics_view(request):
+    """
+    Метрики рассылки в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, нужен заголовок Authorization: Bearer <токен>.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,45 @@
+from array import array
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class TimingWheel:
+    """
+    Колесо на сутки: слот — минута дня, в слоте — id привычек.
+
+    Хранит только числа в array('q') (8 байт на привычку) и индекс
+    id -> слот для переноса/удаления, без ORM-объектов в памяти.
+    """
+
+    def __init__(self):
+        self.slots = [array("q") for _ in range(MINUTES_PER_DAY)]
+        self._slot_of = {}
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, habit_id):
+        return habit_id in self._slot_of
+
+    def add(self, habit_id, minute):
+        self.discard(habit_id)
+        self.slots[minute].append(habit_id)
+        self._slot_of[habit_id] = minute
+
+    def discard(self, habit_id):
+        minute = self._slot_of.pop(habit_id, None)
+        if minute is not None:
+            self.slots[minute].remove(habit_id)
+
+    def pop(self, minute):
+        """Забирает все id слота (слот срабатывает один раз)."""
+        ids = self.slots[minute]
+        self.slots[minute] = array("q")
+        for habit_id in ids:
+            self._slot_of.pop(habit_id, None)
+        return ids
+
+    def clear(self):
+        for minute in range(MINUTES_PER_DAY):
+            self.slots[minute] = array("q")
+        self._slot_of.clear()
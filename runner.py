@@ -1,10 +1,23 @@
 # runner.py
+import argparse
+import logging
 import os
 import sys
 from dotenv import load_dotenv
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Рассылка напоминаний о привычках")
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="работать постоянно: расписание дня в колесе по минутам вместо опроса БД каждую минуту",
+    )
+    parser.add_argument(
+        "--ingest", action="store_true",
+        help="принимать обновления бота (getUpdates): привязка чата через /start и отметки выполнения кнопкой",
+    )
+    args = parser.parse_args(argv)
+
     # чтобы .env подхватился при ручном запуске
     load_dotenv()
 
@@ -13,9 +26,22 @@ def main():
     import django
     django.setup()
 
+    if args.ingest:
+        from notifications.ingest import UpdateIngestor
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        UpdateIngestor().run_forever()
+        return
+
+    if args.daemon:
+        from notifications.daemon import ReminderDaemon
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        ReminderDaemon().run_forever()
+        return
+
     from notifications.tasks import send_due_habits
-    sent = send_due_habits()
-    print(f"sent={sent}")
+    # apply() выполняет задачу на месте, в том числе с шардами (chord)
+    result = send_due_habits.apply().get()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
 
 
 if __name__ == "__main__":
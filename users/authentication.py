@@ -0,0 +1,166 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Пользователи по id в памяти процесса: LRU на AUTH_USER_CACHE_SIZE записей,
+    каждая живёт AUTH_USER_CACHE_TTL секунд. Запись помнит версию, с которой
+    её положили: другая версия читает пользователя из БД заново.
+    Аутентификация передаёт версией токен и поколение пользователя в общем
+    кэше (user_generation): сигналы User (users/signals.py) двигают поколение,
+    и записи устаревают во всех процессах сразу. queryset.update() сигналов
+    не шлёт — после него нужен bump_user_generation().
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, version):
+        if settings.AUTH_USER_CACHE_TTL <= 0 or settings.AUTH_USER_CACHE_SIZE <= 0:
+            return None
+        # в токене id бывает строкой, в сигналах — pk
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+        # копия: правки request.user в одном запросе не попадают в другие
+        return copy.copy(entry[2])
+
+    def set(self, user_id, version, user):
+        ttl, size = settings.AUTH_USER_CACHE_TTL, settings.AUTH_USER_CACHE_SIZE
+        if ttl <= 0 or size <= 0:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + ttl, copy.copy(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = UserCache()
+
+
+def _generation_key(user_id):
+    return f"auth-user:generation:{user_id}"
+
+
+def user_generation(user_id):
+    """Поколение пользователя в общем кэше (Redis): одно на все процессы."""
+    return cache.get(_generation_key(user_id))
+
+
+async def auser_generation(user_id):
+    return await cache.aget(_generation_key(user_id))
+
+
+def bump_user_generation(user_id):
+    """Записи user_cache этого пользователя устаревают во всех процессах."""
+    key = _generation_key(user_id)
+    # начинаем с метки времени: если ключ вытеснили, старые записи не совпадут
+    cache.add(key, time.time_ns() // 1000, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # ключ вытеснили между add и incr
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+
+
+def token_version(validated_token):
+    # хэш пароля в токене (CHECK_REVOKE_TOKEN): после смены пароля у новых токенов другая версия
+    return validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+
+
+def token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as exc:
+        raise InvalidToken(_("Token contained no recognizable user identification")) from exc
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication без запроса к БД на каждый вызов API: пользователь
+    берётся из user_cache по id, версии токена и поколению пользователя
+    (одно чтение общего кэша). Проверки активности и смены пароля
+    выполняются и для пользователя из кэша.
+    """
+
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        version = (token_version(validated_token), user_generation(user_id))
+        user = user_cache.get(user_id, version)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, version, user)
+        else:
+            self.check_user(user, validated_token)
+        return user
+
+    def check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    CachedJWTAuthentication для async-view (обычный HttpRequest вместо DRF Request).
+    Разбор и проверка подписи — те же; при промахе кэша пользователь читается async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        version = (token_version(validated_token), await auser_generation(user_id))
+        user = user_cache.get(user_id, version)
+        if user is None:
+            user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+            if user is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            self.check_user(user, validated_token)
+            user_cache.set(user_id, version, user)
+        else:
+            self.check_user(user, validated_token)
+        return user
@@ -0,0 +1,66 @@
+from datetime import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habit_tracker.benchmarking import format_row, isolated_database, measure
+from habit_tracker.querybudget import QueryBudget
+from habits.models import Habit
+from users.authentication import CachedJWTAuthentication, user_cache
+
+
+class Command(BaseCommand):
+    help = "JWT-аутентификация с кэшем пользователей и без: запросы к БД и время (на временной БД)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Сколько пользователей опрашивают API по кругу")
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        requests = options["requests"]
+        with isolated_database():
+            users = get_user_model().objects.bulk_create(
+                get_user_model()(username=f"bench-auth-{i}") for i in range(max(options["users"], 1))
+            )
+            habits = Habit.objects.bulk_create(
+                Habit(
+                    user=user, place="дом", time=time(8, 0), action="зарядка",
+                    periodicity=1, execution_time=60, reward="чай",
+                )
+                for user in users
+            )
+            tokens = [f"Bearer {AccessToken.for_user(user)}" for user in users]
+            factory = APIRequestFactory()
+            auth_requests = [factory.get("/", HTTP_AUTHORIZATION=token) for token in tokens]
+            client = APIClient()
+
+            def authenticate(auth):
+                return lambda i: auth.authenticate(auth_requests[i % len(auth_requests)])
+
+            def get(i):
+                n = i % len(habits)
+                response = client.get(f"/api/habits/{habits[n].pk}/", HTTP_AUTHORIZATION=tokens[n])
+                assert response.status_code == 200, response.status_code
+
+            runs = [
+                ("authenticate", "JWT", authenticate(JWTAuthentication()), {}),
+                ("authenticate", "с кэшем", authenticate(CachedJWTAuthentication()), {}),
+                ("GET detail", "без кэша", get, {"AUTH_USER_CACHE_TTL": 0}),
+                ("GET detail", "с кэшем", get, {}),
+            ]
+            for name, label, fn, overrides in runs:
+                user_cache.clear()
+                with override_settings(**overrides):
+                    # прогрев: в установившемся режиме все пользователи уже в кэше
+                    for i in range(len(users)):
+                        fn(i)
+                    with QueryBudget(None) as queries:
+                        result = measure(fn, requests)
+                self.stdout.write(
+                    f"{format_row(f'{name} {label}', result)}  SQL/запр. {queries.count / requests:.2f}"
+                )
+            self.stdout.write(f"кэш: попаданий {user_cache.hits}, промахов {user_cache.misses}")
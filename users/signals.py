@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import bump_user_generation, user_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # деактивация, смена пароля, удаление — следующий запрос прочитает пользователя из БД,
+    # в других процессах тоже: их записи помнят прежнее поколение
+    bump_user_generation(instance.pk)
+    user_cache.invalidate(instance.pk)
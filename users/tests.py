@@ -0,0 +1,110 @@
+from datetime import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from habits.models import Habit
+from users.authentication import AsyncJWTAuthentication, CachedJWTAuthentication, UserCache, user_cache
+
+User = get_user_model()
+
+
+# ===== Кэш пользователей JWT-аутентификации =====
+class TestCachedJWTAuthentication(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username="cached", password="pass")
+        self.token = AccessToken.for_user(self.user)
+        self.request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate(self.request)[0]
+
+    def test_user_read_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user, self.user)
+        # каждому запросу — своя копия
+        user.first_name = "changed"
+        self.assertEqual(self.authenticate().first_name, "")
+
+    def test_api_request_without_user_query(self):
+        habit = Habit.objects.create(
+            user=self.user, place="дом", time=time(8, 0), action="зарядка",
+            periodicity=1, execution_time=60, reward="чай",
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(client.get(f"/api/habits/{habit.pk}/").status_code, 200)
+        with self.assertNumQueries(1):
+            # только строка привычки
+            self.assertEqual(client.get(f"/api/habits/{habit.pk}/").status_code, 200)
+
+    def test_deactivation_and_password_change_invalidate(self):
+        self.authenticate()
+        self.user.set_password("new-pass")
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+        response = APIClient().get("/api/habits/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(response.status_code, 401)
+
+        self.user.delete()
+        response = APIClient().get("/api/habits/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_process_sees_invalidation(self):
+        # кэш другого процесса: сигналы этого процесса его не трогают, общий кэш — один
+        other = UserCache()
+        with patch("users.authentication.user_cache", other):
+            self.authenticate()
+            with self.assertNumQueries(0):
+                self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+        with patch("users.authentication.user_cache", other):
+            with self.assertNumQueries(1), self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_token_version_mismatch_reloads(self):
+        user_cache.set(self.user.pk, "old", self.user)
+        self.assertIsNone(user_cache.get(self.user.pk, "new"))
+        self.assertIsNotNone(user_cache.get(str(self.user.pk), "old"))
+
+    @override_settings(AUTH_USER_CACHE_SIZE=2)
+    def test_lru_bound(self):
+        users = [User.objects.create_user(username=f"lru{i}") for i in range(3)]
+        user_cache.set(users[0].pk, None, users[0])
+        user_cache.set(users[1].pk, None, users[1])
+        user_cache.get(users[0].pk, None)
+        user_cache.set(users[2].pk, None, users[2])
+        self.assertEqual(len(user_cache), 2)
+        # вытеснен давно не читанный
+        self.assertIsNone(user_cache.get(users[1].pk, None))
+        self.assertIsNotNone(user_cache.get(users[0].pk, None))
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_disabled(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    async def test_async_authentication_uses_cache(self):
+        auth = AsyncJWTAuthentication()
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        user, _ = await auth.aauthenticate(request)
+        self.assertEqual(user.pk, self.user.pk)
+        hits = user_cache.hits
+        user, _ = await auth.aauthenticate(request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user_cache.hits, hits + 1)